@@ -1,26 +1,2279 @@
 from http.server import BaseHTTPRequestHandler
 import json
+import urllib.parse
+import base64
+import heapq
+import re
 import sqlite3
 import os
 import urllib.request
+import urllib.error
 import tempfile
+import threading
+import time
+import weakref
+import email.utils
+import zlib
+from array import array
+from itertools import accumulate, islice
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from contextlib import contextmanager
+
+try:
+    import apsw  # optional: only needed for SEARCH_DATABASE_MODE=remote
+except ImportError:
+    apsw = None
+
+try:
+    import brotli  # optional: enables Content-Encoding: br
+except ImportError:
+    brotli = None
+
+# Dropbox direct download URL
+DATABASE_URL = os.environ.get(
+    'SEARCH_DATABASE_URL',
+    'https://www.dropbox.com/scl/fi/jrns72qaqx1xu79yq3ndj/youtube_search_complete_all.db?rlkey=9jg1jmc4obzbtyc3ofn8yf2od&st=ijyc2fsc&dl=1'
+)
+
+# Local copy of the database, kept between warm invocations
+DATABASE_PATH = os.environ.get(
+    'SEARCH_DATABASE_PATH',
+    os.path.join(tempfile.gettempdir(), 'youtube_search_complete_all.db')
+)
+
+# Database written by database_reorganizer.py, searched when a request
+# names content_types; content type search is disabled while the URL is unset
+REORGANIZED_DATABASE_URL = os.environ.get('SEARCH_REORGANIZED_DATABASE_URL', '')
+REORGANIZED_DATABASE_PATH = os.environ.get(
+    'SEARCH_REORGANIZED_DATABASE_PATH',
+    os.path.join(tempfile.gettempdir(), 'youtube_search_complete_all_reorganized.db')
+)
+
+# Seconds before the local copy is revalidated against DATABASE_URL
+DATABASE_TTL = int(os.environ.get('SEARCH_DATABASE_TTL', '300'))
+
+# 'download' copies the whole database locally; 'remote' reads pages on
+# demand with HTTP Range requests (requires the optional apsw package)
+DATABASE_MODE = os.environ.get('SEARCH_DATABASE_MODE', 'download')
+
+# Remote mode: bytes fetched per range request, and size of the local page store
+REMOTE_BLOCK_SIZE = int(os.environ.get('SEARCH_REMOTE_BLOCK_SIZE', str(64 * 1024)))
+REMOTE_CACHE_SIZE = int(os.environ.get('SEARCH_REMOTE_CACHE_SIZE', str(64 * 1024 * 1024)))
+
+# Trigram full-text index built by database_indexer.py
+FTS_TABLE = 'script_lines_fts'
+
+# Trigrams cannot match shorter keywords; those fall back to LIKE
+FTS_MIN_KEYWORD_LENGTH = 3
+
+# 'sqlite' queries the database; 'ngram' uses the in-memory NgramIndex
+SEARCH_ENGINE = os.environ.get('SEARCH_ENGINE', 'sqlite')
+
+# Largest memory map used for a snapshot (bytes)
+MMAP_LIMIT = int(os.environ.get('SEARCH_MMAP_LIMIT', str(1024 * 1024 * 1024)))
+
+# Prepared statements kept per connection; covers every search_sql() shape
+STATEMENT_CACHE_SIZE = 256
+
+# Upper bound for the number of specs in one batch request
+MAX_BATCH_QUERIES = int(os.environ.get('SEARCH_MAX_BATCH_QUERIES', '200'))
+
+# Batches with at least this many uncached LIKE-only keywords share one
+# Python-level scan of a raw snapshot; smaller batches, and any batch on a
+# normalized or FTS snapshot, run one indexed query per keyword instead.
+# On 258k- and 400k-row corpora the scan overtakes at 20-25 keywords.
+BATCH_SCAN_MIN_QUERIES = int(os.environ.get('SEARCH_BATCH_SCAN_MIN_QUERIES', '25'))
+
+# Upper bound for one streamed (NDJSON) response
+MAX_STREAM_LIMIT = int(os.environ.get('SEARCH_MAX_STREAM_LIMIT', '1000000'))
+
+# Rows are written out in chunks of roughly this many bytes when streaming
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Recent observations kept per metrics histogram
+METRICS_SAMPLES = int(os.environ.get('SEARCH_METRICS_SAMPLES', '2048'))
+
+# In-process result cache: maximum entries and seconds an entry stays valid
+RESULT_CACHE_SIZE = int(os.environ.get('SEARCH_RESULT_CACHE_SIZE', '256'))
+RESULT_CACHE_TTL = int(os.environ.get('SEARCH_RESULT_CACHE_TTL', '600'))
+
+# Upper bound for one page of results
+MAX_LIMIT = int(os.environ.get('SEARCH_MAX_LIMIT', '1000'))
+
+# Responses smaller than this are sent uncompressed; compression levels
+# favour speed, since most bodies are a few hundred KB of JSON
+COMPRESSION_MIN_BYTES = int(os.environ.get('SEARCH_COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('SEARCH_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('SEARCH_BROTLI_QUALITY', '5'))
+
+# Script view: rows returned on each side of the requested row by default
+SCRIPT_WINDOW = int(os.environ.get('SEARCH_SCRIPT_WINDOW', '10'))
+
+# Facets: matches read for counting (counts beyond this are approximate),
+# and values returned per facet
+FACET_FIELDS = ('character_name', 'management_id', 'content_type')
+FACET_SCAN_LIMIT = int(os.environ.get('SEARCH_FACET_SCAN_LIMIT', '5000'))
+FACET_SIZE = int(os.environ.get('SEARCH_FACET_SIZE', '20'))
+
+# rowid comes last so every row has a unique position for keyset pagination
+RESULT_COLUMNS = 'management_id, title, broadcast_date, character_name, dialogue, voice_instruction, filming_instruction, editing_instruction, script_url, row_number, rowid'
+
+# Snapshots prepared by database_indexer.py also carry normalized sort keys
+NORMALIZED_RESULT_COLUMNS = RESULT_COLUMNS + ', management_key, broadcast_date_key, row_key'
+
+# Sort key columns per sort order. Ties are broken by management_id,
+# row_number and rowid so the order is total and pages never overlap.
+SORT_KEYS = {
+    'management_id_asc': (("COALESCE(management_id, '')", 'COALESCE(row_number, 0)', 'rowid'), 'ASC'),
+    'management_id_desc': (("COALESCE(management_id, '')", 'COALESCE(row_number, 0)', 'rowid'), 'DESC'),
+    'broadcast_date_asc': (("COALESCE(broadcast_date, '')", "COALESCE(management_id, '')", 'COALESCE(row_number, 0)', 'rowid'), 'ASC'),
+    'broadcast_date_desc': (("COALESCE(broadcast_date, '')", "COALESCE(management_id, '')", 'COALESCE(row_number, 0)', 'rowid'), 'DESC')
+}
+
+# Same orders over the normalized columns; each is served by a composite index
+NORMALIZED_SORT_KEYS = {
+    'management_id_asc': (('management_key', 'row_key', 'rowid'), 'ASC'),
+    'management_id_desc': (('management_key', 'row_key', 'rowid'), 'DESC'),
+    'broadcast_date_asc': (('broadcast_date_key', 'management_key', 'row_key', 'rowid'), 'ASC'),
+    'broadcast_date_desc': (('broadcast_date_key', 'management_key', 'row_key', 'rowid'), 'DESC')
+}
+
+# Tables of the reorganized database per content type:
+# (table, text column, character column, voice column, filming column).
+# The position of a type in this list is its rank in the sort order.
+CONTENT_TABLES = OrderedDict([
+    ('dialogue', ('character_dialogue', 'dialogue_text', 'character_name', 'voice_instruction', None)),
+    ('scene_description', ('scene_descriptions', 'description_text', None, None, 'filming_instruction')),
+    ('visual_effect', ('visual_effects', 'effect_description', None, None, None)),
+    ('audio_instruction', ('audio_instructions', 'audio_description', None, None, None)),
+    ('tech_instruction', ('technical_notes', 'note_text', None, None, None))
+])
+CONTENT_TYPES = tuple(CONTENT_TABLES)
+
+# Content table rows in the RESULT_COLUMNS layout, followed by the content
+# type rank and the script's normalized sort keys. Columns a table does not
+# have are empty.
+CONTENT_RESULT_COLUMNS = (
+    "s.management_id, s.title, s.broadcast_date, {character}, t.{text}, {voice}, {filming}, '', "
+    "s.script_url, t.row_number, t.id, {rank}, s.management_key, s.broadcast_date_key"
+)
+
+# The NORMALIZED_SORT_KEYS orders over the reorganized tables, so a search
+# lists rows in the same order with or without content_types. Rows at the
+# same position are ordered by content type, then by id within a table.
+# SQLite walks the scripts key index and reads each script's rows through
+# the table's (script_id, row_number) index, sorting one script at a time.
+CONTENT_SORT_KEYS = {
+    'management_id_asc': (('s.management_key', 'COALESCE(t.row_number, 0)', '{rank}', 't.id'), 'ASC'),
+    'management_id_desc': (('s.management_key', 'COALESCE(t.row_number, 0)', '{rank}', 't.id'), 'DESC'),
+    'broadcast_date_asc': (('s.broadcast_date_key', 's.management_key', 'COALESCE(t.row_number, 0)', '{rank}', 't.id'), 'ASC'),
+    'broadcast_date_desc': (('s.broadcast_date_key', 's.management_key', 'COALESCE(t.row_number, 0)', '{rank}', 't.id'), 'DESC')
+}
+
+SORT_SCHEMES = {
+    'raw': (RESULT_COLUMNS, SORT_KEYS),
+    'normalized': (NORMALIZED_RESULT_COLUMNS, NORMALIZED_SORT_KEYS),
+    'content': (CONTENT_RESULT_COLUMNS, CONTENT_SORT_KEYS)
+}
+
+INVALID_CURSOR_MESSAGE = 'カーソルが不正です。最初のページから検索し直してください'
+
+
+def sort_key(row, sort_order, scheme='raw'):
+    """Return the sort key values of a result row under a sort scheme"""
+    if scheme == 'normalized':
+        if sort_order.startswith('broadcast_date'):
+            return (row[12], row[11], row[13], row[10])
+        return (row[11], row[13], row[10])
+    if scheme == 'content':
+        if sort_order.startswith('broadcast_date'):
+            return (row[13], row[12], row[9] or 0, row[11], row[10])
+        return (row[12], row[9] or 0, row[11], row[10])
+    if sort_order.startswith('broadcast_date'):
+        return (row[2] or '', row[0] or '', row[9] or 0, row[10])
+    return (row[0] or '', row[9] or 0, row[10])
+
+
+def encode_cursor(sort_order, key, scheme='raw'):
+    """Encode the sort key of the last row on a page as an opaque token"""
+    payload = json.dumps([sort_order, scheme, *key], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, sort_order):
+    """Decode a cursor token into ``(scheme, key)``; raise ValueError if it does not fit sort_order"""
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(payload.decode('utf-8'))
+    except (ValueError, TypeError):
+        raise ValueError(INVALID_CURSOR_MESSAGE)
+    if not isinstance(values, list) or values[:1] != [sort_order] or len(values) < 2 or values[1] not in SORT_SCHEMES:
+        raise ValueError(INVALID_CURSOR_MESSAGE)
+    columns, _ = SORT_SCHEMES[values[1]][1][sort_order]
+    if len(values) != len(columns) + 2:
+        raise ValueError(INVALID_CURSOR_MESSAGE)
+    return values[1], tuple(values[2:])
+
+
+# Up to this many exact character keys are bound as an IN list the
+# planner can seek with; the list is padded to a power of two so there
+# are only a few query shapes. A filter matching more names is not
+# selective, and passes them as one JSON array instead.
+MAX_CHARACTER_KEY_SLOTS = 256
+
+
+def padded_slots(values, max_slots):
+    """Return values padded to a power of two for an IN list, or None if empty or over max_slots.
+
+    The last value is repeated, which does not change the match; the few
+    list lengths keep the number of distinct statements small.
+    """
+    if not values or len(values) > max_slots:
+        return None
+    slots = 1
+    while slots < len(values):
+        slots *= 2
+    return list(values) + [values[-1]] * (slots - len(values))
+
+
+def character_key_slots(character_keys):
+    """Return the character keys padded for an IN list, or None if there are too many"""
+    return padded_slots(character_keys, MAX_CHARACTER_KEY_SLOTS)
+
+
+def character_key_condition(column, key_slots):
+    """SQL condition matching column against key_slots placeholders (0: one JSON array)"""
+    if key_slots == 0:
+        return f"{column} IN (SELECT value FROM json_each(?))"
+    if key_slots == 1:
+        return f"{column} = ?"
+    return f"{column} IN ({', '.join('?' * key_slots)})"
+
+
+def like_pattern(text):
+    """LIKE pattern (used with ESCAPE '\\') matching text as a literal substring.
+
+    Unescaped, '%' and '_' in a keyword would be wildcards, and the LIKE
+    queries would disagree with FTS phrases, the n-gram index and the
+    batch scan, which all match the keyword literally.
+    """
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+@lru_cache(maxsize=None)
+def search_sql(use_fts, has_filter, sort_order, has_after, scheme='raw', key_slots=0):
+    """Return the SQL text for one query shape.
+
+    There are only a few dozen shapes, and returning the identical string
+    for each lets sqlite3's statement cache reuse the prepared statement.
+    """
+    result_columns, sort_keys = SORT_SCHEMES[scheme]
+    if use_fts:
+        query = f"""
+        SELECT {result_columns}
+        FROM script_lines
+        WHERE rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)
+        """
+    else:
+        query = f"""
+        SELECT {result_columns}
+        FROM script_lines
+        WHERE (dialogue LIKE ? ESCAPE '\\' OR character_name LIKE ? ESCAPE '\\' OR title LIKE ? ESCAPE '\\')
+        """
+
+    # Add character filter; normalized snapshots seek the character index
+    # with the (pre-resolved) list of matching character keys
+    if has_filter and scheme == 'normalized':
+        query += " AND " + character_key_condition('character_key', key_slots)
+    elif has_filter:
+        query += " AND character_name LIKE ? ESCAPE '\\'"
+
+    # Resume after the previous page
+    columns, direction = sort_keys[sort_order]
+    if has_after:
+        placeholders = ', '.join('?' * len(columns))
+        query += f" AND ({', '.join(columns)}) {'>' if direction == 'ASC' else '<'} ({placeholders})"
+
+    # Add sorting
+    query += f" ORDER BY {', '.join(f'{column} {direction}' for column in columns)} LIMIT ?"
+    return query
+
+
+def build_search_query(keyword, character_filter, sort_order, limit, use_fts=False, after=None,
+                       scheme='raw', character_keys=None):
+    """Build the search SQL and its parameters.
+
+    ``after`` is a decoded cursor key; the query then seeks past that row
+    instead of re-reading earlier pages. With the normalized scheme the
+    character filter is matched through ``character_keys``, the exact
+    character names that contain it (at least one).
+    """
+    use_fts = use_fts and len(keyword) >= FTS_MIN_KEYWORD_LENGTH
+    if use_fts:
+        # Quote the keyword as a single FTS5 phrase so it matches as a substring
+        params = ['"' + keyword.replace('"', '""') + '"']
+    else:
+        params = [like_pattern(keyword)] * 3
+
+    key_slots = 0
+    if character_filter and scheme == 'normalized':
+        slots = character_key_slots(character_keys)
+        if slots is None:
+            params.append(json.dumps(character_keys, ensure_ascii=False))
+        else:
+            params.extend(slots)
+            key_slots = len(slots)
+    elif character_filter:
+        params.append(like_pattern(character_filter))
+    if after is not None:
+        params.extend(after)
+    params.append(limit)
+
+    query = search_sql(use_fts, bool(character_filter), sort_order, after is not None, scheme, key_slots)
+    return query, params
+
+
+@lru_cache(maxsize=None)
+def content_search_sql(content_type, has_filter, sort_order, has_after, key_slots=0):
+    """Return the SQL text searching one content table of the reorganized database"""
+    table, text_column, character_column, voice_column, filming_column = CONTENT_TABLES[content_type]
+    rank = CONTENT_TYPES.index(content_type)
+    result_columns = CONTENT_RESULT_COLUMNS.format(
+        character=f't.{character_column}' if character_column else "''",
+        text=text_column,
+        voice=f't.{voice_column}' if voice_column else "''",
+        filming=f't.{filming_column}' if filming_column else "''",
+        rank=rank
+    )
+    columns = [f't.{text_column}'] + ([f't.{character_column}'] if character_column else []) + ['s.title']
+    matches = ' OR '.join(f"{column} LIKE ? ESCAPE '\\'" for column in columns)
+    query = f"""
+    SELECT {result_columns}
+    FROM {table} t JOIN scripts s ON s.id = t.script_id
+    WHERE ({matches})
+    """
+
+    # Exact character names resolved beforehand seek the character index
+    if has_filter:
+        query += " AND " + character_key_condition(f't.{character_column}', key_slots)
+
+    columns, direction = CONTENT_SORT_KEYS[sort_order]
+    columns = [column.format(rank=rank) for column in columns]
+    if has_after:
+        placeholders = ', '.join('?' * len(columns))
+        query += f" AND ({', '.join(columns)}) {'>' if direction == 'ASC' else '<'} ({placeholders})"
+
+    # The rank is constant within a table (and a bare integer would name a
+    # result column), so it is left out of ORDER BY
+    ordering = [column for column in columns if column != str(rank)]
+    query += f" ORDER BY {', '.join(f'{column} {direction}' for column in ordering)} LIMIT ?"
+    return query
+
+
+def matching_character_keys(conn, character_filter):
+    """Return the exact character keys that contain character_filter.
+
+    On a normalized snapshot these are character_key values; on the
+    reorganized database, character_dialogue.character_name values.
+    """
+    if conn.character_keys is None:
+        source = 'character_dialogue' if conn.sort_scheme == 'content' else 'script_lines'
+        column = 'character_name' if conn.sort_scheme == 'content' else 'character_key'
+        conn.character_keys = [
+            row[0] for row in conn.execute(f'SELECT DISTINCT {column} FROM {source}').fetchall()
+            if row[0]
+        ]
+    folded = character_filter.translate(ASCII_FOLD)
+    return [key for key in conn.character_keys if folded in key.translate(ASCII_FOLD)]
+
+
+# ASCII-only case folding, matching SQLite's LIKE
+ASCII_FOLD = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+
+# Content type rules. database_reorganizer.py classifies rows with these
+# tables too (it imports them from here, since this module is deployed on
+# its own). Each pattern family is compiled into one alternation.
+MAIN_CHARACTERS = frozenset(['サンサン', 'くもりん', 'ツクモ', 'ノイズ', 'プリル'])
+CONTENT_PATTERNS = {
+    'dialogue': [
+        r'[！？。〜♪]+$',
+        r'^[「『].*[」』]$',
+        r'[あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん]+[！？。〜♪]',
+    ],
+    'scene_description': [
+        r'^[^「『]*[のをに][いるある]',
+        r'カメラ|撮影|アップ|全体|登場|の様子',
+        r'^.*[がは].*[するている]',
+        r'ペットボトル|プール|全体像|手をあげる',
+    ],
+    'tech_instruction': [
+        r'BGM|SE|音楽|効果音|audiostock',
+        r'テロップ|CG|エフェクト|フェード|アイリス',
+        r'撮影|カット|編集|※|★',
+        r'https?://|\.mp3|\.wav|gigafile',
+    ],
+    'visual_effect': [
+        r'テロップ|エフェクト|CG|稲光|電撃|アニメーション',
+        r'スロー|モノクロ|フェード|ズーム|パン',
+        r'光|キラキラ|ぼわん|ドカーン',
+    ],
+    'audio_instruction': [
+        r'BGM|SE|効果音|音楽|サウンド',
+        r'ちゃんちゃん|シャキーン|ドンッ|キキーッ',
+        r'audiostock|gigafile|\.mp3|\.wav',
+    ],
+}
+DIALOGUE_PATTERN, SCENE_PATTERN, TECH_PATTERN, VISUAL_PATTERN, AUDIO_PATTERN = (
+    re.compile('|'.join(f'(?:{pattern})' for pattern in CONTENT_PATTERNS[name]))
+    for name in ('dialogue', 'scene_description', 'tech_instruction', 'visual_effect', 'audio_instruction')
+)
+
+
+def classify_content_type(character_name, dialogue):
+    """Content type of a row, as database_reorganizer.py would classify it"""
+    if not dialogue or not dialogue.strip():
+        return 'empty'
+    dialogue = dialogue.strip()
+    technical = TECH_PATTERN.search(dialogue) is not None
+    if character_name in MAIN_CHARACTERS and not technical and DIALOGUE_PATTERN.search(dialogue):
+        return 'dialogue'
+    if technical:
+        if AUDIO_PATTERN.search(dialogue):
+            return 'audio_instruction'
+        if VISUAL_PATTERN.search(dialogue):
+            return 'visual_effect'
+        return 'tech_instruction'
+    if SCENE_PATTERN.search(dialogue):
+        return 'scene_description'
+    return 'dialogue' if character_name else 'scene_description'
+
+
+class NgramIndex:
+    """In-memory character n-gram index over script_lines.
+
+    Used instead of SQL when ``SEARCH_ENGINE=ngram`` (for SQLite builds
+    without FTS5). Every row gets a document id in ``management_id_asc``
+    sort key order, and each bigram and trigram of ``dialogue``, ``character_name``
+    and ``title`` maps to the ids containing it. Postings are delta-encoded
+    varints in one flat ``bytes`` object, where most deltas take a single
+    byte; apart from them the index keeps only each document's rowid,
+    broadcast_date rank and character name id. A query intersects the
+    rarest postings of the keyword and drops candidates whose character
+    name fails the filter, then reads the rest from SQLite by rowid in
+    result order and verifies them with a substring test until the page
+    is full, so results match the LIKE query exactly.
+    """
+
+    GRAM_SIZES = (2, 3)
+    # Candidates read per rowid query: the first batch covers a typical
+    # page, later ones grow as verification rejects candidates. Rowids are
+    # bound as placeholders (JSON1 may be missing on the SQLite builds this
+    # engine is for), so a batch stays under their 999-variable limit.
+    FIRST_BATCH = 64
+    MAX_BATCH = 512
+
+    def __init__(self, conn):
+        self.scheme = conn.sort_scheme
+        self.slots = {}
+        self.offsets = array('I', [0])
+        self.postings = b''
+        self.rowids = array('q')
+        self.date_rank = array('I')
+        self.characters = []
+        self.character_ids = array('I')
+        self.fetch_sql = {}
+        self._build(conn)
+
+    def _build(self, conn):
+        building = {}
+        memo = {}
+        character_ids = {}
+        _, sort_keys = SORT_SCHEMES[self.scheme]
+        cursor = conn.execute(
+            f"SELECT rowid, dialogue, character_name, title FROM script_lines "
+            f"ORDER BY {', '.join(sort_keys['management_id_asc'][0])}"
+        )
+        for doc_id, (rowid, dialogue, character_name, title) in enumerate(cursor):
+            self.rowids.append(rowid)
+            folded_name = (character_name or '').translate(ASCII_FOLD)
+            character_id = character_ids.get(folded_name)
+            if character_id is None:
+                character_id = character_ids[folded_name] = len(self.characters)
+                self.characters.append(folded_name)
+            self.character_ids.append(character_id)
+            grams = self._grams((dialogue or '').translate(ASCII_FOLD))
+            # Titles and character names repeat across rows; memoize their grams
+            for text in (character_name, title):
+                field_grams = memo.get(text)
+                if field_grams is None:
+                    field_grams = memo[text] = self._grams((text or '').translate(ASCII_FOLD))
+                grams = grams | field_grams
+            for gram in grams:
+                entry = building.get(gram)
+                if entry is None:
+                    entry = building[gram] = [0, bytearray()]
+                delta = doc_id - entry[0]
+                entry[0] = doc_id
+                buffer = entry[1]
+                while delta > 0x7f:
+                    buffer.append(delta & 0x7f | 0x80)
+                    delta >>= 7
+                buffer.append(delta)
+        memo.clear()
+
+        for slot, (gram, (_, buffer)) in enumerate(building.items()):
+            self.slots[gram] = slot
+            self.offsets.append(self.offsets[-1] + len(buffer))
+        self.postings = b''.join(buffer for _, buffer in building.values())
+        building.clear()
+
+        doc_ids = {rowid: doc_id for doc_id, rowid in enumerate(self.rowids)}
+        self.date_rank = array('I', bytes(4 * len(self.rowids)))
+        cursor = conn.execute(
+            f"SELECT rowid FROM script_lines "
+            f"ORDER BY {', '.join(sort_keys['broadcast_date_asc'][0])}"
+        )
+        for rank, (rowid,) in enumerate(cursor):
+            self.date_rank[doc_ids[rowid]] = rank
+
+    def _grams(self, text):
+        return frozenset(
+            text[i:i + n] for n in self.GRAM_SIZES for i in range(len(text) - n + 1)
+        )
+
+    def _decode(self, slot):
+        data = self.postings[self.offsets[slot]:self.offsets[slot + 1]]
+        # Lists whose deltas all fit one byte decode at C speed
+        if data.isascii():
+            return accumulate(data)
+        return accumulate(_varints(data))
+
+    @classmethod
+    def covers(cls, keyword):
+        """Whether the index can narrow down a search for keyword"""
+        return len(keyword) >= min(cls.GRAM_SIZES)
+
+    def _candidates(self, keyword):
+        """Return candidate doc ids in ascending order"""
+        n = min(len(keyword), max(self.GRAM_SIZES))
+        slots = []
+        for i in range(len(keyword) - n + 1):
+            slot = self.slots.get(keyword[i:i + n])
+            if slot is None:
+                return []
+            slots.append(slot)
+        slots = sorted(set(slots), key=lambda s: self.offsets[s + 1] - self.offsets[s])
+
+        candidates = list(self._decode(slots[0]))
+        # The rarest few postings narrow the set enough; verification does the rest
+        for slot in slots[1:4]:
+            if not candidates:
+                break
+            present = set(self._decode(slot))
+            candidates = [d for d in candidates if d in present]
+        return candidates
+
+    def _fetch(self, conn, doc_ids):
+        """Read the rows of doc_ids (at most MAX_BATCH); return ``{rowid: row}``"""
+        rowids = padded_slots([self.rowids[d] for d in doc_ids], self.MAX_BATCH)
+        query = self.fetch_sql.get(len(rowids))
+        if query is None:
+            result_columns, _ = SORT_SCHEMES[self.scheme]
+            query = self.fetch_sql[len(rowids)] = (
+                f"SELECT {result_columns} FROM script_lines WHERE rowid IN ({', '.join('?' * len(rowids))})"
+            )
+        return {row[10]: row for row in conn.execute(query, rowids)}
+
+    def _cursor_rank(self, conn, sort_order, after):
+        """Position of the cursor's row in sort_order, or None if the row is gone"""
+        # The rowid is the last key column of every scheme
+        try:
+            doc_id = self.rowids.index(after[-1])
+        except (ValueError, TypeError, OverflowError):
+            return None
+        row = self._fetch(conn, [doc_id]).get(after[-1])
+        if row is None or sort_key(row, sort_order, self.scheme) != after:
+            return None
+        return self.date_rank[doc_id] if sort_order.startswith('broadcast_date') else doc_id
+
+    def search(self, conn, keyword, character_filter, sort_order, limit, after=None):
+        """Return result rows in the same shape and order as the SQL query"""
+        keyword = keyword.translate(ASCII_FOLD)
+        character_filter = character_filter.translate(ASCII_FOLD)
+        if limit < 0:
+            limit = None  # LIMIT -1 means no limit in SQLite
+        descending = sort_order.endswith('_desc')
+
+        candidates = self._candidates(keyword)
+        # The character filter only looks at names, so it is applied before any row is read
+        if character_filter:
+            allowed = {i for i, name in enumerate(self.characters) if character_filter in name}
+            candidates = [d for d in candidates if self.character_ids[d] in allowed]
+        rank = self.date_rank.__getitem__ if sort_order.startswith('broadcast_date') else None
+        if rank is not None:
+            candidates.sort(key=rank, reverse=descending)
+        elif descending:
+            candidates.reverse()
+
+        # Skip to the cursor by position; a stale cursor falls back to comparing keys
+        if after is not None:
+            position = self._cursor_rank(conn, sort_order, after)
+            if position is not None:
+                rank = rank or int
+                candidates = [
+                    d for d in candidates
+                    if (rank(d) < position if descending else rank(d) > position)
+                ]
+                after = None
+
+        results = []
+        batch = self.FIRST_BATCH
+        start = 0
+        while start < len(candidates) and (limit is None or len(results) < limit):
+            chunk = candidates[start:start + batch]
+            start += batch
+            batch = min(batch * 2, self.MAX_BATCH)
+            fetched = self._fetch(conn, chunk)
+            for doc_id in chunk:
+                row = fetched.get(self.rowids[doc_id])
+                if row is None:
+                    continue
+                if after is not None:
+                    key = sort_key(row, sort_order, self.scheme)
+                    if (key >= after) if descending else (key <= after):
+                        continue
+                if any(keyword in (text or '').translate(ASCII_FOLD) for text in (row[4], row[3], row[1])):
+                    results.append(row)
+                    if limit is not None and len(results) == limit:
+                        break
+        return results
+
+
+def _varints(data):
+    """Decode a run of LEB128 varints"""
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            yield value
+            value = shift = 0
+        else:
+            shift += 7
+
+
+_ngram_lock = threading.Lock()
+
+
+def get_ngram_index(conn):
+    """Return the n-gram index of a snapshot, building it on first use"""
+    if conn.ngram_index is None:
+        with _ngram_lock:
+            if conn.ngram_index is None:
+                conn.ngram_index = NgramIndex(conn)
+    return conn.ngram_index
+
+
+class ResultCache:
+    """LRU cache of formatted search pages.
+
+    Entries expire after ``ttl`` seconds or when more than ``max_entries``
+    are held, and the whole cache is dropped when a request arrives with a
+    newer snapshot version than the one the entries were computed on.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(keyword, character_filter, sort_order, limit, cursor=None):
+        # LIKE ignores ASCII case, so differently cased keywords share an entry
+        return (
+            keyword.strip().translate(ASCII_FOLD),
+            character_filter.strip().translate(ASCII_FOLD),
+            sort_order,
+            limit,
+            cursor
+        )
+
+    def get(self, key, version):
+        with self.lock:
+            if version != self.version:
+                self.entries.clear()
+                self.version = version
+            entry = self.entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, value):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = (time.monotonic(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+
+result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+# Content type searches read the reorganized database, whose snapshot
+# versions are counted separately
+content_result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+
+class RequestTimer:
+    """Per-request phase timings, reported as a Server-Timing header"""
+
+    def __init__(self):
+        self.phases = OrderedDict()
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        return ', '.join(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items())
+
+
+class Metrics:
+    """In-process histograms of request phases, row counts and bytes written.
+
+    Each histogram keeps its most recent ``max_samples`` observations for
+    percentiles, plus an all-time count and sum.
+    """
+
+    def __init__(self, max_samples=METRICS_SAMPLES):
+        self.max_samples = max_samples
+        self.samples = {}
+        self.counts = {}
+        self.sums = {}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, name, value):
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.max_samples)
+                self.counts[name] = 0
+                self.sums[name] = 0
+            self.samples[name].append(value)
+            self.counts[name] += 1
+            self.sums[name] += value
+
+    def record_request(self, timer, rows, bytes_written, raw_bytes=None):
+        # bytes_written is what went on the wire; raw_bytes the body before compression
+        for name, seconds in timer.phases.items():
+            self.observe(f'{name}_ms', seconds * 1000)
+        self.observe('total_ms', sum(timer.phases.values()) * 1000)
+        self.observe('rows', rows)
+        self.observe('bytes_written', bytes_written)
+        self.observe('raw_bytes', bytes_written if raw_bytes is None else raw_bytes)
+
+    def snapshot(self):
+        with self.lock:
+            histograms = {}
+            for name, samples in self.samples.items():
+                ordered = sorted(samples)
+                histograms[name] = {
+                    'count': self.counts[name],
+                    'sum': round(self.sums[name], 3),
+                    'p50': round(_percentile(ordered, 50), 3),
+                    'p95': round(_percentile(ordered, 95), 3),
+                    'p99': round(_percentile(ordered, 99), 3),
+                    'max': round(ordered[-1], 3)
+                }
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'histograms': histograms,
+            'result_cache': result_cache.stats()
+        }
+
+
+def _percentile(ordered, percent):
+    # Nearest-rank percentile of an already sorted sample
+    index = max(0, min(len(ordered) - 1, -(-len(ordered) * percent // 100) - 1))
+    return ordered[index]
+
+
+metrics = Metrics()
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'br', 'gzip' or None (identity) from an Accept-Encoding header"""
+    offered = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, parameters = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        offered[name] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in (('br',) if brotli is not None else ()) + ('gzip',):
+        quality = offered.get(encoding, offered.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class ResponseCompressor:
+    """Incremental gzip or brotli encoder for one response body.
+
+    ``compress(data, flush=True)`` also flushes the encoder, so a client
+    can decode everything sent so far; streamed NDJSON uses that for each
+    chunk. ``finish()`` returns the end of the encoded stream.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self.encoder = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits 31: zlib's deflate with a gzip header and trailer
+            self.encoder = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=False):
+        if self.encoding == 'br':
+            output = self.encoder.process(data)
+            return output + self.encoder.flush() if flush else output
+        output = self.encoder.compress(data)
+        return output + self.encoder.flush(zlib.Z_SYNC_FLUSH) if flush else output
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self.encoder.finish()
+        return self.encoder.flush()
+
+
+def compress_body(body, encoding):
+    """Encode a complete response body"""
+    compressor = ResponseCompressor(encoding)
+    return compressor.compress(body) + compressor.finish()
+
+
+def format_row(row):
+    """Convert a result row to the response dict"""
+    return {
+        'management_id': row[0] or '',
+        'title': row[1] or '',
+        'broadcast_date': row[2] or '',
+        'character_name': row[3] or '',
+        'dialogue': row[4] or '',
+        'voice_instruction': row[5] or '',
+        'filming_instruction': row[6] or '',
+        'editing_instruction': row[7] or '',
+        'script_url': row[8] or '',
+        'row_number': row[9] or 0
+    }
+
+
+# Compact format: per-row columns, and the per-script columns moved to a lookup table
+COMPACT_COLUMNS = (
+    'script', 'row_number', 'dialogue', 'character_name',
+    'voice_instruction', 'filming_instruction', 'editing_instruction'
+)
+COMPACT_SCRIPT_COLUMNS = ('management_id', 'title', 'broadcast_date', 'script_url')
+
+
+def format_compact(rows):
+    """Convert result rows to the column-oriented response.
+
+    Each row is an array in COMPACT_COLUMNS order with trailing empty
+    fields left out, so most rows stop after ``dialogue`` or
+    ``character_name``. ``script`` indexes ``scripts.rows``, which holds
+    each distinct management_id, title, broadcast_date and script_url once.
+    Arrays are built straight from the cursor tuples.
+    """
+    scripts = {}
+    packed = []
+    for row in rows:
+        script = (row[0] or '', row[1] or '', row[2] or '', row[8] or '')
+        index = scripts.get(script)
+        if index is None:
+            index = scripts[script] = len(scripts)
+        values = [index, row[9] or 0, row[4] or '', row[3] or '', row[5] or '', row[6] or '', row[7] or '']
+        while len(values) > 2 and not values[-1]:
+            values.pop()
+        packed.append(values)
+    return {
+        'columns': list(COMPACT_COLUMNS),
+        'scripts': {'columns': list(COMPACT_SCRIPT_COLUMNS), 'rows': [list(script) for script in scripts]},
+        'rows': packed
+    }
+
+
+def format_content_results(rows, result_format='objects'):
+    """Format content table rows like format_results, adding each row's content type"""
+    if result_format == 'compact':
+        packed = format_compact(rows)
+        packed['content_types'] = [CONTENT_TYPES[row[11]] for row in rows]
+        return packed
+    formatted = []
+    for row in rows:
+        result = format_row(row)
+        result['content_type'] = CONTENT_TYPES[row[11]]
+        formatted.append(result)
+    return formatted
+
+
+def format_results(rows, result_format='objects'):
+    """Format result rows as a list of dicts, or compactly (see format_compact)"""
+    if result_format == 'compact':
+        return format_compact(rows)
+    return [format_row(row) for row in rows]
+
+
+def result_count(formatted_results):
+    """Number of rows in a format_results() value"""
+    if isinstance(formatted_results, dict):
+        return len(formatted_results['rows'])
+    return len(formatted_results)
+
+
+def iter_search_rows(conn, keyword, character_filter, sort_order, limit, after=None):
+    """Yield up to ``limit`` result rows without materializing them all.
+
+    ``after`` is a decoded ``(scheme, key)`` cursor.
+    """
+    if after is not None:
+        scheme, after = after
+        # Cursors from a snapshot with a different sort scheme cannot be resumed
+        if scheme != conn.sort_scheme:
+            raise ValueError(INVALID_CURSOR_MESSAGE)
+
+    # Keywords too short for a bigram fall through to the LIKE query
+    if SEARCH_ENGINE == 'ngram' and NgramIndex.covers(keyword):
+        yield from get_ngram_index(conn).search(
+            conn, keyword, character_filter, sort_order, limit, after=after
+        )
+        return
+
+    character_keys = None
+    if character_filter and conn.sort_scheme == 'normalized':
+        character_keys = matching_character_keys(conn, character_filter)
+        # No character name contains the filter, so nothing can match
+        if not character_keys:
+            return
+    query, params = build_search_query(
+        keyword, character_filter, sort_order, limit,
+        use_fts=conn.fts_enabled, after=after,
+        scheme=conn.sort_scheme, character_keys=character_keys
+    )
+    cursor = conn.execute(query, params)
+    try:
+        yield from cursor
+    finally:
+        cursor.close()
+
+
+def search_scripts(conn, keyword, character_filter, sort_order, limit, after=None):
+    """Run one search against a snapshot; return ``(rows, next_cursor)``"""
+    # Fetch one extra row to know whether another page exists
+    rows = list(iter_search_rows(conn, keyword, character_filter, sort_order, limit + 1, after=after))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort_order, sort_key(rows[-1], sort_order, conn.sort_scheme), conn.sort_scheme)
+    return rows, next_cursor
+
+
+def parse_search_params(data, max_limit):
+    """Normalize one search spec from a request body.
+
+    The returned dict always has an ``error`` entry, which holds the
+    message to show when the spec cannot be searched.
+    """
+    keyword = str(data.get('keyword') or '').strip()
+    character_filter = str(data.get('character_filter') or '').strip()
+    sort_order = data.get('sort_order', 'management_id_asc')
+    if sort_order not in SORT_KEYS:
+        sort_order = 'management_id_asc'
+    try:
+        limit = max(1, min(int(data.get('limit', 50)), max_limit))
+    except (TypeError, ValueError):
+        limit = 50
+
+    params = {
+        'keyword': keyword,
+        'character_filter': character_filter,
+        'sort_order': sort_order,
+        'limit': limit,
+        'cursor': str(data['cursor']) if data.get('cursor') else None,
+        'after': None,
+        'error': None
+    }
+
+    # format: 'compact' for the column-oriented results of format_compact()
+    params['format'] = 'compact' if data.get('format') == 'compact' else 'objects'
+
+    # content_types: search the reorganized database, limited to these
+    # CONTENT_TYPES (a single name is accepted too)
+    content_types = data.get('content_types')
+    if isinstance(content_types, str):
+        content_types = [content_types]
+    if isinstance(content_types, list):
+        params['content_types'] = tuple(name for name in CONTENT_TYPES if name in content_types)
+    else:
+        params['content_types'] = ()
+
+    # facets: true for every field, or a list of FACET_FIELDS names
+    facets = data.get('facets')
+    if facets is True:
+        params['facets'] = FACET_FIELDS
+    elif isinstance(facets, list):
+        params['facets'] = tuple(field for field in FACET_FIELDS if field in facets)
+    else:
+        params['facets'] = ()
+
+    if not keyword:
+        params['error'] = 'キーワードを入力してください'
+    elif content_types and not params['content_types']:
+        params['error'] = f'content_typesには次の値を指定してください: {", ".join(CONTENT_TYPES)}'
+    elif params['content_types'] and reorganized_cache is None:
+        params['error'] = CONTENT_SEARCH_UNAVAILABLE_MESSAGE
+    elif params['cursor']:
+        # Decode the pagination cursor from the previous page
+        try:
+            params['after'] = decode_cursor(params['cursor'], sort_order)
+        except ValueError:
+            params['error'] = INVALID_CURSOR_MESSAGE
+    return params
+
+
+def _cache_key(params):
+    return ResultCache.make_key(
+        params['keyword'], params['character_filter'], params['sort_order'],
+        params['limit'], params['cursor']
+    ) + (params['format'], params['content_types'])
+
+
+def cached_search(conn, params, timer=None):
+    """Search through result_cache; return ``(formatted_results, next_cursor, cache_hit)``"""
+    timer = timer or RequestTimer()
+    cache_key = _cache_key(params)
+    with timer.phase('cache'):
+        cached = result_cache.get(cache_key, conn.version)
+    if cached is not None:
+        return cached[0], cached[1], True
+
+    with timer.phase('query'):
+        results, next_cursor = search_scripts(
+            conn, params['keyword'], params['character_filter'], params['sort_order'],
+            params['limit'], after=params['after']
+        )
+    with timer.phase('format'):
+        formatted_results = format_results(results, params['format'])
+    result_cache.put(cache_key, conn.version, (formatted_results, next_cursor))
+    return formatted_results, next_cursor, False
+
+
+def count_facets(rows, fields, content=False):
+    """Grouped match counts per facet field, most frequent first.
+
+    Content table rows (``content=True``) carry their content type; for
+    script_lines rows it is classified like database_reorganizer.py would.
+    """
+    counters = {field: Counter() for field in fields}
+    for row in rows:
+        if 'character_name' in counters:
+            character_name = (row[3] or '').strip()
+            if character_name:
+                counters['character_name'][character_name] += 1
+        if 'management_id' in counters:
+            counters['management_id'][row[0] or ''] += 1
+        if 'content_type' in counters:
+            content_type = CONTENT_TYPES[row[11]] if content else classify_content_type(row[3], row[4])
+            counters['content_type'][content_type] += 1
+    return {
+        field: [{'value': value, 'count': count} for value, count in counter.most_common(FACET_SIZE)]
+        for field, counter in counters.items()
+    }
+
+
+def faceted_search(conn, params, timer=None):
+    """Search and count facets from one read of the matches.
+
+    Up to FACET_SCAN_LIMIT matching rows are read once. When that covers
+    every match, both the facet counts and the requested page come from
+    those rows. For more common keywords the counts cover only the rows
+    read (``approximate: true``) and the page is fetched with the usual
+    ordered query, so latency stays bounded either way. With
+    ``content_types`` conn is the reorganized database, and the matches
+    are those of content_search.
+    Returns ``(formatted_results, next_cursor, cache_hit, facets)``.
+    """
+    timer = timer or RequestTimer()
+    content_types = params['content_types']
+    cache = content_result_cache if content_types else result_cache
+    cache_key = _cache_key(params) + (params['facets'],)
+    with timer.phase('cache'):
+        cached = cache.get(cache_key, conn.version)
+    if cached is not None:
+        return cached[0], cached[1], True, cached[2]
+
+    keyword = params['keyword']
+    character_filter = params['character_filter']
+    sort_order = params['sort_order']
+    limit = params['limit']
+    scheme = 'content' if content_types else conn.sort_scheme
+    if params['after'] is not None and params['after'][0] != scheme:
+        raise ValueError(INVALID_CURSOR_MESSAGE)
+
+    with timer.phase('query'):
+        if content_types:
+            rows = list(iter_content_rows(
+                conn, keyword, character_filter, content_types, 'management_id_asc', FACET_SCAN_LIMIT + 1
+            ))
+        else:
+            rows = list(iter_search_rows(conn, keyword, character_filter, 'management_id_asc', FACET_SCAN_LIMIT + 1))
+    approximate = len(rows) > FACET_SCAN_LIMIT
+    del rows[FACET_SCAN_LIMIT:]
+
+    with timer.phase('facets'):
+        facets = count_facets(rows, params['facets'], content=bool(content_types))
+        facets['scanned'] = len(rows)
+        facets['approximate'] = approximate
+
+    if approximate and content_types:
+        formatted_results, next_cursor, _ = content_search(conn, params, timer)
+        cache.put(cache_key, conn.version, (formatted_results, next_cursor, facets))
+        return formatted_results, next_cursor, False, facets
+    if approximate:
+        with timer.phase('query'):
+            page, next_cursor = search_scripts(
+                conn, keyword, character_filter, sort_order, limit, after=params['after']
+            )
+    else:
+        with timer.phase('query'):
+            descending = sort_order.endswith('_desc')
+            key = lambda row: sort_key(row, sort_order, scheme)
+            if params['after'] is not None:
+                after = params['after'][1]
+                rows = [row for row in rows if (key(row) < after if descending else key(row) > after)]
+            select = heapq.nlargest if descending else heapq.nsmallest
+            page = select(limit + 1, rows, key=key)
+            next_cursor = None
+            if len(page) > limit:
+                page = page[:limit]
+                next_cursor = encode_cursor(sort_order, key(page[-1]), scheme)
+
+    with timer.phase('format'):
+        if content_types:
+            formatted_results = format_content_results(page, params['format'])
+        else:
+            formatted_results = format_results(page, params['format'])
+    cache.put(cache_key, conn.version, (formatted_results, next_cursor, facets))
+    return formatted_results, next_cursor, False, facets
+
+
+def batch_search(conn, specs):
+    """Answer many parsed search specs against one snapshot.
+
+    Specs the index can answer (FTS keywords, the n-gram engine, cached
+    pages, cursors) are probed one by one, and so are the LIKE-only specs
+    unless there are at least BATCH_SCAN_MIN_QUERIES of them on a raw
+    snapshot. Those share a single scan of script_lines: a combined regex
+    skips rows that match no keyword, and each spec keeps its own sort
+    order and limit.
+    Returns ``{id(spec): (formatted_results, next_cursor)}``.
+    """
+    outcomes = {}
+    scan_specs = []
+    for spec in specs:
+        indexed = (
+            (SEARCH_ENGINE == 'ngram' and NgramIndex.covers(spec['keyword']))
+            or (conn.fts_enabled and len(spec['keyword']) >= FTS_MIN_KEYWORD_LENGTH)
+        )
+        if indexed or spec['after'] is not None:
+            outcomes[id(spec)] = cached_search(conn, spec)[:2]
+            continue
+        cached = result_cache.get(_cache_key(spec), conn.version)
+        if cached is not None:
+            outcomes[id(spec)] = cached
+        else:
+            scan_specs.append(spec)
+
+    # Per-keyword queries seek the sort and character indexes and stop at
+    # the page limit; a shared scan only pays off for many raw LIKE queries
+    if conn.sort_scheme != 'raw' or conn.fts_enabled or len(scan_specs) < BATCH_SCAN_MIN_QUERIES:
+        for spec in scan_specs:
+            outcomes[id(spec)] = cached_search(conn, spec)[:2]
+        return outcomes
+
+    folded = [
+        (spec, spec['keyword'].translate(ASCII_FOLD), spec['character_filter'].translate(ASCII_FOLD))
+        for spec in scan_specs
+    ]
+    keywords = sorted({keyword for _, keyword, _ in folded}, key=len, reverse=True)
+    any_keyword = re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+
+    scheme = conn.sort_scheme
+    matches = {id(spec): [] for spec in scan_specs}
+    for row in conn.execute(f'SELECT {SORT_SCHEMES[scheme][0]} FROM script_lines'):
+        # Join the fields with NUL so a keyword never matches across two of them
+        text = '\0'.join((row[4] or '', row[3] or '', row[1] or '')).translate(ASCII_FOLD)
+        if not any_keyword.search(text):
+            continue
+        character_name = (row[3] or '').translate(ASCII_FOLD)
+        for spec, keyword, character_filter in folded:
+            if keyword in text and (not character_filter or character_filter in character_name):
+                matches[id(spec)].append(row)
+
+    for spec in scan_specs:
+        sort_order = spec['sort_order']
+        select = heapq.nlargest if sort_order.endswith('_desc') else heapq.nsmallest
+        rows = select(spec['limit'] + 1, matches[id(spec)], key=lambda row: sort_key(row, sort_order, scheme))
+        next_cursor = None
+        if len(rows) > spec['limit']:
+            rows = rows[:spec['limit']]
+            next_cursor = encode_cursor(sort_order, sort_key(rows[-1], sort_order, scheme), scheme)
+        outcomes[id(spec)] = (format_results(rows, spec['format']), next_cursor)
+        result_cache.put(_cache_key(spec), conn.version, outcomes[id(spec)])
+    return outcomes
+
+
+def iter_content_rows(conn, keyword, character_filter, content_types, sort_order, limit, after=None):
+    """Yield up to ``limit`` matching rows from the reorganized database's content tables.
+
+    Each table named in content_types is queried on its own in the
+    requested order (see CONTENT_SORT_KEYS), and the sorted cursors are
+    merged, so a dialogue-only search never reads the other
+    tables. Only character_dialogue has character names: with a character
+    filter the other tables cannot match and are skipped.
+    """
+    key_slots = 0
+    if character_filter:
+        content_types = [name for name in content_types if CONTENT_TABLES[name][2]]
+        character_keys = matching_character_keys(conn, character_filter)
+        # No character name contains the filter, so nothing can match
+        if not character_keys:
+            return
+        slots = character_key_slots(character_keys)
+        if slots is None:
+            character_keys = [json.dumps(character_keys, ensure_ascii=False)]
+        else:
+            character_keys, key_slots = slots, len(slots)
+
+    cursors = []
+    try:
+        for content_type in content_types:
+            params = [like_pattern(keyword)] * (3 if CONTENT_TABLES[content_type][2] else 2)
+            if character_filter:
+                params.extend(character_keys)
+            if after is not None:
+                params.extend(after)
+            params.append(limit)
+            query = content_search_sql(content_type, bool(character_filter), sort_order, after is not None, key_slots)
+            cursors.append(conn.execute(query, params))
+
+        merged = heapq.merge(
+            *cursors,
+            key=lambda row: sort_key(row, sort_order, 'content'),
+            reverse=sort_order.endswith('_desc')
+        )
+        yield from islice(merged, limit)
+    finally:
+        for cursor in cursors:
+            cursor.close()
+
+
+def content_search(conn, params, timer=None):
+    """Search the content tables named by params['content_types'] through content_result_cache.
+
+    Returns ``(formatted_results, next_cursor, cache_hit)`` like cached_search.
+    """
+    timer = timer or RequestTimer()
+    cache_key = _cache_key(params)
+    with timer.phase('cache'):
+        cached = content_result_cache.get(cache_key, conn.version)
+    if cached is not None:
+        return cached[0], cached[1], True
+
+    sort_order, limit, after = params['sort_order'], params['limit'], params['after']
+    if after is not None:
+        scheme, after = after
+        if scheme != 'content':
+            raise ValueError(INVALID_CURSOR_MESSAGE)
+
+    with timer.phase('query'):
+        rows = list(iter_content_rows(
+            conn, params['keyword'], params['character_filter'], params['content_types'],
+            sort_order, limit + 1, after=after
+        ))
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort_order, sort_key(rows[-1], sort_order, 'content'), 'content')
+
+    with timer.phase('format'):
+        formatted_results = format_content_results(rows, params['format'])
+    content_result_cache.put(cache_key, conn.version, (formatted_results, next_cursor))
+    return formatted_results, next_cursor, False
+
+
+# Errors raised by snapshot connections, local (sqlite3) or remote (apsw)
+DATABASE_ERRORS = (sqlite3.DatabaseError,) + ((apsw.Error,) if apsw is not None else ())
+
+
+class SnapshotConnection(sqlite3.Connection):
+    """Read-only connection to one database snapshot"""
+
+    # Increases every time DatabaseCache opens a new snapshot
+    version = 0
+
+    # Whether the snapshot carries a usable FTS_TABLE
+    fts_enabled = False
+
+    # NgramIndex over this snapshot, built on first use
+    ngram_index = None
+
+    # 'normalized' when database_indexer.py added the sort key columns
+    sort_scheme = 'raw'
+
+    # Distinct character_key values, loaded on first character filter
+    character_keys = None
+
+
+def open_snapshot(path, table='script_lines'):
+    """Open a database snapshot for serving.
+
+    Snapshots are never written to (DatabaseCache swaps in new files with
+    a rename), so the file is opened ``immutable``: SQLite skips locking
+    and change detection entirely. The whole file is memory-mapped so
+    reads come straight from the OS page cache instead of being copied
+    into SQLite's own cache.
+    """
+    size = os.path.getsize(path)
+    conn = sqlite3.connect(
+        f'file:{urllib.request.pathname2url(path)}?mode=ro&immutable=1', uri=True,
+        check_same_thread=False, factory=SnapshotConnection,
+        cached_statements=STATEMENT_CACHE_SIZE
+    )
+    try:
+        conn.execute(f'PRAGMA mmap_size = {min(size, MMAP_LIMIT)}')
+        # Negative cache_size is in KiB; mmap serves most reads, so a
+        # fraction of the file is enough for interior B-tree pages
+        conn.execute(f'PRAGMA cache_size = -{max(2048, min(size // 8192, 65536))}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.execute('PRAGMA query_only = ON')
+        conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchall()
+    except sqlite3.DatabaseError:
+        conn.close()
+        raise
+    return conn
+
+
+class DatabaseCache:
+    """Process-level cache of the script database.
+
+    The database is downloaded once and kept open as a read-only
+    connection. After ``ttl`` seconds the next request revalidates the
+    local copy with a conditional GET (ETag / Last-Modified), so warm
+    searches never touch the network.
+
+    Downloads are single-flight: one request fetches into a temporary
+    file and renames it into place, while concurrent requests either keep
+    using the previous snapshot or, on a cold start, wait for that one
+    fetch instead of starting their own.
+    """
+
+    def __init__(self, url, path, ttl):
+        self.url = url
+        self.path = path
+        self.ttl = ttl
+        self.conn = None
+        self.version = 0
+        self.etag = None
+        self.last_modified = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+        # Held while a new snapshot is renamed into place, so open_reader()
+        # never pairs one snapshot's file with another's connection
+        self.swap_lock = threading.Lock()
+        self.inflight = None
+        self.error = None
+
+    def get_connection(self):
+        """Return the open connection, revalidating the local copy if stale"""
+        conn = self.conn
+        if conn is not None and time.monotonic() - self.checked_at < self.ttl:
+            return conn
+
+        with self.lock:
+            if self.conn is None:
+                self._open_existing()
+            if self.conn is not None and time.monotonic() - self.checked_at < self.ttl:
+                return self.conn
+            inflight = self.inflight
+            if inflight is None:
+                self.inflight = threading.Event()
+
+        if inflight is not None:
+            # Another request is already downloading
+            if self.conn is not None:
+                return self.conn
+            inflight.wait()
+            if self.conn is None:
+                raise self.error or RuntimeError('database download failed')
+            return self.conn
+
+        try:
+            self._refresh()
+        finally:
+            with self.lock:
+                self.checked_at = time.monotonic()
+                self.inflight.set()
+                self.inflight = None
+        return self.conn
+
+    def load(self):
+        """Serve the copy already at ``path`` as a new snapshot, without downloading.
+
+        For local databases (benchmarks, tests, a file fetched by other
+        means): the copy counts as fresh for ``ttl`` seconds. Returns the
+        connection.
+        """
+        conn = self._connect(self.path)
+        with self.swap_lock:
+            self._set_connection(conn)
+        self.checked_at = time.monotonic()
+        return conn
+
+    def _refresh(self):
+        try:
+            started = time.perf_counter()
+            download = self._download()
+            metrics.observe('download_ms', (time.perf_counter() - started) * 1000)
+            if download is not None:
+                started = time.perf_counter()
+                self._install(*download)
+                metrics.observe('open_ms', (time.perf_counter() - started) * 1000)
+            self.error = None
+        except (urllib.error.URLError, OSError) + DATABASE_ERRORS as e:
+            # Keep serving the previous snapshot if the new one is unusable
+            self.error = e
+            if self.conn is None:
+                raise
+
+    def _open_existing(self):
+        """Adopt a complete copy left by an earlier process, if there is one"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            self._set_connection(self._connect(self.path))
+        except sqlite3.DatabaseError:
+            return
+        self.last_modified = email.utils.formatdate(os.path.getmtime(self.path), usegmt=True)
+
+    def _download(self):
+        """Fetch the database if it changed; return ``(temp_path, etag, last_modified)``"""
+        request = urllib.request.Request(self.url)
+        if self.conn is not None:
+            if self.etag:
+                request.add_header('If-None-Match', self.etag)
+            if self.last_modified:
+                request.add_header('If-Modified-Since', self.last_modified)
+
+        temp_path = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with urllib.request.urlopen(request) as remote, open(temp_path, 'wb') as local:
+                expected = remote.headers.get('Content-Length')
+                written = 0
+                while True:
+                    chunk = remote.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    local.write(chunk)
+                    written += len(chunk)
+                if expected is not None and written != int(expected):
+                    raise OSError(f'incomplete download: {written} of {expected} bytes')
+                etag = remote.headers.get('ETag')
+                last_modified = remote.headers.get('Last-Modified')
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+        return temp_path, etag, last_modified
+
+    def _install(self, temp_path, etag, last_modified):
+        """Validate a downloaded copy and atomically swap it in"""
+        try:
+            self._connect(temp_path).close()
+        except sqlite3.DatabaseError:
+            os.unlink(temp_path)
+            raise
+        with self.swap_lock:
+            os.replace(temp_path, self.path)
+            # Requests still holding the old connection keep reading the old
+            # file; it is closed once the last of them drops its reference.
+            self._set_connection(self._connect(self.path))
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def open_reader(self):
+        """Open another connection to the current snapshot.
+
+        A connection runs one statement at a time, so servers that handle
+        requests on several threads give each thread its own reader. The
+        reader shares the snapshot's version, detected features and
+        n-gram index with the main connection.
+        """
+        with self.swap_lock:
+            primary = self.conn
+            if primary is None:
+                raise RuntimeError('database is not loaded')
+            conn = self._open_reader_connection()
+        conn.version = primary.version
+        conn.fts_enabled = primary.fts_enabled
+        conn.sort_scheme = primary.sort_scheme
+        conn.character_keys = primary.character_keys
+        if SEARCH_ENGINE == 'ngram':
+            conn.ngram_index = get_ngram_index(primary)
+        return conn
+
+    def _open_reader_connection(self):
+        # Called with swap_lock held, so the file is the primary connection's
+        return self._connect(self.path)
+
+    def _set_connection(self, conn):
+        # Use the trigram index only if the snapshot has one and this
+        # SQLite build can read it (FTS5 with the trigram tokenizer)
+        try:
+            conn.execute(f'SELECT rowid FROM {FTS_TABLE} LIMIT 0').fetchall()
+            conn.fts_enabled = True
+        except DATABASE_ERRORS:
+            conn.fts_enabled = False
+        try:
+            conn.execute('SELECT management_key, broadcast_date_key, row_key, character_key FROM script_lines LIMIT 0').fetchall()
+            conn.sort_scheme = 'normalized'
+        except DATABASE_ERRORS:
+            conn.sort_scheme = 'raw'
+        self.version += 1
+        conn.version = self.version
+        self.conn = conn
+
+    def _connect(self, path):
+        return open_snapshot(path)
+
+
+class RangePageStore:
+    """LRU store of fixed-size blocks of a remote file, filled by HTTP Range requests"""
+
+    def __init__(self, url, etag, size, block_size, max_bytes):
+        self.url = url
+        self.etag = etag
+        self.size = size
+        self.block_size = block_size
+        self.max_blocks = max(1, max_bytes // block_size)
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def read(self, amount, offset):
+        first = offset // self.block_size
+        last = min(offset + amount, self.size) - 1
+        if last < offset:
+            return b''
+        last //= self.block_size
+
+        with self.lock:
+            blocks = [self.blocks.get(index) for index in range(first, last + 1)]
+            for index in range(first, last + 1):
+                if index in self.blocks:
+                    self.blocks.move_to_end(index)
+
+        # Fetch each run of missing blocks with a single request
+        i = 0
+        while i < len(blocks):
+            if blocks[i] is not None:
+                i += 1
+                continue
+            j = i
+            while j < len(blocks) and blocks[j] is None:
+                j += 1
+            data = self._fetch((first + i) * self.block_size, (first + j) * self.block_size)
+            with self.lock:
+                for k in range(i, j):
+                    block = data[(k - i) * self.block_size:(k - i + 1) * self.block_size]
+                    blocks[k] = block
+                    self.blocks[first + k] = block
+                while len(self.blocks) > self.max_blocks:
+                    self.blocks.popitem(last=False)
+            i = j
+
+        start = offset - first * self.block_size
+        return b''.join(blocks)[start:start + amount]
+
+    def _fetch(self, start, end):
+        end = min(end, self.size)
+        request = urllib.request.Request(self.url, headers={'Range': f'bytes={start}-{end - 1}'})
+        if self.etag:
+            # A changed file comes back as a full 200 instead of a 206
+            request.add_header('If-Range', self.etag)
+        with urllib.request.urlopen(request) as remote:
+            if remote.status != 206:
+                raise OSError(f'remote database changed or range requests unsupported (HTTP {remote.status})')
+            data = remote.read()
+        if len(data) != end - start:
+            raise OSError(f'short range response: {len(data)} of {end - start} bytes')
+        with self.lock:
+            self.requests += 1
+            self.bytes_fetched += len(data)
+        return data
+
+
+class RangeFile:
+    """apsw file object that serves reads from a RangePageStore"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def xRead(self, amount, offset):
+        return self.store.read(amount, offset)
+
+    def xFileSize(self):
+        return self.store.size
+
+    def xWrite(self, data, offset):
+        raise apsw.ReadOnlyError('remote snapshots are read-only')
+
+    def xTruncate(self, newsize):
+        raise apsw.ReadOnlyError('remote snapshots are read-only')
+
+    def xSync(self, flags):
+        pass
+
+    def xLock(self, level):
+        pass
+
+    def xUnlock(self, level):
+        pass
+
+    def xCheckReservedLock(self):
+        return False
+
+    def xFileControl(self, op, ptr):
+        return False
+
+    def xSectorSize(self):
+        return 0
+
+    def xDeviceCharacteristics(self):
+        return 0
+
+    def xClose(self):
+        pass
+
+
+if apsw is not None:
+    class RangeVFS(apsw.VFS):
+        """SQLite VFS whose database file is a RangePageStore.
+
+        Only the main database open is served remotely. Temporary files
+        (sorter spills, temp tables) go to the default VFS; journals and
+        WAL files cannot exist for an immutable remote snapshot, so
+        opening one fails and their existence checks answer no.
+        """
+
+        TEMP_FILES = (
+            apsw.SQLITE_OPEN_TEMP_DB | apsw.SQLITE_OPEN_TEMP_JOURNAL
+            | apsw.SQLITE_OPEN_TRANSIENT_DB | apsw.SQLITE_OPEN_SUBJOURNAL
+        )
+
+        def __init__(self, name, store):
+            self.store = store
+            super().__init__(name, base='')
+
+        def xOpen(self, name, flags):
+            if flags[0] & apsw.SQLITE_OPEN_MAIN_DB:
+                flags[1] = apsw.SQLITE_OPEN_READONLY
+                return RangeFile(self.store)
+            if flags[0] & self.TEMP_FILES:
+                return super().xOpen(name, flags)
+            raise apsw.CantOpenError(f'remote snapshots have no {name} file')
+
+        def xAccess(self, pathname, flags):
+            return False
+
+    class RemoteSnapshotConnection(apsw.Connection):
+        """apsw counterpart of SnapshotConnection for remote snapshots"""
+
+        version = 0
+        fts_enabled = False
+        ngram_index = None
+        sort_scheme = 'raw'
+        character_keys = None
+
+        # The RemoteDatabaseCache that opened the connection, and its VFS
+        cache = None
+        vfs_name = None
+
+        def close(self, force=False):
+            super().close(force)
+            if self.cache is not None:
+                self.cache.connection_closed(self)
+
+
+class RemoteDatabaseCache(DatabaseCache):
+    """DatabaseCache that queries the remote snapshot in place.
+
+    Instead of downloading the whole file, each snapshot is opened through
+    a SQLite VFS that fetches only the pages a query touches, using HTTP
+    Range requests, and keeps them in a local LRU page store. With the
+    FTS index in place a cold query reads a few hundred KB. Revalidation
+    compares the ETag of a one-byte range probe; a changed ETag opens a
+    new snapshot with an empty page store.
+
+    Each snapshot has its own VFS. Older ones stay registered while a
+    connection still reads through them, and are unregistered, page store
+    and all, once the last of those connections is closed or dropped.
+    """
+
+    def __init__(self, url, ttl, block_size=REMOTE_BLOCK_SIZE, cache_size=REMOTE_CACHE_SIZE):
+        if apsw is None:
+            raise RuntimeError('SEARCH_DATABASE_MODE=remote requires the apsw package')
+        super().__init__(url, None, ttl)
+        self.block_size = block_size
+        self.cache_size = cache_size
+        # VFS name -> (RangeVFS, weak set of the connections open on it)
+        self.vfs = {}
+        self.vfs_name = None
+        self.vfs_lock = threading.Lock()
+
+    def get_connection(self):
+        conn = super().get_connection()
+        # Connections to an older snapshot may have been dropped since
+        if len(self.vfs) > 1:
+            self.release_unused_vfs()
+        return conn
+
+    def connection_closed(self, conn):
+        """Forget a closed connection, releasing its VFS if nothing else uses it"""
+        with self.vfs_lock:
+            entry = self.vfs.get(conn.vfs_name)
+            if entry is not None:
+                entry[1].discard(conn)
+        self.release_unused_vfs()
+
+    def release_unused_vfs(self):
+        """Unregister the VFS of every older snapshot no open connection uses"""
+        with self.vfs_lock:
+            for name, (vfs, connections) in list(self.vfs.items()):
+                if name != self.vfs_name and not connections:
+                    vfs.unregister()
+                    del self.vfs[name]
+
+    def _open_existing(self):
+        pass
+
+    def _download(self):
+        """Probe the remote file; return ``(size, etag, last_modified)`` if it changed"""
+        request = urllib.request.Request(self.url, headers={'Range': 'bytes=0-0'})
+        with urllib.request.urlopen(request) as remote:
+            remote.read()
+            content_range = remote.headers.get('Content-Range', '')
+            if remote.status != 206 or '/' not in content_range:
+                raise OSError('the database server does not support range requests')
+            etag = remote.headers.get('ETag')
+            last_modified = remote.headers.get('Last-Modified')
+        if self.conn is not None and (etag, last_modified) == (self.etag, self.last_modified):
+            return None
+        return int(content_range.rsplit('/', 1)[1]), etag, last_modified
+
+    def _install(self, size, etag, last_modified):
+        store = RangePageStore(self.url, etag, size, self.block_size, self.cache_size)
+        vfs_name = f'search-range-{id(self)}-{self.version + 1}'
+        with self.vfs_lock:
+            self.vfs[vfs_name] = (RangeVFS(vfs_name, store), weakref.WeakSet())
+        try:
+            conn = self._open_remote(vfs_name)
+        except BaseException:
+            with self.vfs_lock:
+                self.vfs.pop(vfs_name)[0].unregister()
+            raise
+        with self.swap_lock:
+            self._set_connection(conn)
+            self.vfs_name = vfs_name
+        self.etag = etag
+        self.last_modified = last_modified
+        self.release_unused_vfs()
+
+    def _open_reader_connection(self):
+        # Readers share the snapshot's VFS, and so its (thread-safe) page store
+        return self._open_remote(self.vfs_name)
+
+    def _open_remote(self, vfs_name):
+        """Open a connection to the snapshot served by VFS ``vfs_name``"""
+        vfs, connections = self.vfs[vfs_name]
+        conn = RemoteSnapshotConnection(
+            'file:snapshot.db?mode=ro&immutable=1',
+            flags=apsw.SQLITE_OPEN_READONLY | apsw.SQLITE_OPEN_URI,
+            vfs=vfs_name, statementcachesize=STATEMENT_CACHE_SIZE
+        )
+        try:
+            conn.execute('PRAGMA temp_store = MEMORY')
+            conn.execute('PRAGMA query_only = ON')
+            conn.execute('SELECT 1 FROM script_lines LIMIT 1').fetchall()
+        except BaseException:
+            conn.close()
+            raise
+        conn.page_store = vfs.store
+        conn.cache = self
+        conn.vfs_name = vfs_name
+        with self.vfs_lock:
+            connections.add(conn)
+        return conn
+
+
+class ReorganizedDatabaseCache(DatabaseCache):
+    """DatabaseCache for the database written by database_reorganizer.py"""
+
+    def _set_connection(self, conn):
+        conn.sort_scheme = 'content'
+        self.version += 1
+        conn.version = self.version
+        self.conn = conn
+
+    def _connect(self, path):
+        conn = open_snapshot(path, 'scripts')
+        try:
+            # Databases reorganized before scripts carried sort keys cannot be searched
+            conn.execute('SELECT management_key, broadcast_date_key FROM scripts LIMIT 0').fetchall()
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise
+        return conn
+
+
+if DATABASE_MODE == 'remote':
+    database_cache = RemoteDatabaseCache(DATABASE_URL, DATABASE_TTL)
+else:
+    database_cache = DatabaseCache(DATABASE_URL, DATABASE_PATH, DATABASE_TTL)
+
+if REORGANIZED_DATABASE_URL:
+    reorganized_cache = ReorganizedDatabaseCache(REORGANIZED_DATABASE_URL, REORGANIZED_DATABASE_PATH, DATABASE_TTL)
+else:
+    reorganized_cache = None
+
+CONTENT_SEARCH_UNAVAILABLE_MESSAGE = 'コンテンツ種別での検索は現在利用できません'
+SCRIPT_VIEW_UNAVAILABLE_MESSAGE = '台本の表示は現在利用できません'
+
+# One script's rows from script_timeline (built by database_reorganizer.py):
+# a seek on scripts.management_id, then one range scan of the timeline's
+# (script_id, row_number, ...) primary key
+SCRIPT_VIEW_SQL = """
+SELECT s.management_id, s.title, s.broadcast_date, s.script_url, t.row_number, t.content_type,
+       t.character_name, t.text, t.voice_instruction, t.filming_instruction
+FROM scripts s JOIN script_timeline t ON t.script_id = s.id
+WHERE s.management_id = ?{window}
+ORDER BY t.row_number, t.content_rank, t.content_id
+"""
+SCRIPT_SQL = SCRIPT_VIEW_SQL.format(window='')
+SCRIPT_WINDOW_SQL = SCRIPT_VIEW_SQL.format(window=' AND t.row_number BETWEEN ? AND ?')
+
+
+def parse_script_params(data):
+    """Normalize a script view request: ``script`` (management_id), optional ``row_number`` and ``window``"""
+    params = {
+        'script': str(data.get('script') or '').strip(),
+        'row_number': None,
+        'window': SCRIPT_WINDOW,
+        'error': None
+    }
+    try:
+        if data.get('row_number') not in (None, ''):
+            params['row_number'] = int(data['row_number'])
+        if data.get('window') not in (None, ''):
+            params['window'] = max(0, min(int(data['window']), MAX_LIMIT))
+    except (TypeError, ValueError):
+        params['error'] = 'row_numberとwindowには整数を指定してください'
+    if not params['script']:
+        params['error'] = '台本の管理番号を指定してください'
+    elif reorganized_cache is None:
+        params['error'] = SCRIPT_VIEW_UNAVAILABLE_MESSAGE
+    return params
+
+
+def script_response(data, get_connection, timer):
+    """Build the response to a script view request: the whole script, or the
+    rows within ``window`` rows of ``row_number`` (e.g. around a search hit)"""
+    params = parse_script_params(data)
+    if params['error']:
+        return {
+            'success': False,
+            'error': params['error']
+        }
+
+    script, row_number, window = params['script'], params['row_number'], params['window']
+    try:
+        with timer.phase('connect'):
+            conn = get_connection(content=True)
+        cache_key = ('script', script, row_number, window if row_number is not None else None)
+        with timer.phase('cache'):
+            cached = content_result_cache.get(cache_key, conn.version)
+        if cached is None:
+            with timer.phase('query'):
+                if row_number is None:
+                    rows = conn.execute(SCRIPT_SQL, (script,)).fetchall()
+                else:
+                    rows = conn.execute(SCRIPT_WINDOW_SQL, (script, row_number - window, row_number + window)).fetchall()
+            with timer.phase('format'):
+                cached = ([
+                    {
+                        'row_number': row[4],
+                        'content_type': row[5],
+                        'character_name': row[6] or '',
+                        'dialogue': row[7] or '',
+                        'voice_instruction': row[8] or '',
+                        'filming_instruction': row[9] or ''
+                    }
+                    for row in rows
+                ], rows[0][:4] if rows else None)
+            content_result_cache.put(cache_key, conn.version, cached)
+    except Exception as db_error:
+        return {
+            'success': False,
+            'error': database_error_message(db_error)
+        }
+
+    results, metadata = cached
+    if metadata is None:
+        return {
+            'success': False,
+            'error': f'台本が見つかりません: {script}'
+        }
+    response = {
+        'success': True,
+        'script': {
+            'management_id': metadata[0] or '',
+            'title': metadata[1] or '',
+            'broadcast_date': metadata[2] or '',
+            'script_url': metadata[3] or ''
+        },
+        'results': results,
+        'count': len(results)
+    }
+    if row_number is not None:
+        response['row_number'] = row_number
+        response['window'] = window
+    return response
+
+
+# Shown when a query runs past its deadline (see search_async_server.py)
+QUERY_TIMEOUT_MESSAGE = '検索がタイムアウトしました。キーワードを長くするか、キャラクターで絞り込んでください'
+
+
+def database_error_message(error):
+    """User-facing message for an error raised while searching"""
+    # Queries cut off by a deadline progress handler fail as 'interrupted'
+    if isinstance(error, DATABASE_ERRORS) and 'interrupted' in str(error):
+        return QUERY_TIMEOUT_MESSAGE
+    return f'データベースエラー: {str(error)}'
+
+
+def search_response(data, params, get_connection, timer):
+    """Build the JSON response to a search request body.
+
+    ``params`` is the parse_search_params() result, or None for a batch
+    request. ``get_connection()`` returns the snapshot connection to use,
+    and ``get_connection(content=True)`` the reorganized database's.
+    Bodies naming a ``script`` are script view requests (script_response).
+    """
+    if 'script' in data:
+        return script_response(data, get_connection, timer)
+    if params is None:
+        return batch_response(data['queries'], get_connection, timer)
+    if params['error']:
+        return {
+            'success': False,
+            'error': params['error']
+        }
+
+    # Search in real database from Dropbox (cached across requests)
+    try:
+        facets = None
+        if params['content_types']:
+            with timer.phase('connect'):
+                conn = get_connection(content=True)
+            if params['facets']:
+                formatted_results, next_cursor, cache_hit, facets = faceted_search(conn, params, timer)
+            else:
+                formatted_results, next_cursor, cache_hit = content_search(conn, params, timer)
+        else:
+            with timer.phase('connect'):
+                conn = get_connection()
+            if params['facets']:
+                formatted_results, next_cursor, cache_hit, facets = faceted_search(conn, params, timer)
+            else:
+                formatted_results, next_cursor, cache_hit = cached_search(conn, params, timer)
+        
+        response = {
+            'success': True,
+            'keyword': params['keyword'],
+            'character_filter': params['character_filter'],
+            'sort_order': params['sort_order'],
+            'limit': params['limit'],
+            'results': formatted_results,
+            'count': result_count(formatted_results),
+            'next_cursor': next_cursor,
+            'cache': dict((content_result_cache if params['content_types'] else result_cache).stats(), hit=cache_hit),
+            'database_info': f'検索対象: 完全なデータベース（258,137行の実際の台本データ）'
+        }
+        if params['format'] == 'compact':
+            response['format'] = 'compact'
+        if params['content_types']:
+            response['content_types'] = list(params['content_types'])
+        if facets is not None:
+            response['facets'] = facets
+        return response
+        
+    except Exception as db_error:
+        return {
+            'success': False,
+            'error': database_error_message(db_error)
+        }
+
+
+def response_rows(response, params):
+    """Number of result rows in a search_response() result, for metrics"""
+    if params is None and response['success']:
+        return sum(group.get('count', 0) for group in response['results'])
+    return response.get('count', 0)
+
+
+def batch_response(queries, get_connection, timer):
+    """Answer a batch of search specs, grouping results per spec"""
+    if len(queries) > MAX_BATCH_QUERIES:
+        return {
+            'success': False,
+            'error': f'一度に検索できるのは{MAX_BATCH_QUERIES}件までです'
+        }
+
+    specs = [
+        parse_search_params(spec if isinstance(spec, dict) else {}, MAX_LIMIT)
+        for spec in queries
+    ]
+    try:
+        with timer.phase('connect'):
+            conn = get_connection()
+        with timer.phase('query'):
+            outcomes = batch_search(conn, [spec for spec in specs if not spec['error'] and not spec['content_types']])
+        content_specs = [spec for spec in specs if not spec['error'] and spec['content_types']]
+        if content_specs:
+            with timer.phase('connect'):
+                content_conn = get_connection(content=True)
+            for spec in content_specs:
+                outcomes[id(spec)] = content_search(content_conn, spec, timer)[:2]
+    except Exception as db_error:
+        return {
+            'success': False,
+            'error': database_error_message(db_error)
+        }
+
+    grouped = []
+    for spec in specs:
+        if spec['error']:
+            grouped.append({
+                'success': False,
+                'keyword': spec['keyword'],
+                'error': spec['error']
+            })
+            continue
+        formatted_results, next_cursor = outcomes[id(spec)]
+        grouped.append({
+            'success': True,
+            'keyword': spec['keyword'],
+            'character_filter': spec['character_filter'],
+            'sort_order': spec['sort_order'],
+            'limit': spec['limit'],
+            'results': formatted_results,
+            'count': result_count(formatted_results),
+            'next_cursor': next_cursor
+        })
+        if spec['format'] == 'compact':
+            grouped[-1]['format'] = 'compact'
+        if spec['content_types']:
+            grouped[-1]['content_types'] = list(spec['content_types'])
+
+    return {
+        'success': True,
+        'results': grouped,
+        'count': len(grouped),
+        'cache': result_cache.stats()
+    }
+
+
+def stream_chunks(conn, connect_error, params, timer, outcome):
+    """Yield a search's results as NDJSON: one row object per line, then a summary line.
+
+    Rows are read from the cursor as chunks are consumed, so memory stays
+    flat and the first rows go out before the query has finished. The
+    summary line carries ``success``, ``count`` and ``next_cursor``; an
+    error part-way through is reported as a final ``success: false`` line.
+    The number of rows sent is left in ``outcome['count']``.
+    """
+    sort_order = params['sort_order']
+    limit = params['limit']
+    clock = time.perf_counter
+    buffer = []
+    buffered = 0
+    count = 0
+    next_cursor = None
+    try:
+        if connect_error is not None:
+            raise connect_error
+        if params['content_types']:
+            scheme, after = params['after'] or ('content', None)
+            if scheme != 'content':
+                raise ValueError(INVALID_CURSOR_MESSAGE)
+            rows = iter_content_rows(
+                conn, params['keyword'], params['character_filter'], params['content_types'],
+                sort_order, limit + 1, after=after
+            )
+        else:
+            rows = iter_search_rows(
+                conn, params['keyword'], params['character_filter'], sort_order, limit + 1, after=params['after']
+            )
+        last = None
+        while True:
+            started = clock()
+            row = next(rows, None)
+            timer.add('query', clock() - started)
+            if row is None:
+                break
+            if count == limit:
+                # The extra row only tells us another page exists
+                next_cursor = encode_cursor(sort_order, sort_key(last, sort_order, conn.sort_scheme), conn.sort_scheme)
+                break
+            started = clock()
+            result = format_row(row)
+            if params['content_types']:
+                result['content_type'] = CONTENT_TYPES[row[11]]
+            line = json.dumps(result, ensure_ascii=False).encode('utf-8') + b'\n'
+            timer.add('format', clock() - started)
+            buffer.append(line)
+            buffered += len(line)
+            count += 1
+            last = row
+            if buffered >= STREAM_CHUNK_SIZE:
+                outcome['count'] = count
+                yield b''.join(buffer)
+                buffer = []
+                buffered = 0
+        rows.close()
+        summary = {'success': True, 'count': count, 'next_cursor': next_cursor}
+    except Exception as db_error:
+        summary = {'success': False, 'count': count, 'error': database_error_message(db_error)}
+
+    buffer.append(json.dumps(summary, ensure_ascii=False).encode('utf-8') + b'\n')
+    outcome['count'] = count
+    yield b''.join(buffer)
+
 
 class handler(BaseHTTPRequestHandler):
+    def _get_connection(self, content=False):
+        # Overridden by search_server.py to hand out pooled per-thread readers;
+        # content=True asks for the reorganized database
+        return (reorganized_cache if content else database_cache).get_connection()
+
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_GET(self):
+        """GET ?metrics dumps the in-process latency histograms;
+        GET ?script=<management_id>[&row_number=N&window=W] returns a script view"""
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query, keep_blank_values=True)
+        timer = RequestTimer()
+        script_view = 'script' in query and 'metrics' not in query
+        cache_control = 'no-store'
+        if 'metrics' in query:
+            status, response = 200, metrics.snapshot()
+        elif script_view:
+            status, response = 200, script_response(
+                {name: values[0] for name, values in query.items()}, self._get_connection, timer
+            )
+            if response['success']:
+                # Views only change when a new snapshot is published
+                cache_control = f'public, max-age={DATABASE_TTL}'
+        else:
+            status, response = 404, {'success': False, 'error': '不明なエンドポイントです'}
+        with timer.phase('encode'):
+            body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        raw_size = len(body)
+        encoding = None
+        if raw_size >= COMPRESSION_MIN_BYTES:
+            encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+        if encoding:
+            with timer.phase('compress'):
+                body = compress_body(body, encoding)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', cache_control)
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        if script_view:
+            self.send_header('Server-Timing', timer.server_timing())
+            self.send_header('Timing-Allow-Origin', '*')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
+        with timer.phase('write'):
+            self.wfile.write(body)
+        if script_view:
+            metrics.record_request(timer, response.get('count', 0), len(body), raw_size)
     
     def do_POST(self):
+        timer = RequestTimer()
         try:
-            # Set headers
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json; charset=utf-8')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
             # Read request body
             content_length = int(self.headers.get('Content-Length', 0))
             if content_length > 0:
@@ -32,111 +2285,125 @@ class handler(BaseHTTPRequestHandler):
             else:
                 data = {}
             
-            # Get search parameters
-            keyword = data.get('keyword', '').strip()
-            character_filter = data.get('character_filter', '').strip()
-            sort_order = data.get('sort_order', 'management_id_asc')
-            limit = data.get('limit', 50)
+            # NDJSON streaming is requested with a flag or an Accept header
+            stream = bool(data.get('stream')) or 'application/x-ndjson' in self.headers.get('Accept', '')
             
-            if not keyword:
-                response = {
-                    'success': False,
-                    'error': 'キーワードを入力してください'
-                }
+            # Batch requests carry a list of search specs under 'queries'
+            if isinstance(data.get('queries'), list):
+                params = None
             else:
-                # Search in real database from Dropbox
-                try:
-                    # Dropbox direct download URL
-                    dropbox_url = 'https://www.dropbox.com/scl/fi/jrns72qaqx1xu79yq3ndj/youtube_search_complete_all.db?rlkey=9jg1jmc4obzbtyc3ofn8yf2od&st=ijyc2fsc&dl=1'
-                    
-                    # Download database to temporary file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix='.db') as temp_db:
-                        urllib.request.urlretrieve(dropbox_url, temp_db.name)
-                        db_path = temp_db.name
-                    
-                    # Connect and search
-                    conn = sqlite3.connect(db_path)
-                    cursor = conn.cursor()
-                    
-                    # Build dynamic query
-                    base_query = """
-                    SELECT management_id, title, broadcast_date, character_name, dialogue, voice_instruction, filming_instruction, editing_instruction, script_url, row_number
-                    FROM script_lines 
-                    WHERE (dialogue LIKE ? OR character_name LIKE ? OR title LIKE ?)
-                    """
-                    
-                    query_params = [f'%{keyword}%', f'%{keyword}%', f'%{keyword}%']
-                    
-                    # Add character filter
-                    if character_filter:
-                        base_query += " AND character_name LIKE ?"
-                        query_params.append(f'%{character_filter}%')
-                    
-                    # Add sorting
-                    sort_map = {
-                        'management_id_asc': 'ORDER BY management_id ASC',
-                        'management_id_desc': 'ORDER BY management_id DESC',
-                        'broadcast_date_asc': 'ORDER BY broadcast_date ASC',
-                        'broadcast_date_desc': 'ORDER BY broadcast_date DESC'
-                    }
-                    
-                    order_clause = sort_map.get(sort_order, 'ORDER BY management_id ASC')
-                    base_query += f" {order_clause} LIMIT ?"
-                    query_params.append(limit)
-                    
-                    cursor.execute(base_query, query_params)
-                    results = cursor.fetchall()
-                    conn.close()
-                    
-                    # Clean up temporary file
-                    os.unlink(db_path)
-                    
-                    # Format results
-                    formatted_results = []
-                    for row in results:
-                        formatted_results.append({
-                            'management_id': row[0] or '',
-                            'title': row[1] or '',
-                            'broadcast_date': row[2] or '',
-                            'character_name': row[3] or '',
-                            'dialogue': row[4] or '',
-                            'voice_instruction': row[5] or '',
-                            'filming_instruction': row[6] or '',
-                            'editing_instruction': row[7] or '',
-                            'script_url': row[8] or '',
-                            'row_number': row[9] or 0
-                        })
-                    
-                    response = {
-                        'success': True,
-                        'keyword': keyword,
-                        'character_filter': character_filter,
-                        'sort_order': sort_order,
-                        'limit': limit,
-                        'results': formatted_results,
-                        'count': len(formatted_results),
-                        'database_info': f'検索対象: 完全なデータベース（258,137行の実際の台本データ）'
-                    }
-                    
-                except Exception as db_error:
-                    response = {
-                        'success': False,
-                        'error': f'データベースエラー: {str(db_error)}'
-                    }
+                params = parse_search_params(data, MAX_STREAM_LIMIT if stream else MAX_LIMIT)
             
-            # Send response
-            response_json = json.dumps(response, ensure_ascii=False)
-            self.wfile.write(response_json.encode('utf-8'))
+            if stream and params is not None and not params['error']:
+                self._stream_results(params, timer)
+                return
             
-        except Exception as e:
-            # Error response
-            self.send_response(500)
-            self.send_header('Content-Type', 'application/json')
+            response = search_response(data, params, self._get_connection, timer)
+            
+            with timer.phase('encode'):
+                body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+            
+            # Compress larger bodies if the client accepts it
+            raw_size = len(body)
+            encoding = None
+            if raw_size >= COMPRESSION_MIN_BYTES:
+                encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+            if encoding:
+                with timer.phase('compress'):
+                    body = compress_body(body, encoding)
+            
+            # Set headers
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
             self.send_header('Access-Control-Allow-Origin', '*')
+            if encoding:
+                self.send_header('Content-Encoding', encoding)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Server-Timing', timer.server_timing())
+            self.send_header('Timing-Allow-Origin', '*')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
             
+            # Send response
+            with timer.phase('write'):
+                self.wfile.write(body)
+            metrics.record_request(timer, response_rows(response, params), len(body), raw_size)
+            
+        except Exception as e:
+            # Error response
             error_response = {
                 'success': False,
                 'error': f'サーバーエラー: {str(e)}'
             }
-            self.wfile.write(json.dumps(error_response, ensure_ascii=False).encode('utf-8'))
\ No newline at end of file
+            error_body = json.dumps(error_response, ensure_ascii=False).encode('utf-8')
+            
+            self.send_response(500)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.send_header('Content-Length', str(len(error_body)))
+            self.end_headers()
+            self.wfile.write(error_body)
+
+    def _stream_results(self, params, timer):
+        """Write results as NDJSON (see stream_chunks) with chunked encoding.
+
+        The size is not known up front, so the stream is compressed whenever
+        the client accepts it; each chunk is flushed through the encoder.
+        Server-Timing can only cover the connect phase; the rest goes to metrics.
+        """
+        conn = None
+        connect_error = None
+        try:
+            with timer.phase('connect'):
+                conn = self._get_connection(content=bool(params['content_types']))
+        except Exception as e:
+            connect_error = e
+
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            self.protocol_version = 'HTTP/1.1'
+        self.send_response(200)
+        encoding = negotiate_encoding(self.headers.get('Accept-Encoding'))
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.send_header('Server-Timing', timer.server_timing())
+        self.send_header('Timing-Allow-Origin', '*')
+        self.end_headers()
+
+        bytes_written = 0
+        raw_bytes = 0
+        clock = time.perf_counter
+        outcome = {}
+        compressor = ResponseCompressor(encoding) if encoding else None
+
+        def write(data):
+            nonlocal bytes_written
+            if not data:
+                # An empty chunk would end a chunked body
+                return
+            started = clock()
+            if chunked:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            else:
+                self.wfile.write(data)
+            bytes_written += len(data)
+            timer.add('write', clock() - started)
+
+        for data in stream_chunks(conn, connect_error, params, timer, outcome):
+            raw_bytes += len(data)
+            if compressor is not None:
+                started = clock()
+                data = compressor.compress(data, flush=True)
+                timer.add('compress', clock() - started)
+            write(data)
+        if compressor is not None:
+            write(compressor.finish())
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+        metrics.record_request(timer, outcome['count'], bytes_written, raw_bytes)
@@ -0,0 +1,11 @@
+"""
+Search benchmarks for the SunSun script database.
+
+- corpus: generates synthetic script_lines databases at a chosen scale
+- harness: replays a query mix against api/search.py and records results
+
+Typical run from the repository root:
+
+    python -m benchmarks.corpus --rows 258137 --output /tmp/bench.db --indexes
+    python -m benchmarks.harness --database /tmp/bench.db --output results.json
+"""
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Synthetic Script Corpus Generator
+
+Builds a script_lines database that looks like youtube_search_complete_all.db
+at any scale (10k to 5M rows), so search performance can be measured without
+the real Dropbox database. Distributions follow database_analysis_report.md:
+
+- dialogue_column: E 45.5%, F 20.1%, G 10.2%, H 7.9%, D 5.0%, C 4.5%, ...
+- content: ~91% scene descriptions, ~5% character dialogue, ~2% technical
+  notes, ~1.5% visual effects, ~0.5% audio instructions
+- characters: サンサン > くもりん > ツクモ > ノイズ > プリル, on dialogue rows only
+- management_id: a short A-series (A01...) followed by B-series (B1000...)
+
+Usage:
+    python -m benchmarks.corpus --rows 258137 --output bench.db [--indexes]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+from typing import Iterator, List, Tuple
+
+SCHEMA_SQL = """
+CREATE TABLE script_lines (
+    id INTEGER PRIMARY KEY,
+    management_id TEXT,
+    title TEXT,
+    broadcast_date TEXT,
+    character_name TEXT,
+    dialogue TEXT,
+    voice_instruction TEXT,
+    filming_instruction TEXT,
+    editing_instruction TEXT,
+    script_url TEXT,
+    row_number INTEGER,
+    dialogue_column TEXT,
+    source_sheet TEXT
+);
+"""
+
+COLUMN_WEIGHTS = {
+    'E': 117539, 'F': 51778, 'G': 26252, 'H': 20394, 'D': 12963, 'C': 11500,
+    'I': 9474, 'J': 5773, 'B': 2457, 'M': 4, 'A': 2, 'K': 1
+}
+
+CONTENT_WEIGHTS = {
+    'scene': 91.3, 'dialogue': 4.7, 'tech': 2.0, 'visual': 1.5, 'audio': 0.5
+}
+
+CHARACTER_WEIGHTS = {
+    'サンサン': 5701, 'くもりん': 4433, 'ツクモ': 1273, 'ノイズ': 884, 'プリル': 300
+}
+
+# Average spreadsheet rows per script
+ROWS_PER_SCRIPT = 320
+
+TOPICS = [
+    'クリスマス', 'ハロウィン', 'おにぎり', 'きょうりゅう', 'でんしゃ', 'はみがき', 'おばけ',
+    'うんどうかい', 'おつきみ', 'ひなまつり', 'かぶとむし', 'すいか', 'ゆきだるま', 'たなばた',
+    'パトカー', 'しょうぼうしゃ', 'アイスクリーム', 'おりがみ', 'にじ', 'かくれんぼ'
+]
+PLACES = ['こうえん', 'プール', 'キッチン', 'スタジオ', 'もり', 'うみ', 'おへや', 'ステージ']
+ACTIONS = ['あそんで', 'おどって', 'うたって', 'はしって', 'わらって', 'さがして', 'ねむって']
+OBJECTS = ['ペットボトル', 'ボール', 'ぬいぐるみ', 'かさ', 'ふうせん', 'つみき', 'えほん']
+
+DIALOGUE_TEMPLATES = [
+    'こんにちは！きょうは{topic}のおはなしだよ♪',
+    'わーい！{topic}だいすき！',
+    '{topic}って、なにかな？',
+    'みんなもいっしょに{action}みよう！',
+    'あれれ？{object}がないよ〜',
+    'せーの！{topic}！',
+    'すごいね！{place}でみつけたよ！',
+    'またあしたね〜♪',
+]
+SCENE_TEMPLATES = [
+    '{character}が{place}で{action}いる',
+    '{character}は{object}をもってとうじょうする',
+    '{place}の全体像。{character}が手をあげる',
+    'カメラは{character}をアップで撮影',
+    '{object}が{place}にころがっている様子',
+    '{character}と{character2}が{topic}について話している',
+]
+TECH_TEMPLATES = [
+    '※撮影時は{object}の位置に注意',
+    '★編集で{topic}のシーンをカット',
+    '撮影メモ：{place}は午前中に撮影',
+    '参考資料 https://example.com/{topic_id}',
+]
+VISUAL_TEMPLATES = [
+    'テロップ「{topic}」',
+    'キラキラのエフェクトをかける',
+    'フェードアウトして{place}へ',
+    'CGで{object}がぼわんとあらわれる',
+    'スローモーションで{character}がジャンプ',
+]
+AUDIO_TEMPLATES = [
+    'BGM：audiostock_{number}',
+    'SE ドンッ',
+    '効果音 シャキーン',
+    '音楽 {topic}のうた',
+    'SE：キキーッ gigafile.nu/{number}.mp3',
+]
+
+
+def _weighted(rng: random.Random, weights: dict):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+class CorpusGenerator:
+    """Generates rows for a synthetic script_lines table"""
+
+    def __init__(self, rows: int, seed: int = 0):
+        self.rows = rows
+        self.rng = random.Random(seed)
+        self.script_count = max(1, rows // ROWS_PER_SCRIPT)
+
+    def scripts(self) -> List[Tuple[str, str, str, str, str]]:
+        """Return (management_id, title, broadcast_date, script_url, source_sheet) per script"""
+        rng = self.rng
+        a_series = min(99, max(1, self.script_count // 20))
+        scripts = []
+        start = date(2019, 4, 1)
+        for index in range(self.script_count):
+            if index < a_series:
+                management_id = f'A{index + 1:02d}'
+            else:
+                management_id = f'B{1000 + index - a_series}'
+            topic = rng.choice(TOPICS)
+            title = rng.choice(['{t}のうた', 'みんなで{t}', '{t}であそぼう', 'サンサンと{t}']).format(t=topic)
+            # Broadcasts are roughly every two days, with occasional gaps
+            broadcast = start + timedelta(days=index * 2 + rng.randint(0, 1))
+            scripts.append((
+                management_id,
+                title,
+                broadcast.strftime('%y/%m/%d'),
+                f'https://docs.google.com/spreadsheets/d/{rng.getrandbits(64):016x}',
+                f'sheet_{index // 50 + 1}'
+            ))
+        return scripts
+
+    def rows_iter(self) -> Iterator[Tuple]:
+        """Yield script_lines rows (without id) in management_id, row_number order"""
+        rng = self.rng
+        scripts = self.scripts()
+        for index in range(self.rows):
+            # Rows are spread evenly across scripts, one script after another
+            yield self._row(rng, scripts[index * len(scripts) // self.rows])
+
+    def _row(self, rng: random.Random, script: Tuple) -> Tuple:
+        management_id, title, broadcast_date, script_url, source_sheet = script
+        kind = _weighted(rng, CONTENT_WEIGHTS)
+        values = {
+            'topic': rng.choice(TOPICS),
+            'topic_id': rng.randint(1, 9999),
+            'place': rng.choice(PLACES),
+            'action': rng.choice(ACTIONS),
+            'object': rng.choice(OBJECTS),
+            'character': _weighted(rng, CHARACTER_WEIGHTS),
+            'character2': _weighted(rng, CHARACTER_WEIGHTS),
+            'number': rng.randint(100000, 999999),
+        }
+
+        character_name = ''
+        voice_instruction = filming_instruction = editing_instruction = ''
+        if kind == 'dialogue':
+            character_name = values['character']
+            text = rng.choice(DIALOGUE_TEMPLATES).format(**values)
+            if rng.random() < 0.2:
+                voice_instruction = rng.choice(['げんきに', 'ささやくように', 'ゆっくり'])
+        elif kind == 'scene':
+            text = rng.choice(SCENE_TEMPLATES).format(**values)
+            if rng.random() < 0.05:
+                filming_instruction = rng.choice(['引きで撮影', '手元アップ', '固定カメラ'])
+        elif kind == 'tech':
+            text = rng.choice(TECH_TEMPLATES).format(**values)
+            if rng.random() < 0.3:
+                editing_instruction = rng.choice(['カット', 'テンポアップ', '色調整'])
+        elif kind == 'visual':
+            text = rng.choice(VISUAL_TEMPLATES).format(**values)
+        else:
+            text = rng.choice(AUDIO_TEMPLATES).format(**values)
+
+        return (
+            management_id, title, broadcast_date, character_name, text,
+            voice_instruction, filming_instruction, editing_instruction,
+            script_url, _weighted(rng, COLUMN_WEIGHTS), source_sheet
+        )
+
+    def write(self, path: str, batch_size: int = 10000) -> int:
+        """Write the corpus to a new SQLite database at path; return rows written"""
+        if os.path.exists(path):
+            os.unlink(path)
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.executescript(SCHEMA_SQL)
+
+        written = 0
+        batch = []
+        row_number = 0
+        previous_id = None
+        for row in self.rows_iter():
+            # Spreadsheet rows restart at 1 for each script
+            row_number = row_number + 1 if row[0] == previous_id else 1
+            previous_id = row[0]
+            batch.append(row[:9] + (row_number,) + row[9:])
+            if len(batch) >= batch_size:
+                written += self._insert(conn, batch)
+                batch = []
+        if batch:
+            written += self._insert(conn, batch)
+
+        conn.commit()
+        conn.close()
+        return written
+
+    def _insert(self, conn: sqlite3.Connection, batch: List[Tuple]) -> int:
+        conn.executemany("""
+            INSERT INTO script_lines
+            (management_id, title, broadcast_date, character_name, dialogue, voice_instruction,
+             filming_instruction, editing_instruction, script_url, row_number, dialogue_column, source_sheet)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+        return len(batch)
+
+
+def main():
+    """Main execution function"""
+
+    parser = argparse.ArgumentParser(description='Generate a synthetic script_lines database')
+    parser.add_argument('--rows', type=int, default=258137, help='rows to generate (10k to 5M)')
+    parser.add_argument('--output', default='bench_corpus.db', help='database file to create')
+    parser.add_argument('--seed', type=int, default=0, help='random seed, for reproducible corpora')
+    parser.add_argument('--indexes', action='store_true',
+                        help='also run the database_indexer.py build stages (FTS5, normalized columns)')
+    args = parser.parse_args()
+
+    started = time.time()
+    written = CorpusGenerator(args.rows, args.seed).write(args.output)
+    print(f"Generated {written:,} rows in {time.time() - started:.1f}s: {args.output}")
+
+    if args.indexes:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from database_indexer import SearchIndexBuilder
+
+        builder = SearchIndexBuilder(args.output)
+        try:
+            if builder.fts5_available():
+                result = builder.build_fts_index()
+                print(f"FTS5 index: {result['indexed_rows']:,} rows in {result['seconds']}s")
+            result = builder.build_normalized_columns()
+            print(f"Normalized columns: {result['updated_rows']:,} rows in {result['seconds']}s")
+        finally:
+            builder.close()
+
+
+if __name__ == "__main__":
+    main()
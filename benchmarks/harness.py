@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Search Load Harness
+
+Serves api/search.py on a local HTTP server backed by a corpus database
+(see benchmarks/corpus.py), replays a reproducible query mix against it
+and writes throughput, client-side latency percentiles and the API's own
+per-phase metrics as JSON, so runs can be compared across changes. With
+SEARCH_ENGINE=ngram the n-gram index's build time and retained memory are
+recorded as well.
+
+The query mix is generated from --seed, or loaded with --mix-file so the
+exact same requests can be replayed later. Pass --baseline with an earlier
+results file to print the change in each headline number.
+
+Usage:
+    python -m benchmarks.harness --database bench.db --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Common terms from the corpus vocabulary, plus short (1-2 character) terms
+# that cannot use the trigram index and fall back to LIKE scans
+COMMON_TERMS = ['クリスマス', 'おにぎり', 'ハロウィン', 'こうえん', 'ペットボトル', 'エフェクト', 'テロップ', '撮影']
+SHORT_TERMS = ['SE', 'BGM', 'ボ', 'うみ', 'CG', 'かさ']
+RARE_TERMS = ['gigafile', 'audiostock', 'シャキーン', 'スローモーション']
+MISSING_TERMS = ['存在しないキーワード', 'zzzz']
+CHARACTERS = ['サンサン', 'くもりん', 'ツクモ', 'ノイズ']
+SORT_ORDERS = ['management_id_asc', 'management_id_desc', 'broadcast_date_asc', 'broadcast_date_desc']
+
+# Share of requests drawn from each group of terms
+TERM_GROUPS = [(COMMON_TERMS, 0.55), (SHORT_TERMS, 0.25), (RARE_TERMS, 0.15), (MISSING_TERMS, 0.05)]
+
+
+def generate_mix(count: int, seed: int = 0) -> List[Dict]:
+    """Build a list of search request bodies"""
+    rng = random.Random(seed)
+    groups = [group for group, _ in TERM_GROUPS]
+    weights = [weight for _, weight in TERM_GROUPS]
+    mix = []
+    for _ in range(count):
+        body = {
+            'keyword': rng.choice(rng.choices(groups, weights=weights)[0]),
+            'sort_order': rng.choice(SORT_ORDERS),
+            'limit': rng.choice([20, 50, 50, 50, 100, 500])
+        }
+        if rng.random() < 0.2:
+            body['character_filter'] = rng.choice(CHARACTERS)
+        mix.append(body)
+    return mix
+
+
+def start_server(database: str, workdir: str, cache: bool):
+    """Import api/search.py configured for the corpus and serve it on a free port"""
+    # The API reads its configuration from the environment at import time
+    os.environ['SEARCH_DATABASE_URL'] = 'file://' + os.path.abspath(database)
+    os.environ['SEARCH_DATABASE_PATH'] = os.path.join(workdir, os.path.basename(database))
+    os.environ['SEARCH_DATABASE_TTL'] = str(24 * 3600)
+    if not cache:
+        os.environ['SEARCH_RESULT_CACHE_SIZE'] = '0'
+
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api'))
+    import search
+
+    # Load the snapshot before timing starts
+    search.database_cache.get_connection()
+
+    class QuietHandler(search.handler):
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), QuietHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, search
+
+
+def post(url: str, body: Dict) -> Dict:
+    """Send one search request; return status, row count and timings"""
+    data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        payload = response.read()
+    elapsed = time.perf_counter() - started
+    result = json.loads(payload.decode('utf-8'))
+    return {
+        'ms': elapsed * 1000,
+        'success': bool(result.get('success')),
+        'rows': result.get('count', 0),
+        'bytes': len(payload)
+    }
+
+
+def percentile(ordered: List[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, -(-len(ordered) * percent // 100) - 1))
+    return ordered[int(index)]
+
+
+def run(url: str, mix: List[Dict], requests: int, concurrency: int, warmup: int) -> Dict:
+    """Replay the mix (cycling as needed) and summarize the client-side view"""
+    bodies = [mix[index % len(mix)] for index in range(requests)]
+    for body in bodies[:warmup]:
+        post(url, body)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(lambda body: post(url, body), bodies))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(sample['ms'] for sample in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if not sample['success']),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'rows_returned': sum(sample['rows'] for sample in samples),
+        'bytes_received': sum(sample['bytes'] for sample in samples),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(latencies[-1], 3) if latencies else 0.0
+        }
+    }
+
+
+def describe_database(path: str) -> Dict:
+    """Row count and search indexes present in the corpus"""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        rows = conn.execute('SELECT COUNT(*) FROM script_lines').fetchone()[0]
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(script_lines)')}
+    finally:
+        conn.close()
+    return {
+        'path': os.path.abspath(path),
+        'bytes': os.path.getsize(path),
+        'rows': rows,
+        'fts': 'script_lines_fts' in tables,
+        'normalized_columns': 'management_key' in columns
+    }
+
+
+def measure_ngram_index(search) -> Optional[Dict]:
+    """Build the n-gram index (SEARCH_ENGINE=ngram) and report its build time and size"""
+    if search.SEARCH_ENGINE != 'ngram':
+        return None
+    conn = search.database_cache.get_connection()
+    started = time.perf_counter()
+    index = search.get_ngram_index(conn)
+    seconds = time.perf_counter() - started
+    size = sum(sys.getsizeof(value) for value in (
+        index.postings, index.offsets, index.rowids, index.date_rank, index.character_ids, index.slots
+    ))
+    size += sum(sys.getsizeof(text) for text in index.slots) + sum(sys.getsizeof(name) for name in index.characters)
+    return {'build_seconds': round(seconds, 2), 'bytes': size}
+
+
+def compare(current: Dict, baseline: Dict):
+    """Print the change in throughput and latency against an earlier run"""
+    def change(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else 'n/a'
+
+    now, before = current['client'], baseline['client']
+    print(f"\nAgainst baseline ({baseline['meta'].get('started_at', '?')}):")
+    print(f"   requests/s: {before['requests_per_second']} -> {now['requests_per_second']} "
+          f"({change(now['requests_per_second'], before['requests_per_second'])})")
+    for name in ('p50', 'p95', 'p99'):
+        print(f"   {name} ms: {before['latency_ms'][name]} -> {now['latency_ms'][name]} "
+              f"({change(now['latency_ms'][name], before['latency_ms'][name])})")
+
+
+def main():
+    """Main execution function"""
+
+    parser = argparse.ArgumentParser(description='Replay a query mix against api/search.py')
+    parser.add_argument('--database', required=True, help='corpus database (benchmarks/corpus.py)')
+    parser.add_argument('--requests', type=int, default=500, help='timed requests to send')
+    parser.add_argument('--concurrency', type=int, default=4, help='concurrent client threads')
+    parser.add_argument('--warmup', type=int, default=20, help='untimed requests sent first')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the generated query mix')
+    parser.add_argument('--mix-file', help='load the query mix from this JSON file, or save it there if missing')
+    parser.add_argument('--no-cache', action='store_true', help='disable the API result cache')
+    parser.add_argument('--output', help='write results JSON here')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    mix: Optional[List[Dict]] = None
+    if args.mix_file and os.path.exists(args.mix_file):
+        with open(args.mix_file, encoding='utf-8') as f:
+            mix = json.load(f)
+    else:
+        mix = generate_mix(max(args.requests, 1), args.seed)
+        if args.mix_file:
+            with open(args.mix_file, 'w', encoding='utf-8') as f:
+                json.dump(mix, f, ensure_ascii=False, indent=1)
+
+    print("SunSun Script Search Benchmark")
+    print("==============================")
+    database = describe_database(args.database)
+    print(f"Database: {database['path']} ({database['rows']:,} rows, "
+          f"fts={database['fts']}, normalized={database['normalized_columns']})")
+
+    workdir = tempfile.mkdtemp(prefix='search-bench-')
+    try:
+        started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        server, search = start_server(args.database, workdir, cache=not args.no_cache)
+        ngram_index = measure_ngram_index(search)
+        if ngram_index:
+            print(f"N-gram index: {ngram_index['bytes'] / 2**20:.1f} MB, built in {ngram_index['build_seconds']}s")
+        url = f'http://127.0.0.1:{server.server_address[1]}/'
+        try:
+            client = run(url, mix, args.requests, args.concurrency, args.warmup)
+            server_metrics = search.metrics.snapshot()
+        finally:
+            server.shutdown()
+            server.server_close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        'meta': {
+            'started_at': started_at,
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'engine': os.environ.get('SEARCH_ENGINE', 'sqlite'),
+            'result_cache': not args.no_cache,
+            'concurrency': args.concurrency,
+            'warmup': args.warmup,
+            'seed': args.seed,
+            'mix_size': len(mix),
+            'database': database,
+            'ngram_index': ngram_index
+        },
+        'client': client,
+        'server': server_metrics
+    }
+
+    latency = client['latency_ms']
+    print(f"\n{client['requests']:,} requests in {client['seconds']}s: {client['requests_per_second']} req/s, "
+          f"{client['errors']} errors")
+    print(f"Latency ms: p50 {latency['p50']}, p95 {latency['p95']}, p99 {latency['p99']}, max {latency['max']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
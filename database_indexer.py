@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Search Index Builder for SunSun Script Database
+
+This script prepares youtube_search_complete_all.db for serving by api/search.py:
+1. FTS5 full-text index (trigram tokenizer) over dialogue, character_name and title
+2. Normalized sort/filter columns with composite indexes, so ORDER BY ... LIMIT
+   is served straight from an index and character filters become index seeks
+
+Run it against the database before uploading it to Dropbox. The API detects
+both stages automatically and falls back to LIKE scans and raw-text sorting
+when they are missing.
+"""
+
+import re
+import sqlite3
+import time
+from typing import Dict, Optional
+
+FTS_TABLE = 'script_lines_fts'
+
+# Normalized columns added to script_lines: name -> (type, SQL expression)
+NORMALIZED_COLUMNS = {
+    'management_key': ('TEXT', 'normalize_management_id(management_id)'),
+    'broadcast_date_key': ('INTEGER', 'normalize_broadcast_date(broadcast_date)'),
+    'row_key': ('INTEGER', 'COALESCE(row_number, 0)'),
+    'character_key': ('TEXT', "TRIM(COALESCE(character_name, ''))"),
+}
+
+# Composite indexes matching the ORDER BY clauses used by api/search.py
+NORMALIZED_INDEXES = {
+    'idx_script_lines_management_key': 'management_key, row_key',
+    'idx_script_lines_broadcast_date_key': 'broadcast_date_key, management_key, row_key',
+    'idx_script_lines_character_management': 'character_key, management_key, row_key',
+    'idx_script_lines_character_broadcast_date': 'character_key, broadcast_date_key, management_key, row_key',
+}
+
+
+def normalize_management_id(management_id: Optional[str]) -> str:
+    """Sortable key for IDs like 'A01' and 'B1039': series, then zero-padded number"""
+    if not management_id:
+        return ''
+    match = re.match(r'^\s*([A-Za-z]*)(\d+)(.*)$', management_id)
+    if not match:
+        return management_id.strip()
+    series, number, rest = match.groups()
+    return f"{series.upper()}{int(number):08d}{rest}"
+
+
+def normalize_broadcast_date(broadcast_date: Optional[str]) -> int:
+    """Integer YYYYMMDD key for dates like '25/08/18' (YY/MM/DD); 0 if unparseable"""
+    if not broadcast_date:
+        return 0
+    match = re.match(r'^\s*(\d{2}|\d{4})[/\-.](\d{1,2})[/\-.](\d{1,2})', broadcast_date)
+    if not match:
+        return 0
+    year, month, day = (int(part) for part in match.groups())
+    if year < 100:
+        year += 2000
+    return year * 10000 + month * 100 + day
+
+
+class SearchIndexBuilder:
+    """Builds the search indexes used by api/search.py"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+
+    def fts5_available(self) -> bool:
+        """Check that this SQLite build supports FTS5 with the trigram tokenizer"""
+        try:
+            self.conn.execute("CREATE VIRTUAL TABLE temp.fts_probe USING fts5(x, tokenize='trigram')")
+            self.conn.execute("DROP TABLE temp.fts_probe")
+            return True
+        except sqlite3.OperationalError:
+            return False
+
+    def build_fts_index(self) -> Dict:
+        """Create (or recreate) the trigram full-text index over script_lines.
+
+        The index is an external-content FTS5 table, so the text itself is
+        not duplicated; only the trigram postings are stored. Trigrams suit
+        Japanese text, which has no word boundaries, and let MATCH find any
+        substring of three or more characters.
+        """
+        started = time.time()
+
+        self.conn.executescript(f"""
+            DROP TABLE IF EXISTS {FTS_TABLE};
+            CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+                dialogue, character_name, title,
+                content='script_lines',
+                tokenize='trigram'
+            );
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild');
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize');
+        """)
+        self.conn.commit()
+
+        indexed = self.conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}").fetchone()[0]
+        return {
+            'table': FTS_TABLE,
+            'indexed_rows': indexed,
+            'seconds': round(time.time() - started, 2)
+        }
+
+    def build_normalized_columns(self) -> Dict:
+        """Add normalized sort/filter columns to script_lines and index them.
+
+        Raw broadcast_date text ('25/08/18') and mixed management_id styles
+        ('A01', 'B1039') do not sort correctly as text, and sorting them
+        needs a temporary B-tree over every match. The normalized columns
+        sort correctly and, with the composite indexes, let SQLite walk an
+        index in ORDER BY order and stop at LIMIT.
+        """
+        started = time.time()
+
+        self.conn.create_function('normalize_management_id', 1, normalize_management_id, deterministic=True)
+        self.conn.create_function('normalize_broadcast_date', 1, normalize_broadcast_date, deterministic=True)
+
+        existing = {row[1] for row in self.conn.execute("PRAGMA table_info(script_lines)")}
+        for column, (column_type, _) in NORMALIZED_COLUMNS.items():
+            if column not in existing:
+                default = "''" if column_type == 'TEXT' else '0'
+                self.conn.execute(
+                    f"ALTER TABLE script_lines ADD COLUMN {column} {column_type} NOT NULL DEFAULT {default}"
+                )
+
+        assignments = ', '.join(f"{column} = {expression}" for column, (_, expression) in NORMALIZED_COLUMNS.items())
+        updated = self.conn.execute(f"UPDATE script_lines SET {assignments}").rowcount
+
+        for name, columns in NORMALIZED_INDEXES.items():
+            self.conn.execute(f"DROP INDEX IF EXISTS {name}")
+            self.conn.execute(f"CREATE INDEX {name} ON script_lines({columns})")
+
+        # Statistics let the planner choose between index order and FTS lookups
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+
+        return {
+            'updated_rows': updated,
+            'indexes': list(NORMALIZED_INDEXES),
+            'seconds': round(time.time() - started, 2)
+        }
+
+    def close(self):
+        """Close database connection"""
+        self.conn.close()
+
+
+def main():
+    """Main execution function"""
+
+    db_path = "youtube_search_complete_all.db"
+
+    print("SunSun Script Search Index Builder")
+    print("==================================")
+    print(f"Database: {db_path}")
+
+    builder = SearchIndexBuilder(db_path)
+
+    try:
+        print("\n1. Building FTS5 trigram index...")
+        if not builder.fts5_available():
+            print("   ⚠️ This SQLite build has no FTS5 trigram tokenizer; skipped")
+        else:
+            result = builder.build_fts_index()
+            print(f"   {result['table']}: {result['indexed_rows']:,} rows in {result['seconds']}s")
+
+        print("\n2. Building normalized sort/filter columns...")
+        result = builder.build_normalized_columns()
+        print(f"   {result['updated_rows']:,} rows, {len(result['indexes'])} indexes in {result['seconds']}s")
+
+        print(f"\n✅ Index build complete!")
+
+    finally:
+        builder.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -12,14 +12,31 @@ Author: Claude Code Assistant
 Date: 2025-08-19
 """
 
+import argparse
+import hashlib
+import os
+import pathlib
 import sqlite3
 import re
 import json
-from typing import Dict, List, Tuple, Optional
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple, Optional
 from dataclasses import dataclass
 from datetime import datetime
 
-@dataclass
+from database_indexer import normalize_broadcast_date, normalize_management_id
+
+# classify_content's rules (MAIN_CHARACTERS and the CONTENT_PATTERNS
+# families) are defined once, in api/search.py, which counts content type
+# facets with them and is deployed on its own.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+from search import CONTENT_PATTERNS, MAIN_CHARACTERS  # noqa: E402
+
+@dataclass(frozen=True)
 class ContentClassification:
     """Classification result for database content"""
     content_type: str  # 'dialogue', 'scene_description', 'tech_instruction', 'visual_effect', 'audio_instruction'
@@ -27,6 +44,287 @@ class ContentClassification:
     reasoning: str
     suggested_column: str
 
+
+# The possible outcomes of classify_content, shared by every row
+EMPTY = ContentClassification('empty', 1.0, 'Empty content', 'ignore')
+CHARACTER_DIALOGUE = ContentClassification('dialogue', 0.9, 'Character with dialogue patterns', 'character_dialogue')
+AUDIO_INSTRUCTION = ContentClassification('audio_instruction', 0.8, 'Audio/music instruction', 'audio_instructions')
+VISUAL_EFFECT = ContentClassification('visual_effect', 0.8, 'Visual effect instruction', 'visual_effects')
+TECH_INSTRUCTION = ContentClassification('tech_instruction', 0.7, 'Technical instruction', 'technical_notes')
+SCENE_DESCRIPTION = ContentClassification('scene_description', 0.7, 'Scene/situational description', 'scene_descriptions')
+NAMED_DIALOGUE = ContentClassification('dialogue', 0.5, 'Has character name', 'character_dialogue')
+UNNAMED_DESCRIPTION = ContentClassification('scene_description', 0.5, 'No character, likely description', 'scene_descriptions')
+
+
+class ContentClassifier:
+    """Compiled classify_content rules.
+
+    Each pattern family is compiled once into a single alternation, so a
+    family is tested with one scan of the text instead of one re.search
+    per pattern. Every family is scanned at most once per row (the
+    technical patterns used to run twice), and only when the rules reach
+    it: most rows need two or three scans.
+    """
+
+    def __init__(self, dialogue_patterns: List[str], scene_description_patterns: List[str],
+                 tech_instruction_patterns: List[str], visual_effect_patterns: List[str],
+                 audio_instruction_patterns: List[str]):
+        self.dialogue = self._combine(dialogue_patterns)
+        self.scene_description = self._combine(scene_description_patterns)
+        self.tech_instruction = self._combine(tech_instruction_patterns)
+        self.visual_effect = self._combine(visual_effect_patterns)
+        self.audio_instruction = self._combine(audio_instruction_patterns)
+
+    @staticmethod
+    def _combine(patterns: List[str]):
+        # re.search finds an alternation anywhere exactly when it finds one of its branches
+        return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+
+    def classify(self, character_name: str, dialogue: str) -> ContentClassification:
+        if not dialogue:
+            return EMPTY
+        dialogue = dialogue.strip()
+        if not dialogue:
+            return EMPTY
+        
+        technical = self.tech_instruction.search(dialogue) is not None
+        
+        # Check for actual character dialogue
+        if not technical and character_name in MAIN_CHARACTERS and self.dialogue.search(dialogue):
+            return CHARACTER_DIALOGUE
+        
+        # Check for technical instructions
+        if technical:
+            if self.audio_instruction.search(dialogue):
+                return AUDIO_INSTRUCTION
+            if self.visual_effect.search(dialogue):
+                return VISUAL_EFFECT
+            return TECH_INSTRUCTION
+        
+        # Check for scene descriptions
+        if self.scene_description.search(dialogue):
+            return SCENE_DESCRIPTION
+        
+        # Default classification based on character presence
+        return NAMED_DIALOGUE if character_name else UNNAMED_DESCRIPTION
+
+# Content tables merged into script_timeline, in the order rows at the same
+# position are listed: (content_type, table, text column, character column,
+# voice column, filming column). Keep in sync with api/search.py's CONTENT_TABLES.
+TIMELINE_SOURCES = [
+    ('dialogue', 'character_dialogue', 'dialogue_text', 'character_name', 'voice_instruction', None),
+    ('scene_description', 'scene_descriptions', 'description_text', None, None, 'filming_instruction'),
+    ('visual_effect', 'visual_effects', 'effect_description', None, None, None),
+    ('audio_instruction', 'audio_instructions', 'audio_description', None, None, None),
+    ('tech_instruction', 'technical_notes', 'note_text', None, None, None),
+]
+
+# script_lines content columns a script's output is built from
+ROW_COLUMNS = ('management_id, row_number, character_name, dialogue, voice_instruction, '
+               'filming_instruction, editing_instruction, dialogue_column')
+
+# script_lines columns read for reorganization, in the order classify_rows
+# expects; the trailing rowid completes the row's source key
+SOURCE_COLUMNS = ROW_COLUMNS + ', rowid'
+
+# rowid settles ties, so the processing order is fully determined, and
+# (management_id, row_number, rowid) is a key to resume after
+SOURCE_ORDER = 'ORDER BY management_id, COALESCE(row_number, 0), rowid'
+SOURCE_AFTER = '(management_id, COALESCE(row_number, 0), rowid) > (?, ?, ?)'
+
+# Everything a script's output depends on; a change to any of these
+# columns changes its content hash
+HASH_COLUMNS = ROW_COLUMNS + ', title, broadcast_date, script_url, source_sheet'
+
+# The scripts row of each management_id is the first of these
+SCRIPTS_SQL = """
+    SELECT DISTINCT management_id, title, broadcast_date, script_url, source_sheet
+    FROM script_lines
+    {where}
+    ORDER BY management_id
+"""
+
+# scripts columns written from a SCRIPTS_SQL row (see script_record)
+SCRIPT_COLUMNS = ('management_id, title, broadcast_date, script_url, source_sheet, content_hash, '
+                  'management_key, broadcast_date_key')
+
+# Rows classified per batch (and per parallel work unit)
+BATCH_ROWS = 10000
+
+# INSERT statement per content table, fed by classify_rows
+INSERT_SQL = {
+    'character_dialogue': """
+        INSERT INTO character_dialogue
+        (script_id, row_number, character_name, dialogue_text, voice_instruction, original_column)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    'scene_descriptions': """
+        INSERT INTO scene_descriptions
+        (script_id, row_number, description_text, filming_instruction, original_column)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    'visual_effects': """
+        INSERT INTO visual_effects
+        (script_id, row_number, effect_description, effect_type, original_column)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    'audio_instructions': """
+        INSERT INTO audio_instructions
+        (script_id, row_number, audio_description, audio_type, file_reference, original_column)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """,
+    'technical_notes': """
+        INSERT INTO technical_notes
+        (script_id, row_number, note_text, note_type, original_column)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+}
+
+# Settings for building the output database. Nothing else reads the file
+# while it is built, but an interrupted build is resumed from its last
+# checkpoint, so every commit must survive a crash: WAL commits are atomic
+# and, with synchronous NORMAL, only fsync when the WAL is checkpointed.
+# Index sorts and VACUUM spill to temporary files rather than memory, so
+# with a fixed page cache the build's memory does not grow with the corpus.
+BULK_LOAD_PRAGMAS = (
+    'journal_mode = WAL',
+    'synchronous = NORMAL',
+    'cache_size = -16384',
+)
+
+# Rows buffered per content table before BulkWriter writes them
+FLUSH_ROWS = 50000
+
+# Source rows classified between checkpoint commits
+CHECKPOINT_ROWS = 50000
+
+# Progress of a build, committed with the rows it describes. Dropped from the
+# finished database.
+CHECKPOINT_SQL = """
+CREATE TABLE IF NOT EXISTS reorganize_checkpoint (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    source TEXT NOT NULL,          -- size and mtime of the source database
+    phase TEXT NOT NULL,           -- content, timeline or indexes
+    management_id TEXT,            -- source key of the last committed row
+    row_number INTEGER,
+    source_rowid INTEGER,
+    stats TEXT NOT NULL,           -- JSON stats up to that row
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+"""
+
+
+class BulkWriter:
+    """Buffers INSERT_SQL rows per content table and writes them with executemany"""
+
+    def __init__(self, conn: sqlite3.Connection, flush_rows: int = FLUSH_ROWS):
+        self.conn = conn
+        self.flush_rows = flush_rows
+        self.buffers: Dict[str, List[Tuple]] = {table: [] for table in INSERT_SQL}
+
+    def add(self, inserts: Dict[str, List[Tuple]]):
+        """Queue classify_rows output, writing any table whose buffer is full"""
+        for table, rows in inserts.items():
+            buffer = self.buffers[table]
+            buffer.extend(rows)
+            if len(buffer) >= self.flush_rows:
+                self._write(table)
+
+    def flush(self):
+        """Write every buffered row"""
+        for table in self.buffers:
+            self._write(table)
+
+    def _write(self, table: str):
+        if self.buffers[table]:
+            self.conn.executemany(INSERT_SQL[table], self.buffers[table])
+            self.buffers[table] = []
+
+
+class ProgressReporter:
+    """Live throughput of a reorganization run.
+
+    Prints a progress line at most every ``interval`` seconds and, given a
+    ``stream``, also writes every event to it as a JSON line: rows done,
+    rows/sec, ETA and insert rates per content table. Rates only count rows
+    processed by this run, so they stay meaningful after a resume.
+    """
+
+    def __init__(self, stream=None, interval: float = 2.0):
+        self.stream = stream
+        self.interval = interval
+        self.total_rows = 0
+        self.baseline: Dict[str, int] = {}
+        self.phase = 'content'
+        self.started = self.last_report = time.monotonic()
+
+    def start(self, total_rows: int, stats: Dict[str, int], phase: str):
+        """Begin timing; ``stats`` are the counts carried over from a checkpoint"""
+        self.total_rows = total_rows
+        self.baseline = dict(stats)
+        self.phase = phase
+        self.started = self.last_report = time.monotonic()
+        self._emit('start', stats)
+
+    def update(self, stats: Dict[str, int]):
+        """Report progress if ``interval`` has passed since the last report"""
+        now = time.monotonic()
+        if now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        record = self._emit('progress', stats)
+        eta = record['eta_seconds']
+        print(f"Processed {record['rows']:,}/{record['total_rows']:,} rows "
+              f"({record['rows_per_second']:,.0f} rows/s, ETA {'?' if eta is None else f'{eta:.0f}s'})")
+
+    def checkpoint(self, key: Tuple, stats: Dict[str, int]):
+        """Record a committed checkpoint"""
+        self._emit('checkpoint', stats, management_id=key[0], row_number=key[1], source_rowid=key[2])
+
+    def start_phase(self, phase: str, stats: Dict[str, int]):
+        """Record the start of a build phase after the content tables"""
+        self.phase = phase
+        self._emit('phase', stats)
+
+    def finish(self, stats: Dict[str, int]):
+        """Record the end of the run"""
+        self.phase = 'done'
+        record = self._emit('done', stats)
+        print(f"Processed {record['run_rows']:,} rows in {record['elapsed_seconds']:.1f}s "
+              f"({record['rows_per_second']:,.0f} rows/s)")
+
+    def _emit(self, event: str, stats: Dict[str, int], **fields) -> Dict:
+        elapsed = time.monotonic() - self.started
+        rows = stats['total_processed']
+        run_rows = rows - self.baseline.get('total_processed', 0)
+        rate = run_rows / elapsed if elapsed > 0 else 0.0
+        record = {
+            'event': event,
+            'phase': self.phase,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows': rows,
+            'run_rows': run_rows,
+            'total_rows': self.total_rows,
+            'rows_per_second': round(rate, 1),
+            'eta_seconds': round(max(0, self.total_rows - rows) / rate, 1) if rate else None,
+            'empty_ignored': stats['empty_ignored'],
+            'tables': {
+                table: {
+                    'rows': stats[table],
+                    'rows_per_second': round((stats[table] - self.baseline.get(table, 0)) / elapsed, 1)
+                    if elapsed > 0 else 0.0
+                }
+                for table in INSERT_SQL
+            }
+        }
+        record.update(fields)
+        if self.stream is not None:
+            self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.stream.flush()
+        return record
+
+
 class DatabaseReorganizer:
     """Main class for reorganizing the script database"""
     
@@ -36,37 +334,16 @@ class DatabaseReorganizer:
         self.conn.row_factory = sqlite3.Row
         
         # Classification patterns
-        self.dialogue_patterns = [
-            r'[！？。〜♪]+$',  # Ends with punctuation typical of dialogue
-            r'^[「『].*[」』]$',  # Quoted text
-            r'[あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん]+[！？。〜♪]',  # Japanese with emotional punctuation
-        ]
-        
-        self.scene_description_patterns = [
-            r'^[^「『]*[のをに][いるある]',  # Descriptive sentences
-            r'カメラ|撮影|アップ|全体|登場|の様子',  # Camera/filming terms
-            r'^.*[がは].*[するている]',  # Action descriptions
-            r'ペットボトル|プール|全体像|手をあげる',  # Scene elements
-        ]
-        
-        self.tech_instruction_patterns = [
-            r'BGM|SE|音楽|効果音|audiostock',  # Audio instructions
-            r'テロップ|CG|エフェクト|フェード|アイリス',  # Visual effects
-            r'撮影|カット|編集|※|★',  # Technical notes
-            r'https?://|\.mp3|\.wav|gigafile',  # File references
-        ]
-        
-        self.visual_effect_patterns = [
-            r'テロップ|エフェクト|CG|稲光|電撃|アニメーション',
-            r'スロー|モノクロ|フェード|ズーム|パン',
-            r'光|キラキラ|ぼわん|ドカーン',
-        ]
-        
-        self.audio_instruction_patterns = [
-            r'BGM|SE|効果音|音楽|サウンド',
-            r'ちゃんちゃん|シャキーン|ドンッ|キキーッ',
-            r'audiostock|gigafile|\.mp3|\.wav',
-        ]
+        self.dialogue_patterns = list(CONTENT_PATTERNS['dialogue'])
+        self.scene_description_patterns = list(CONTENT_PATTERNS['scene_description'])
+        self.tech_instruction_patterns = list(CONTENT_PATTERNS['tech_instruction'])
+        self.visual_effect_patterns = list(CONTENT_PATTERNS['visual_effect'])
+        self.audio_instruction_patterns = list(CONTENT_PATTERNS['audio_instruction'])
+
+        self.classifier = ContentClassifier(
+            self.dialogue_patterns, self.scene_description_patterns, self.tech_instruction_patterns,
+            self.visual_effect_patterns, self.audio_instruction_patterns
+        )
 
     def analyze_content_patterns(self) -> Dict:
         """Analyze existing content patterns in the database"""
@@ -117,41 +394,16 @@ class DatabaseReorganizer:
         return analysis
 
     def classify_content(self, character_name: str, dialogue: str, column: str) -> ContentClassification:
-        """Classify content based on patterns and context"""
-        
-        if not dialogue or dialogue.strip() == '':
-            return ContentClassification('empty', 1.0, 'Empty content', 'ignore')
-        
-        dialogue = dialogue.strip()
-        
-        # Check for actual character dialogue
-        if character_name and character_name in ['サンサン', 'くもりん', 'ツクモ', 'ノイズ', 'プリル']:
-            # Strong indicators of actual dialogue
-            if any(re.search(pattern, dialogue) for pattern in self.dialogue_patterns):
-                if not any(re.search(pattern, dialogue) for pattern in self.tech_instruction_patterns):
-                    return ContentClassification('dialogue', 0.9, 'Character with dialogue patterns', 'character_dialogue')
-        
-        # Check for technical instructions
-        if any(re.search(pattern, dialogue) for pattern in self.tech_instruction_patterns):
-            if any(re.search(pattern, dialogue) for pattern in self.audio_instruction_patterns):
-                return ContentClassification('audio_instruction', 0.8, 'Audio/music instruction', 'audio_instructions')
-            elif any(re.search(pattern, dialogue) for pattern in self.visual_effect_patterns):
-                return ContentClassification('visual_effect', 0.8, 'Visual effect instruction', 'visual_effects')
-            else:
-                return ContentClassification('tech_instruction', 0.7, 'Technical instruction', 'technical_notes')
-        
-        # Check for scene descriptions
-        if any(re.search(pattern, dialogue) for pattern in self.scene_description_patterns):
-            return ContentClassification('scene_description', 0.7, 'Scene/situational description', 'scene_descriptions')
-        
-        # Default classification based on character presence
-        if character_name and character_name != '':
-            return ContentClassification('dialogue', 0.5, 'Has character name', 'character_dialogue')
-        else:
-            return ContentClassification('scene_description', 0.5, 'No character, likely description', 'scene_descriptions')
+        """Classify content based on patterns and context (see ContentClassifier)"""
+        return self.classifier.classify(character_name, dialogue)
 
-    def create_optimized_schema(self) -> str:
-        """Create SQL for optimized database schema"""
+    def create_optimized_schema(self, with_indexes: bool = True) -> str:
+        """Create SQL for optimized database schema.
+
+        Bulk loads create the tables only and add create_indexes_sql() after
+        the data is in, which is much faster than maintaining the indexes row
+        by row.
+        """
         
         schema_sql = """
         -- Optimized Schema for SunSun Script Database
@@ -164,6 +416,10 @@ class DatabaseReorganizer:
             broadcast_date TEXT,
             script_url TEXT,
             source_sheet TEXT,
+            content_hash TEXT, -- hash of the script's source rows, for incremental runs
+            -- Sort keys, normalized as database_indexer.py does for script_lines
+            management_key TEXT NOT NULL DEFAULT '',
+            broadcast_date_key INTEGER NOT NULL DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
@@ -227,55 +483,339 @@ class DatabaseReorganizer:
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         
-        -- Indexes for performance
-        CREATE INDEX IF NOT EXISTS idx_character_dialogue_script ON character_dialogue(script_id);
-        CREATE INDEX IF NOT EXISTS idx_character_dialogue_character ON character_dialogue(character_name);
-        CREATE INDEX IF NOT EXISTS idx_scene_descriptions_script ON scene_descriptions(script_id);
-        CREATE INDEX IF NOT EXISTS idx_visual_effects_script ON visual_effects(script_id);
-        CREATE INDEX IF NOT EXISTS idx_audio_instructions_script ON audio_instructions(script_id);
-        CREATE INDEX IF NOT EXISTS idx_technical_notes_script ON technical_notes(script_id);
-        CREATE INDEX IF NOT EXISTS idx_scripts_management_id ON scripts(management_id);
+        -- Every content row in script order, for reading whole scripts or a
+        -- window of rows with one primary key range scan
+        CREATE TABLE IF NOT EXISTS script_timeline (
+            script_id INTEGER NOT NULL REFERENCES scripts(id),
+            row_number INTEGER NOT NULL,
+            content_rank INTEGER NOT NULL, -- position of content_type in TIMELINE_SOURCES
+            content_id INTEGER NOT NULL, -- id in the content type's table
+            content_type TEXT NOT NULL,
+            character_name TEXT,
+            text TEXT NOT NULL,
+            voice_instruction TEXT,
+            filming_instruction TEXT,
+            PRIMARY KEY (script_id, row_number, content_rank, content_id)
+        ) WITHOUT ROWID;
         """
         
+        if with_indexes:
+            schema_sql += self.create_indexes_sql()
         return schema_sql
 
-    def reorganize_database(self, output_path: str = None) -> Dict:
-        """Reorganize the database into the new optimized structure"""
+    def create_indexes_sql(self) -> str:
+        """Create SQL for the secondary indexes of the optimized schema"""
+        
+        return """
+        -- Indexes for performance. api/search.py sorts content type searches
+        -- by the scripts sort keys, then row_number: it walks a scripts key
+        -- index and reads each script's rows through its (script_id, row_number)
+        -- index, so only the rows of one script are ever sorted together
+        CREATE INDEX IF NOT EXISTS idx_character_dialogue_script_row ON character_dialogue(script_id, COALESCE(row_number, 0));
+        CREATE INDEX IF NOT EXISTS idx_character_dialogue_character ON character_dialogue(character_name);
+        CREATE INDEX IF NOT EXISTS idx_scene_descriptions_script_row ON scene_descriptions(script_id, COALESCE(row_number, 0));
+        CREATE INDEX IF NOT EXISTS idx_visual_effects_script_row ON visual_effects(script_id, COALESCE(row_number, 0));
+        CREATE INDEX IF NOT EXISTS idx_audio_instructions_script_row ON audio_instructions(script_id, COALESCE(row_number, 0));
+        CREATE INDEX IF NOT EXISTS idx_technical_notes_script_row ON technical_notes(script_id, COALESCE(row_number, 0));
+        CREATE INDEX IF NOT EXISTS idx_scripts_management_id ON scripts(management_id);
+        CREATE INDEX IF NOT EXISTS idx_scripts_management_key ON scripts(management_key);
+        CREATE INDEX IF NOT EXISTS idx_scripts_broadcast_date_key ON scripts(broadcast_date_key, management_key);
+        """
+
+    def reorganize_database(self, output_path: str = None, workers: int = 1,
+                            progress: Optional[ProgressReporter] = None, restart: bool = False) -> Dict:
+        """Reorganize the database into the new optimized structure.
+
+        With ``workers`` > 1, rows are classified by that many processes
+        while this process writes; the output is the same as a serial run.
+
+        Every CHECKPOINT_ROWS source rows, the rows written so far are
+        committed together with the source key of the last one. A run that
+        is killed or crashes resumes from that checkpoint the next time it
+        is started for the same output, unless ``restart`` is set or the
+        source database has changed in the meantime.
+        """
         
         if output_path is None:
             output_path = self.db_path.replace('.db', '_reorganized.db')
+        if progress is None:
+            progress = ProgressReporter()
+        
+        # Build into a separate file and rename it over the output at the end,
+        # so readers never see a partial build
+        build_path = output_path + '.build'
+        new_conn, checkpoint = self._open_build(build_path, restart)
+        # The connection is closed however the build ends, so a retry in the
+        # same process can reopen the build file and resume from its checkpoint
+        try:
+            if checkpoint is None:
+                new_conn.executescript(self.create_optimized_schema(with_indexes=False))
+                new_conn.execute(CHECKPOINT_SQL)
+            
+                # Get all unique scripts, with the hashes later incremental runs compare against
+                scripts = self.conn.execute(SCRIPTS_SQL.format(where='')).fetchall()
+                hashes = self.compute_script_hashes()
+            
+                # Insert scripts; the first row of a management_id wins
+                new_conn.executemany(f"""
+                    INSERT OR IGNORE INTO scripts ({SCRIPT_COLUMNS})
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [script_record(script, hashes[script[0]]) for script in scripts])
+            
+                stats = {
+                    'total_processed': 0,
+                    'character_dialogue': 0,
+                    'scene_descriptions': 0,
+                    'visual_effects': 0,
+                    'audio_instructions': 0,
+                    'technical_notes': 0,
+                    'empty_ignored': 0
+                }
+                phase, key = 'content', None
+                self._save_checkpoint(new_conn, phase, key, stats)
+                new_conn.commit()
+            else:
+                phase, key, stats = checkpoint
+                print(f"Resuming {phase} phase after {stats['total_processed']:,} rows"
+                      f"{f' (last: {key[0]} row {key[1]})' if key else ''}")
+        
+            script_id_map = dict(new_conn.execute("SELECT management_id, id FROM scripts"))
+            total_rows = self.conn.execute("SELECT COUNT(*) FROM script_lines").fetchone()[0]
+            progress.start(total_rows, stats, phase)
+        
+            if phase == 'content':
+                # Process the script lines after the checkpoint, in batches
+                # classified here or by worker processes; either way they arrive
+                # in SOURCE_ORDER
+                if workers > 1:
+                    batches = self._parallel_batches(script_id_map, workers, key)
+                else:
+                    batches = self._serial_batches(script_id_map, key)
+            
+                writer = BulkWriter(new_conn)
+                uncommitted = 0
+                for inserts, counts, key in batches:
+                    writer.add(inserts)
+                    for name, count in counts.items():
+                        stats[name] += count
+                
+                    uncommitted += counts['total_processed']
+                    if uncommitted >= CHECKPOINT_ROWS:
+                        writer.flush()
+                        self._save_checkpoint(new_conn, phase, key, stats)
+                        new_conn.commit()
+                        progress.checkpoint(key, stats)
+                        uncommitted = 0
+                    progress.update(stats)
+                writer.flush()
+                phase = 'timeline'
+                self._save_checkpoint(new_conn, phase, key, stats)
+                new_conn.commit()
+        
+            if phase == 'timeline':
+                progress.start_phase(phase, stats)
+                stats['script_timeline'] = self.build_script_timeline(new_conn)
+                phase = 'indexes'
+                self._save_checkpoint(new_conn, phase, key, stats)
+                new_conn.commit()
+        
+            # Indexes are built once over the loaded tables, then the planner
+            # statistics are gathered and the file is compacted. The finished
+            # database leaves WAL mode, so it is a single file that api/search.py
+            # can open immutable.
+            progress.start_phase(phase, stats)
+            print("Building indexes...")
+            new_conn.executescript(self.create_indexes_sql())
+            new_conn.execute("ANALYZE")
+            new_conn.execute("DROP TABLE reorganize_checkpoint")
+            new_conn.commit()
+            new_conn.execute("PRAGMA journal_mode = DELETE")
+            new_conn.execute("VACUUM")
+        finally:
+            new_conn.close()
+        os.replace(build_path, output_path)
+        
+        progress.finish(stats)
+        return stats
+
+    def _open_build(self, build_path: str, restart: bool) -> Tuple[sqlite3.Connection, Optional[Tuple]]:
+        """Open the build database, resuming it if it has a checkpoint for this source.
+
+        Returns the connection and (phase, source key, stats) of the
+        checkpoint, or None when the build starts from an empty file.
+        """
+        source = self._source_fingerprint()
+        if not restart and os.path.exists(build_path):
+            conn = sqlite3.connect(build_path)
+            try:
+                row = conn.execute("""
+                    SELECT source, phase, management_id, row_number, source_rowid, stats
+                    FROM reorganize_checkpoint
+                """).fetchone()
+            except sqlite3.DatabaseError:
+                row = None
+            if row is not None and row[0] == source:
+                for pragma in BULK_LOAD_PRAGMAS:
+                    conn.execute(f"PRAGMA {pragma}")
+                key = tuple(row[2:5]) if row[2] is not None else None
+                return conn, (row[1], key, json.loads(row[5]))
+            conn.close()
         
-        # Create new database with optimized schema
-        new_conn = sqlite3.connect(output_path)
-        new_conn.executescript(self.create_optimized_schema())
+        for suffix in ('', '-journal', '-wal', '-shm'):
+            if os.path.exists(build_path + suffix):
+                os.unlink(build_path + suffix)
+        conn = sqlite3.connect(build_path)
+        for pragma in BULK_LOAD_PRAGMAS:
+            conn.execute(f"PRAGMA {pragma}")
+        return conn, None
+
+    def _source_fingerprint(self) -> str:
+        """Size and mtime of the source database; a checkpoint is only valid for the same values"""
+        status = os.stat(self.db_path)
+        return f'{status.st_size}:{status.st_mtime_ns}'
+
+    def _save_checkpoint(self, conn: sqlite3.Connection, phase: str, key: Optional[Tuple], stats: Dict):
+        """Record the build position; committed by the caller together with the rows it covers"""
+        management_id, row_number, source_rowid = key or (None, None, None)
+        conn.execute("""
+            INSERT OR REPLACE INTO reorganize_checkpoint
+            (id, source, phase, management_id, row_number, source_rowid, stats, updated_at)
+            VALUES (1, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (self._source_fingerprint(), phase, management_id, row_number, source_rowid, json.dumps(stats)))
+
+    def _serial_batches(self, script_id_map: Dict[str, int], after: Optional[Tuple] = None,
+                        management_ids: Optional[List[str]] = None) -> Iterator[Tuple[Dict, Dict, Tuple]]:
+        """Classify the script_lines after source key ``after`` in this process, one batch at a time.
+
+        With ``management_ids``, only the rows of those scripts are classified.
+        """
+        cursor = self.conn.cursor()
+        cursor.row_factory = None
+        if management_ids is not None:
+            where = "WHERE management_id IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(management_ids, ensure_ascii=False),)
+        elif after:
+            where, params = f"WHERE {SOURCE_AFTER}", after
+        else:
+            where, params = "", ()
+        cursor.execute(f"SELECT {SOURCE_COLUMNS} FROM script_lines {where} {SOURCE_ORDER}", params)
+        while True:
+            rows = cursor.fetchmany(BATCH_ROWS)
+            if not rows:
+                break
+            yield classify_rows(self.classifier, script_id_map, rows) + (source_key(rows[-1]),)
+
+    def _parallel_batches(self, script_id_map: Dict[str, int], workers: int, after: Optional[Tuple] = None,
+                          management_ids: Optional[List[str]] = None) -> Iterator[Tuple[Dict, Dict, Tuple]]:
+        """Classify the script_lines after source key ``after`` in worker processes and yield their batches in order.
+
+        Work units are runs of whole scripts of about BATCH_ROWS rows. Each
+        worker reads its unit through its own read-only connection, and
+        units are consumed in order, so the writer sees the same sequence
+        as a serial run. At most two units per worker are in flight, which
+        bounds memory. With ``management_ids``, only those scripts are
+        classified: a unit never spans a script outside them.
+        """
+        units = []
+        first = last = None
+        unit_rows = 0
+        selected = set(management_ids) if management_ids is not None else None
+        where = f"WHERE {SOURCE_AFTER}" if after else ""
+        for management_id, count in self.conn.execute(f"""
+            SELECT management_id, COUNT(*) FROM script_lines {where}
+            GROUP BY management_id ORDER BY management_id
+        """, after or ()):
+            if selected is not None and management_id not in selected:
+                if first is not None:
+                    units.append((first, last))
+                    first, unit_rows = None, 0
+                continue
+            if first is None:
+                first = management_id
+            last = management_id
+            unit_rows += count
+            if unit_rows >= BATCH_ROWS:
+                units.append((first, last))
+                first, unit_rows = None, 0
+        if first is not None:
+            units.append((first, last))
         
-        # Get all unique scripts
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(self.db_path, self.classifier, script_id_map, after)) as pool:
+            pending = deque()
+            for unit in units:
+                pending.append(pool.submit(_classify_unit, *unit))
+                if len(pending) >= workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def compute_script_hashes(self) -> Dict[str, str]:
+        """Hash each script's HASH_COLUMNS rows, in SOURCE_ORDER; return management_id -> hex digest"""
+        hashes = {}
+        current = digest = None
         cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT DISTINCT management_id, title, broadcast_date, script_url, source_sheet
-            FROM script_lines
-            ORDER BY management_id
-        """)
+        cursor.row_factory = None
+        for row in cursor.execute(f"SELECT {HASH_COLUMNS} FROM script_lines {SOURCE_ORDER}"):
+            if row[0] != current:
+                if digest is not None:
+                    hashes[current] = digest.hexdigest()
+                current, digest = row[0], hashlib.blake2b(digest_size=16)
+            digest.update(repr(row).encode('utf-8'))
+        if digest is not None:
+            hashes[current] = digest.hexdigest()
+        return hashes
+
+    def reorganize_incremental(self, output_path: str = None, workers: int = 1,
+                               progress: Optional[ProgressReporter] = None) -> Dict:
+        """Bring an existing reorganized database up to date with the source.
+
+        Scripts are compared by content hash: new and changed scripts are
+        reclassified and upserted, deleted ones removed, and unchanged ones
+        left alone, all in one transaction. Like a full build, the changed
+        scripts are classified by ``workers`` processes when it is above 1,
+        and planner statistics are refreshed before the commit. Without a
+        previous output (or one built before content hashes or script sort
+        keys existed) this is a full rebuild.
+        """
         
-        scripts = cursor.fetchall()
-        script_id_map = {}
-        
-        # Insert scripts
-        for script in scripts:
-            new_cursor = new_conn.cursor()
-            new_cursor.execute("""
-                INSERT OR IGNORE INTO scripts (management_id, title, broadcast_date, script_url, source_sheet)
-                VALUES (?, ?, ?, ?, ?)
-            """, script)
-            if new_cursor.lastrowid:
-                script_id_map[script[0]] = new_cursor.lastrowid
-            else:
-                # Get existing ID
-                new_cursor.execute("SELECT id FROM scripts WHERE management_id = ?", (script[0],))
-                script_id_map[script[0]] = new_cursor.fetchone()[0]
+        if output_path is None:
+            output_path = self.db_path.replace('.db', '_reorganized.db')
+        if progress is None:
+            progress = ProgressReporter()
         
-        # Process all script lines
-        cursor.execute("SELECT * FROM script_lines ORDER BY management_id, row_number")
+        hashes = self.compute_script_hashes()
+        existing = {}
+        if os.path.exists(output_path):
+            out = sqlite3.connect(output_path)
+            try:
+                # Reading management_key fails on outputs that predate it
+                existing = {management_id: content_hash for management_id, content_hash, _ in out.execute(
+                    "SELECT management_id, content_hash, management_key FROM scripts"
+                )}
+            except sqlite3.OperationalError:
+                existing = {}
+            finally:
+                out.close()
+        
+        new = sorted(set(hashes) - set(existing))
+        deleted = sorted(set(existing) - set(hashes))
+        changed = sorted(m for m in hashes if m in existing and existing[m] != hashes[m])
+        kept = set(existing) - set(deleted)
+        summary = {
+            'new_scripts': len(new),
+            'changed_scripts': len(changed),
+            'deleted_scripts': len(deleted),
+            'unchanged_scripts': len(kept) - len(changed),
+            'full_rebuild': False
+        }
+        
+        if not existing or None in existing.values():
+            print("Running a full rebuild...")
+            stats = self.reorganize_database(output_path, workers, progress)
+            stats.update(summary, new_scripts=len(hashes), changed_scripts=0, deleted_scripts=0,
+                         unchanged_scripts=0, full_rebuild=True)
+            return stats
         
         stats = {
             'total_processed': 0,
@@ -284,88 +824,108 @@ class DatabaseReorganizer:
             'visual_effects': 0,
             'audio_instructions': 0,
             'technical_notes': 0,
-            'empty_ignored': 0
+            'empty_ignored': 0,
+            'script_timeline': 0
         }
+        stats.update(summary)
+        if not (new or changed or deleted):
+            return stats
         
-        for row in cursor:
-            stats['total_processed'] += 1
+        out = sqlite3.connect(output_path)
+        try:
+            out.execute("BEGIN")
             
-            script_id = script_id_map[row['management_id']]
-            classification = self.classify_content(
-                row['character_name'], 
-                row['dialogue'], 
-                row['dialogue_column']
-            )
+            # Drop the old rows of changed and deleted scripts
+            stale = json.dumps(changed + deleted, ensure_ascii=False)
+            stale_ids = "SELECT id FROM scripts WHERE management_id IN (SELECT value FROM json_each(?))"
+            for table in list(INSERT_SQL) + ['script_timeline']:
+                out.execute(f"DELETE FROM {table} WHERE script_id IN ({stale_ids})", (stale,))
+            out.executemany("DELETE FROM scripts WHERE management_id = ?", [(m,) for m in deleted])
             
-            new_cursor = new_conn.cursor()
+            # Upsert script metadata; changed scripts keep their ids
+            upserted = json.dumps(changed + new, ensure_ascii=False)
+            where = "WHERE management_id IN (SELECT value FROM json_each(?))"
+            scripts = {}
+            for script in self.conn.execute(SCRIPTS_SQL.format(where=where), (upserted,)):
+                scripts.setdefault(script[0], script_record(script, hashes[script[0]]))
+            out.executemany(f"""
+                INSERT INTO scripts ({SCRIPT_COLUMNS})
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(management_id) DO UPDATE SET
+                    title = excluded.title,
+                    broadcast_date = excluded.broadcast_date,
+                    script_url = excluded.script_url,
+                    source_sheet = excluded.source_sheet,
+                    content_hash = excluded.content_hash,
+                    management_key = excluded.management_key,
+                    broadcast_date_key = excluded.broadcast_date_key,
+                    updated_at = CURRENT_TIMESTAMP
+            """, list(scripts.values()))
+            script_id_map = dict(out.execute(f"SELECT management_id, id FROM scripts {where}", (upserted,)))
             
-            if classification.content_type == 'dialogue':
-                new_cursor.execute("""
-                    INSERT INTO character_dialogue 
-                    (script_id, row_number, character_name, dialogue_text, voice_instruction, original_column)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (script_id, row['row_number'], row['character_name'], 
-                     row['dialogue'], row['voice_instruction'], row['dialogue_column']))
-                stats['character_dialogue'] += 1
-                
-            elif classification.content_type == 'scene_description':
-                new_cursor.execute("""
-                    INSERT INTO scene_descriptions 
-                    (script_id, row_number, description_text, filming_instruction, original_column)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (script_id, row['row_number'], row['dialogue'], 
-                     row['filming_instruction'], row['dialogue_column']))
-                stats['scene_descriptions'] += 1
-                
-            elif classification.content_type == 'visual_effect':
-                effect_type = self._detect_effect_type(row['dialogue'])
-                new_cursor.execute("""
-                    INSERT INTO visual_effects 
-                    (script_id, row_number, effect_description, effect_type, original_column)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (script_id, row['row_number'], row['dialogue'], 
-                     effect_type, row['dialogue_column']))
-                stats['visual_effects'] += 1
-                
-            elif classification.content_type == 'audio_instruction':
-                audio_type = self._detect_audio_type(row['dialogue'])
-                file_ref = self._extract_file_reference(row['dialogue'])
-                new_cursor.execute("""
-                    INSERT INTO audio_instructions 
-                    (script_id, row_number, audio_description, audio_type, file_reference, original_column)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """, (script_id, row['row_number'], row['dialogue'], 
-                     audio_type, file_ref, row['dialogue_column']))
-                stats['audio_instructions'] += 1
-                
-            elif classification.content_type == 'tech_instruction':
-                note_type = 'general'
-                if row['filming_instruction']:
-                    note_type = 'filming'
-                elif row['editing_instruction']:
-                    note_type = 'editing'
-                    
-                new_cursor.execute("""
-                    INSERT INTO technical_notes 
-                    (script_id, row_number, note_text, note_type, original_column)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (script_id, row['row_number'], row['dialogue'], 
-                     note_type, row['dialogue_column']))
-                stats['technical_notes'] += 1
-                
-            else:  # empty
-                stats['empty_ignored'] += 1
+            # Reclassify their rows
+            total_rows = self.conn.execute(f"SELECT COUNT(*) FROM script_lines {where}", (upserted,)).fetchone()[0]
+            progress.start(total_rows, stats, 'content')
+            if workers > 1:
+                batches = self._parallel_batches(script_id_map, workers, management_ids=changed + new)
+            else:
+                batches = self._serial_batches(script_id_map, management_ids=changed + new)
+            writer = BulkWriter(out)
+            for inserts, counts, _ in batches:
+                writer.add(inserts)
+                for key, count in counts.items():
+                    stats[key] += count
+                progress.update(stats)
+            writer.flush()
             
-            if stats['total_processed'] % 10000 == 0:
-                print(f"Processed {stats['total_processed']} rows...")
-                new_conn.commit()
-        
-        new_conn.commit()
-        new_conn.close()
+            progress.start_phase('timeline', stats)
+            stats['script_timeline'] = self.build_script_timeline(out, list(script_id_map.values()))
+            
+            # The changed rows can shift the statistics the planner relies on
+            progress.start_phase('indexes', stats)
+            out.execute("ANALYZE")
+            out.commit()
+        except BaseException:
+            out.rollback()
+            raise
+        finally:
+            out.close()
         
+        progress.finish(stats)
         return stats
 
-    def _detect_effect_type(self, text: str) -> str:
+    def build_script_timeline(self, conn: sqlite3.Connection, script_ids: Optional[List[int]] = None) -> int:
+        """Fill script_timeline from the content tables (only for script_ids, if given); return rows written"""
+        
+        where = ''
+        params = []
+        if script_ids is not None:
+            where = 'WHERE script_id IN (SELECT value FROM json_each(?))'
+            params = [json.dumps(script_ids)]
+        
+        selects = []
+        for rank, (content_type, table, text_column, character_column,
+                   voice_column, filming_column) in enumerate(TIMELINE_SOURCES):
+            selects.append(f"""
+                SELECT script_id, COALESCE(row_number, 0), {rank}, id, '{content_type}',
+                       {character_column or 'NULL'}, {text_column},
+                       {voice_column or 'NULL'}, {filming_column or 'NULL'}
+                FROM {table} {where}
+            """)
+        
+        conn.execute(f"DELETE FROM script_timeline {where}", params)
+        # Inserting in primary key order appends to the b-tree
+        cursor = conn.execute(f"""
+            INSERT INTO script_timeline
+            (script_id, row_number, content_rank, content_id, content_type,
+             character_name, text, voice_instruction, filming_instruction)
+            {' UNION ALL '.join(selects)}
+            ORDER BY 1, 2, 3, 4
+        """, params * len(TIMELINE_SOURCES))
+        return cursor.rowcount
+
+    @staticmethod
+    def _detect_effect_type(text: str) -> str:
         """Detect the type of visual effect"""
         if 'テロップ' in text:
             return 'telop'
@@ -378,7 +938,8 @@ class DatabaseReorganizer:
         else:
             return 'general'
 
-    def _detect_audio_type(self, text: str) -> str:
+    @staticmethod
+    def _detect_audio_type(text: str) -> str:
         """Detect the type of audio instruction"""
         if 'BGM' in text or '音楽' in text:
             return 'bgm'
@@ -389,7 +950,8 @@ class DatabaseReorganizer:
         else:
             return 'general'
 
-    def _extract_file_reference(self, text: str) -> Optional[str]:
+    @staticmethod
+    def _extract_file_reference(text: str) -> Optional[str]:
         """Extract file references from text"""
         url_match = re.search(r'https?://[^\s]+', text)
         if url_match:
@@ -474,6 +1036,7 @@ The reorganized database separates content into specialized tables:
 4. **visual_effects**: CG, animations, visual elements
 5. **audio_instructions**: BGM, SE, music notes
 6. **technical_notes**: Production and filming notes
+7. **script_timeline**: Every content row in script order ({stats.get('script_timeline', 0):,} rows)
 
 ### Benefits of New Structure
 
@@ -513,8 +1076,11 @@ ORDER BY v.row_number;
 
 ### Get complete script content in order:
 ```sql
--- Complex query to reconstruct full script
--- (Implementation would require UNION of all content tables)
+SELECT t.row_number, t.content_type, t.character_name, t.text
+FROM script_timeline t
+JOIN scripts s ON t.script_id = s.id
+WHERE s.management_id = 'B1039'
+ORDER BY t.row_number, t.content_rank, t.content_id;
 ```
 """
         
@@ -525,10 +1091,109 @@ ORDER BY v.row_number;
         self.conn.close()
 
 
+def classify_rows(classifier: ContentClassifier, script_id_map: Dict[str, int],
+                  rows: List[Tuple]) -> Tuple[Dict[str, List[Tuple]], Dict[str, int]]:
+    """Classify SOURCE_COLUMNS rows into INSERT_SQL parameters per table, plus stats counts"""
+    inserts = {table: [] for table in INSERT_SQL}
+    counts = dict.fromkeys(INSERT_SQL, 0)
+    counts['total_processed'] = len(rows)
+    counts['empty_ignored'] = 0
+    
+    for (management_id, row_number, character_name, dialogue, voice_instruction,
+         filming_instruction, editing_instruction, column, _rowid) in rows:
+        script_id = script_id_map[management_id]
+        content_type = classifier.classify(character_name, dialogue).content_type
+        
+        if content_type == 'dialogue':
+            inserts['character_dialogue'].append(
+                (script_id, row_number, character_name, dialogue, voice_instruction, column))
+            
+        elif content_type == 'scene_description':
+            inserts['scene_descriptions'].append(
+                (script_id, row_number, dialogue, filming_instruction, column))
+            
+        elif content_type == 'visual_effect':
+            inserts['visual_effects'].append(
+                (script_id, row_number, dialogue, DatabaseReorganizer._detect_effect_type(dialogue), column))
+            
+        elif content_type == 'audio_instruction':
+            inserts['audio_instructions'].append(
+                (script_id, row_number, dialogue, DatabaseReorganizer._detect_audio_type(dialogue),
+                 DatabaseReorganizer._extract_file_reference(dialogue), column))
+            
+        elif content_type == 'tech_instruction':
+            note_type = 'general'
+            if filming_instruction:
+                note_type = 'filming'
+            elif editing_instruction:
+                note_type = 'editing'
+            inserts['technical_notes'].append((script_id, row_number, dialogue, note_type, column))
+            
+        else:  # empty
+            counts['empty_ignored'] += 1
+    
+    for table, table_rows in inserts.items():
+        counts[table] = len(table_rows)
+    return inserts, counts
+
+
+def source_key(row: Tuple) -> Tuple[str, int, int]:
+    """(management_id, row_number, rowid) of a SOURCE_COLUMNS row, as compared by SOURCE_AFTER"""
+    return row[0], row[1] if row[1] is not None else 0, row[-1]
+
+
+def script_record(script: Tuple, content_hash: str) -> Tuple:
+    """SCRIPT_COLUMNS values for a SCRIPTS_SQL row"""
+    management_id, _, broadcast_date = script[:3]
+    return tuple(script) + (content_hash, normalize_management_id(management_id),
+                            normalize_broadcast_date(broadcast_date))
+
+
+# Per-process state of parallel reorganization workers
+_worker_conn: Optional[sqlite3.Connection] = None
+_worker_classifier: Optional[ContentClassifier] = None
+_worker_script_ids: Dict[str, int] = {}
+_worker_after: Optional[Tuple] = None
+
+
+def _init_worker(db_path: str, classifier: ContentClassifier, script_id_map: Dict[str, int],
+                 after: Optional[Tuple] = None):
+    global _worker_conn, _worker_classifier, _worker_script_ids, _worker_after
+    # as_uri() percent-encodes the path, so '?', '#' and '%' in it are not read as URI syntax
+    _worker_conn = sqlite3.connect(pathlib.Path(db_path).resolve().as_uri() + '?mode=ro', uri=True)
+    _worker_classifier = classifier
+    _worker_script_ids = script_id_map
+    _worker_after = after
+
+
+def _classify_unit(first_id: str, last_id: str) -> Tuple[Dict[str, List[Tuple]], Dict[str, int], Tuple]:
+    where, params = "management_id BETWEEN ? AND ?", (first_id, last_id)
+    if _worker_after:
+        where, params = f"{where} AND {SOURCE_AFTER}", params + tuple(_worker_after)
+    rows = _worker_conn.execute(
+        f"SELECT {SOURCE_COLUMNS} FROM script_lines WHERE {where} {SOURCE_ORDER}", params
+    ).fetchall()
+    return classify_rows(_worker_classifier, _worker_script_ids, rows) + (source_key(rows[-1]),)
+
+
 def main():
     """Main execution function"""
     
-    db_path = "youtube_search_complete_all.db"
+    parser = argparse.ArgumentParser(description='Reorganize the script database into per-content-type tables')
+    parser.add_argument('--database', default='youtube_search_complete_all.db', help='source database')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='classifier processes (1 classifies in the writer process)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only reprocess scripts added, changed or deleted since the last run')
+    parser.add_argument('--restart', action='store_true',
+                        help='discard an interrupted build instead of resuming it from its checkpoint')
+    parser.add_argument('--progress-json', metavar='PATH',
+                        help='append progress events (rows/s, ETA, per-table rates) to this file as JSON lines')
+    args = parser.parse_args()
+    
+    db_path = args.database
+    progress_file = open(args.progress_json, 'a', encoding='utf-8') if args.progress_json else None
+    progress = ProgressReporter(progress_file)
     
     print("SunSun Script Database Reorganizer")
     print("==================================")
@@ -538,13 +1203,24 @@ def main():
     reorganizer = DatabaseReorganizer(db_path)
     
     try:
+        if args.incremental:
+            print("\nUpdating reorganized database...")
+            stats = reorganizer.reorganize_incremental(workers=max(1, args.workers), progress=progress)
+            print(f"\n✅ Reorganized database is up to date: {db_path.replace('.db', '_reorganized.db')}")
+            print(f"   New scripts: {stats['new_scripts']:,}, changed: {stats['changed_scripts']:,}, "
+                  f"deleted: {stats['deleted_scripts']:,}, unchanged: {stats['unchanged_scripts']:,}")
+            print(f"   Rows reclassified: {stats['total_processed']:,}"
+                  f"{' (full rebuild)' if stats['full_rebuild'] else ''}")
+            return
+        
         # Analyze current structure
         print("\n1. Analyzing current database structure...")
         analysis = reorganizer.analyze_content_patterns()
         
         # Reorganize database
         print("\n2. Reorganizing database structure...")
-        stats = reorganizer.reorganize_database()
+        stats = reorganizer.reorganize_database(workers=max(1, args.workers), progress=progress,
+                                                restart=args.restart)
         
         # Generate report
         print("\n3. Generating analysis report...")
@@ -556,17 +1232,26 @@ def main():
         
         print(f"\n✅ Reorganization complete!")
         print(f"📊 Original database: {db_path}")
-        print(f"📊 Reorganized database: youtube_search_complete_all_reorganized.db")
+        print(f"📊 Reorganized database: {db_path.replace('.db', '_reorganized.db')}")
         print(f"📋 Report saved to: database_analysis_report.md")
         
         print(f"\n📈 Summary:")
+        # Each processed row lands in exactly one content table or is ignored;
+        # other counters (script_timeline) are not shares of total_processed
+        partition = set(INSERT_SQL) | {'empty_ignored'}
         for key, value in stats.items():
-            if key != 'total_processed':
+            if key == 'total_processed':
+                continue
+            if key in partition and stats['total_processed']:
                 percentage = (value / stats['total_processed']) * 100
                 print(f"   {key.replace('_', ' ').title()}: {value:,} ({percentage:.1f}%)")
+            else:
+                print(f"   {key.replace('_', ' ').title()}: {value:,}")
     
     finally:
         reorganizer.close()
+        if progress_file is not None:
+            progress_file.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Asyncio Search Service for SunSun Script Database
+
+An event-loop variant of the api/search.py API for heavy internal traffic.
+It uses the same request and response schema as ``handler.do_POST``:
+1. One event loop accepts and parses any number of keep-alive connections
+2. SQLite work runs on a bounded thread pool, each worker with its own
+   pooled read-only connection (see search_server.py)
+3. Every request gets a deadline, enforced with SQLite's progress handler,
+   so a runaway '%keyword%' scan is interrupted instead of holding a worker
+4. Requests arriving while every worker (and the optional queue) is busy
+   are shed at once with 503 and Retry-After
+
+Usage:
+    python search_async_server.py --port 8000 --workers 8 --deadline 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+
+# search_server puts api/ on sys.path, so search is importable after it
+from search_server import ConnectionPool
+import search  # noqa: E402
+
+DEFAULT_WORKERS = int(os.environ.get('SEARCH_ASYNC_WORKERS', str(min(32, (os.cpu_count() or 1) * 2))))
+DEFAULT_QUEUE = int(os.environ.get('SEARCH_ASYNC_QUEUE', '0'))
+DEFAULT_DEADLINE = float(os.environ.get('SEARCH_ASYNC_DEADLINE', '5'))
+DEFAULT_KEEPALIVE_TIMEOUT = float(os.environ.get('SEARCH_ASYNC_KEEPALIVE_TIMEOUT', '5'))
+
+# SQLite virtual machine instructions between deadline checks
+PROGRESS_INTERVAL = 10000
+
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+
+OVERLOADED_MESSAGE = 'サーバーが混み合っています。しばらくしてから再度お試しください'
+
+
+class BadRequest(Exception):
+    """Malformed HTTP request; the connection is closed after the reply"""
+
+    def __init__(self, status: HTTPStatus):
+        super().__init__(status.phrase)
+        self.status = status
+
+
+class AsyncSearchServer:
+    """Serves the search API from one event loop with a bounded SQLite executor"""
+
+    def __init__(self, workers: int, queue: int, deadline: float, keepalive_timeout: float):
+        self.workers = workers
+        self.capacity = workers + queue
+        self.deadline = deadline
+        self.keepalive_timeout = keepalive_timeout
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search-worker')
+        self.pool = ConnectionPool(search.database_cache, workers)
+        # Content type searches and script views lease from the reorganized database
+        self.content_pool = None
+        if search.reorganized_cache is not None:
+            self.content_pool = ConnectionPool(search.reorganized_cache, workers)
+        # Requests submitted to the executor; only touched on the event loop
+        self.active = 0
+        self.shed = 0
+        # Connection handler tasks and their writers
+        self.connections = {}
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def serve(self, host: str, port: int):
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            self.loop.add_signal_handler(signum, stop.set)
+
+        address = server.sockets[0].getsockname()
+        print(f"Listening on http://{address[0]}:{address[1]}/ "
+              f"({self.workers} workers, {self.capacity - self.workers} queued, {self.deadline}s deadline)")
+
+        await stop.wait()
+        # Stop accepting, let in-flight requests finish, then drop idle connections
+        server.close()
+        while self.active:
+            await asyncio.sleep(0.05)
+        for writer in list(self.connections.values()):
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        await server.wait_closed()
+
+        self.executor.shutdown(wait=True)
+        for pool in (self.pool, self.content_pool):
+            if pool is not None:
+                pool.close()
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), self.keepalive_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except BadRequest as e:
+                    await self.send_json(writer, e.status, {'success': False, 'error': e.status.phrase}, close=True)
+                    break
+                if request is None:
+                    break
+                keep_alive = await self.dispatch(writer, *request)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict, bytes, bool]]:
+        """Read one request; return (method, target, headers, body, keep_alive) or None at EOF"""
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise BadRequest(HTTPStatus.REQUEST_URI_TOO_LONG)
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3 or not parts[2].startswith('HTTP/1.'):
+            raise BadRequest(HTTPStatus.BAD_REQUEST)
+        method, target, version = parts
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise BadRequest(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', '0'))
+        except ValueError:
+            raise BadRequest(HTTPStatus.BAD_REQUEST)
+        if length > MAX_BODY_BYTES:
+            raise BadRequest(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length > 0 else b''
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = version == 'HTTP/1.1' and connection != 'close'
+        return method, target, headers, body, keep_alive
+
+    async def dispatch(self, writer, method, target, headers, body, keep_alive) -> bool:
+        """Answer one request; return whether the connection stays open"""
+        if method == 'OPTIONS':
+            await self.send(writer, HTTPStatus.OK, {
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type'
+            }, b'', not keep_alive)
+            return keep_alive
+        data = None
+        if method == 'GET':
+            query = urllib.parse.parse_qs(urllib.parse.urlparse(target).query, keep_blank_values=True)
+            if 'script' in query:
+                # Script views are answered on a worker like a POST body naming 'script'
+                data = {name: values[0] for name, values in query.items()}
+            elif 'metrics' in query:
+                snapshot = search.metrics.snapshot()
+                snapshot['async'] = {'workers': self.workers, 'active': self.active, 'shed': self.shed}
+                await self.send_json(writer, HTTPStatus.OK, snapshot, not keep_alive, {'Cache-Control': 'no-store'})
+                return keep_alive
+            else:
+                await self.send_json(writer, HTTPStatus.NOT_FOUND,
+                                     {'success': False, 'error': '不明なエンドポイントです'}, not keep_alive)
+                return keep_alive
+        elif method != 'POST':
+            await self.send_json(writer, HTTPStatus.METHOD_NOT_ALLOWED,
+                                 {'success': False, 'error': HTTPStatus.METHOD_NOT_ALLOWED.phrase}, not keep_alive)
+            return keep_alive
+
+        if self.active >= self.capacity:
+            # Shed load before any work is queued
+            self.shed += 1
+            search.metrics.observe('shed', 1)
+            await self.send_json(writer, HTTPStatus.SERVICE_UNAVAILABLE,
+                                 {'success': False, 'error': OVERLOADED_MESSAGE}, not keep_alive, {'Retry-After': '1'})
+            return keep_alive
+
+        if data is None:
+            try:
+                data = json.loads(body.decode('utf-8')) if body else {}
+            except (UnicodeDecodeError, ValueError):
+                data = {}
+            if not isinstance(data, dict):
+                data = {}
+
+        # NDJSON streaming is requested with a flag or an Accept header
+        stream = bool(data.get('stream')) or 'application/x-ndjson' in headers.get('accept', '')
+
+        # Batch requests carry a list of search specs under 'queries'
+        if isinstance(data.get('queries'), list):
+            params = None
+        else:
+            params = search.parse_search_params(data, search.MAX_STREAM_LIMIT if stream else search.MAX_LIMIT)
+
+        self.active += 1
+        try:
+            encoding = search.negotiate_encoding(headers.get('accept-encoding'))
+            if stream and params is not None and not params['error']:
+                return await self.stream(writer, params, keep_alive, encoding)
+            timer = search.RequestTimer()
+            try:
+                body, raw_size, encoding, rows = await self.loop.run_in_executor(
+                    self.executor, self.respond, data, params, timer, encoding
+                )
+            except Exception as e:
+                await self.send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR,
+                                     {'success': False, 'error': f'サーバーエラー: {str(e)}'}, not keep_alive)
+                return keep_alive
+            response_headers = {'Content-Type': 'application/json; charset=utf-8'}
+            if encoding:
+                response_headers['Content-Encoding'] = encoding
+            response_headers.update({
+                'Vary': 'Accept-Encoding',
+                'Server-Timing': timer.server_timing(),
+                'Timing-Allow-Origin': '*'
+            })
+            started = time.perf_counter()
+            await self.send(writer, HTTPStatus.OK, response_headers, body, not keep_alive)
+            timer.add('write', time.perf_counter() - started)
+            search.metrics.record_request(timer, rows, len(body), raw_size)
+            return keep_alive
+        finally:
+            self.active -= 1
+
+    def respond(self, data, params, timer, encoding) -> Tuple[bytes, int, Optional[str], int]:
+        """Build, encode and compress a JSON response (runs on a worker thread).
+
+        Returns ``(body, raw_size, encoding, rows)``; encoding is None when
+        the body is below search.COMPRESSION_MIN_BYTES.
+        """
+        lease = Lease(self.pool, self.deadline, self.content_pool)
+        try:
+            response = search.search_response(data, params, lease.get_connection, timer)
+        finally:
+            lease.release()
+        with timer.phase('encode'):
+            body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        raw_size = len(body)
+        if raw_size < search.COMPRESSION_MIN_BYTES:
+            encoding = None
+        if encoding:
+            with timer.phase('compress'):
+                body = search.compress_body(body, encoding)
+        return body, raw_size, encoding, search.response_rows(response, params)
+
+    async def stream(self, writer, params, keep_alive, encoding) -> bool:
+        """Send NDJSON results, chunked on HTTP/1.1, produced on a worker thread"""
+        chunked = keep_alive
+        timer = search.RequestTimer()
+        headers = {'Content-Type': 'application/x-ndjson; charset=utf-8', 'Timing-Allow-Origin': '*'}
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        headers['Vary'] = 'Accept-Encoding'
+        if chunked:
+            headers['Transfer-Encoding'] = 'chunked'
+        writer.write(self.head(HTTPStatus.OK, headers, None, not chunked))
+
+        outcome = {}
+        bytes_written, raw_bytes = await self.loop.run_in_executor(
+            self.executor, self.produce_stream, writer, params, timer, outcome, chunked, encoding
+        )
+        if chunked:
+            writer.write(b'0\r\n\r\n')
+        await writer.drain()
+        search.metrics.record_request(timer, outcome.get('count', 0), bytes_written, raw_bytes)
+        return chunked
+
+    def produce_stream(self, writer, params, timer, outcome, chunked, encoding) -> Tuple[int, int]:
+        # Runs on a worker thread; each chunk waits for the socket to drain,
+        # so a slow client holds back the query instead of filling memory
+        lease = Lease(self.pool, self.deadline, self.content_pool)
+        compressor = search.ResponseCompressor(encoding) if encoding else None
+        bytes_written = 0
+        raw_bytes = 0
+
+        def send(data):
+            nonlocal bytes_written
+            if not data:
+                # An empty chunk would end a chunked body
+                return
+            started = time.perf_counter()
+            frame = b'%x\r\n%s\r\n' % (len(data), data) if chunked else data
+            asyncio.run_coroutine_threadsafe(self.write(writer, frame), self.loop).result()
+            bytes_written += len(data)
+            timer.add('write', time.perf_counter() - started)
+
+        try:
+            conn = None
+            connect_error = None
+            try:
+                with timer.phase('connect'):
+                    conn = lease.get_connection(content=bool(params['content_types']))
+            except Exception as e:
+                connect_error = e
+            for data in search.stream_chunks(conn, connect_error, params, timer, outcome):
+                raw_bytes += len(data)
+                if compressor is not None:
+                    started = time.perf_counter()
+                    data = compressor.compress(data, flush=True)
+                    timer.add('compress', time.perf_counter() - started)
+                send(data)
+                # The deadline bounds the time to produce each chunk, not the whole stream
+                lease.extend()
+            if compressor is not None:
+                send(compressor.finish())
+        finally:
+            lease.release()
+        return bytes_written, raw_bytes
+
+    @staticmethod
+    async def write(writer, data):
+        writer.write(data)
+        await writer.drain()
+
+    @staticmethod
+    def head(status: HTTPStatus, headers: Dict, length: Optional[int], close: bool) -> bytes:
+        lines = [f'HTTP/1.1 {status.value} {status.phrase}', 'Access-Control-Allow-Origin: *']
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        if length is not None:
+            lines.append(f'Content-Length: {length}')
+        if close:
+            lines.append('Connection: close')
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def send(self, writer, status, headers, body, close):
+        writer.write(self.head(status, headers, len(body), close) + body)
+        await writer.drain()
+
+    async def send_json(self, writer, status, response, close, headers=None):
+        body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+        await self.send(writer, status, dict(headers or {}, **{'Content-Type': 'application/json; charset=utf-8'}),
+                        body, close)
+
+
+class Lease:
+    """One request's connections, with its deadline installed as a progress handler.
+
+    ``get_connection()`` leases from the snapshot pool and
+    ``get_connection(content=True)`` from the reorganized database's pool;
+    each is leased at most once per request.
+    """
+
+    def __init__(self, pool: Optional[ConnectionPool], budget: float,
+                 content_pool: Optional[ConnectionPool] = None):
+        self.pools = {False: pool, True: content_pool}
+        self.budget = budget
+        self.deadline = time.monotonic() + budget
+        self.conns = {}
+
+    def get_connection(self, content=False):
+        conn = self.conns.get(content)
+        if conn is None:
+            pool = self.pools[content]
+            if pool is None:
+                # Without a pool the cache's shared connection is used as is:
+                # its handler cannot be set per request
+                conn = (search.reorganized_cache if content else search.database_cache).get_connection()
+            else:
+                conn = pool.acquire()
+                conn.set_progress_handler(self.expired, PROGRESS_INTERVAL)
+            self.conns[content] = conn
+        return conn
+
+    def expired(self):
+        # A non-zero return makes SQLite abort the statement as 'interrupted'
+        return time.monotonic() > self.deadline
+
+    def extend(self):
+        self.deadline = time.monotonic() + self.budget
+
+    def release(self):
+        for content, conn in self.conns.items():
+            pool = self.pools[content]
+            if pool is not None:
+                conn.set_progress_handler(None, 0)
+                pool.release(conn)
+        self.conns = {}
+
+
+def main():
+    """Main execution function"""
+
+    parser = argparse.ArgumentParser(description='Serve the script search API from an asyncio event loop')
+    parser.add_argument('--host', default=os.environ.get('SEARCH_ASYNC_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SEARCH_ASYNC_PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='SQLite worker threads')
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE,
+                        help='requests allowed to wait for a worker before shedding with 503')
+    parser.add_argument('--deadline', type=float, default=DEFAULT_DEADLINE, help='seconds of SQLite work per request')
+    parser.add_argument('--keepalive-timeout', type=float, default=DEFAULT_KEEPALIVE_TIMEOUT,
+                        help='seconds before an idle keep-alive connection is closed')
+    args = parser.parse_args()
+
+    print("SunSun Script Async Search Service")
+    print("==================================")
+    print(f"Database: {search.DATABASE_URL if search.DATABASE_MODE == 'remote' else search.DATABASE_PATH}")
+
+    # Load the snapshot before accepting traffic
+    search.database_cache.get_connection()
+
+    server = AsyncSearchServer(max(1, args.workers), max(0, args.queue), args.deadline, args.keepalive_timeout)
+    asyncio.run(server.serve(args.host, args.port))
+    print("✅ Server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Standalone Search Server for SunSun Script Database
+
+Serves the api/search.py handler outside Vercel, for self-hosted
+deployments that keep the snapshot on local disk:
+1. A fixed pool of worker threads handles connections, so load beyond the
+   pool queues instead of spawning unbounded threads
+2. Each request borrows a read-only SQLite connection from a pool (one per
+   worker by default), so queries run in parallel instead of queueing on
+   one shared connection; content type searches and script views borrow
+   from a second pool over the reorganized database
+3. HTTP/1.1 keep-alive, with idle connections closed after a timeout
+4. SIGTERM/SIGINT stop accepting connections and let in-flight requests
+   finish before exiting
+
+The database location and the other SEARCH_* settings are read from the
+environment, as in api/search.py.
+
+Usage:
+    python search_server.py --port 8000 --workers 16 --connections 16
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+from typing import List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'api'))
+
+import search  # noqa: E402
+
+DEFAULT_WORKERS = int(os.environ.get('SEARCH_SERVER_WORKERS', str(min(32, (os.cpu_count() or 1) * 4))))
+DEFAULT_KEEPALIVE_TIMEOUT = float(os.environ.get('SEARCH_SERVER_KEEPALIVE_TIMEOUT', '5'))
+
+
+class ConnectionPool:
+    """Read-only connections to the current snapshot, lent out one request at a time.
+
+    When DatabaseCache swaps in a new snapshot, idle connections to the old
+    one are closed and borrowed ones are closed as they come back.
+    """
+
+    def __init__(self, cache: 'search.DatabaseCache', size: int):
+        self.cache = cache
+        self.size = size
+        self.idle: List = []
+        self.opened = 0
+        self.version: Optional[int] = None
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Borrow a connection, waiting if all ``size`` connections are in use"""
+        primary = self.cache.get_connection()
+        with self.condition:
+            if primary.version != self.version:
+                stale, self.idle = self.idle, []
+                self.version = primary.version
+                for conn in stale:
+                    conn.close()
+                self.opened -= len(stale)
+            while not self.idle and self.opened >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+
+        try:
+            return self.cache.open_reader()
+        except BaseException:
+            with self.condition:
+                self.opened -= 1
+                self.condition.notify()
+            raise
+
+    def release(self, conn):
+        """Return a borrowed connection"""
+        with self.condition:
+            if conn.version == self.version:
+                self.idle.append(conn)
+            else:
+                conn.close()
+                self.opened -= 1
+            self.condition.notify()
+
+    def close(self):
+        """Close idle connections; borrowed ones are closed on release"""
+        with self.condition:
+            for conn in self.idle:
+                conn.close()
+            self.opened -= len(self.idle)
+            self.idle = []
+            self.version = None
+
+
+class PooledRequestHandler(search.handler):
+    """The API handler with keep-alive and a pooled connection per request"""
+
+    protocol_version = 'HTTP/1.1'
+
+    # Seconds an idle keep-alive connection may hold a worker
+    timeout = DEFAULT_KEEPALIVE_TIMEOUT
+
+    def _get_connection(self, content=False):
+        pool = self.server.content_pool if content else self.server.pool
+        if pool is None:
+            return super()._get_connection(content)
+        conn = self._pooled.get(pool)
+        if conn is None:
+            conn = self._pooled[pool] = pool.acquire()
+        return conn
+
+    def handle_one_request(self):
+        self._pooled = {}
+        try:
+            super().handle_one_request()
+        finally:
+            for pool, conn in self._pooled.items():
+                pool.release(conn)
+            self._pooled = {}
+        if self.server.stopping:
+            # Finish the current request, then let the worker go
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """HTTP server that hands connections to a fixed pool of worker threads"""
+
+    daemon_threads = True
+
+    def __init__(self, address, workers: int, pool: Optional[ConnectionPool], quiet: bool = False,
+                 content_pool: Optional[ConnectionPool] = None):
+        super().__init__(address, PooledRequestHandler)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='search-worker')
+        self.pool = pool
+        self.content_pool = content_pool
+        self.quiet = quiet
+        self.stopping = False
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def stop(self):
+        """Stop accepting connections and wait for in-flight requests"""
+        self.stopping = True
+        self.shutdown()
+        self.server_close()
+        self.executor.shutdown(wait=True)
+        for pool in (self.pool, self.content_pool):
+            if pool is not None:
+                pool.close()
+
+
+def main():
+    """Main execution function"""
+
+    parser = argparse.ArgumentParser(description='Serve the script search API with a pool of worker threads')
+    parser.add_argument('--host', default=os.environ.get('SEARCH_SERVER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('SEARCH_SERVER_PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='worker threads')
+    parser.add_argument('--connections', type=int, default=int(os.environ.get('SEARCH_SERVER_CONNECTIONS', '0')),
+                        help='read-only SQLite connections (default: one per worker)')
+    parser.add_argument('--keepalive-timeout', type=float, default=DEFAULT_KEEPALIVE_TIMEOUT,
+                        help='seconds before an idle keep-alive connection is closed')
+    parser.add_argument('--quiet', action='store_true', help='do not log each request')
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    connections = max(1, min(args.connections or workers, workers))
+    PooledRequestHandler.timeout = args.keepalive_timeout
+
+    print("SunSun Script Search Server")
+    print("===========================")
+    print(f"Database: {search.DATABASE_URL if search.DATABASE_MODE == 'remote' else search.DATABASE_PATH}")
+
+    # Load the snapshot before accepting traffic
+    search.database_cache.get_connection()
+
+    # Remote snapshots are pooled too: each reader opens the snapshot's VFS
+    pool = ConnectionPool(search.database_cache, connections)
+
+    content_pool = None
+    if search.reorganized_cache is not None:
+        content_pool = ConnectionPool(search.reorganized_cache, connections)
+
+    server = PooledHTTPServer((args.host, args.port), workers, pool, quiet=args.quiet, content_pool=content_pool)
+    stopped = threading.Event()
+
+    def request_stop(signum, frame):
+        # shutdown() waits for serve_forever(), so it cannot run on this thread
+        if not stopped.is_set():
+            stopped.set()
+            threading.Thread(target=server.stop, name='search-shutdown').start()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    print(f"Listening on http://{args.host}:{server.server_address[1]}/ "
+          f"({workers} workers, {connections} connections)")
+    server.serve_forever()
+
+    # Wait for the shutdown thread to drain in-flight requests
+    for thread in threading.enumerate():
+        if thread.name == 'search-shutdown':
+            thread.join()
+    print("✅ Server stopped")
+
+
+if __name__ == "__main__":
+    main()
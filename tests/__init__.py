@@ -0,0 +1,79 @@
+"""
+Tests for the SunSun script search API and database tools.
+
+api/search.py is a standalone serverless handler, so tests import it from
+the api directory (see API_DIR). Run from the repository root:
+
+    python -m pytest -q
+
+Most tests search a generated corpus; CorpusFixture sets one up.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+API_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api')
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+import database_reorganizer  # noqa: E402
+import search  # noqa: E402
+from benchmarks.corpus import CorpusGenerator  # noqa: E402
+
+# Tables of a reorganized database
+REORGANIZED_TABLES = ('scripts', 'character_dialogue', 'scene_descriptions', 'visual_effects',
+                      'audio_instructions', 'technical_notes', 'script_timeline')
+
+
+class CorpusFixture:
+    """A CorpusGenerator corpus in a temporary directory, and the snapshots opened on it.
+
+    ``source`` is the generated script_lines database. ``cache()`` serves
+    a database in the directory through a DatabaseCache, as the API would
+    after downloading it; ``close()`` closes those connections and
+    removes the directory.
+    """
+
+    def __init__(self, rows, seed, prefix='search-test-'):
+        self.workdir = tempfile.mkdtemp(prefix=prefix)
+        self.source = self.path('corpus.db')
+        self.caches = []
+        CorpusGenerator(rows, seed=seed).write(self.source)
+
+    def path(self, name):
+        return os.path.join(self.workdir, name)
+
+    def reorganize(self, name='reorganized.db', **options):
+        """Run database_reorganizer on the source into ``name``; return its stats"""
+        reorganizer = database_reorganizer.DatabaseReorganizer(self.source)
+        try:
+            return reorganizer.reorganize_database(self.path(name), **options)
+        finally:
+            reorganizer.conn.close()
+
+    def cache(self, name='corpus.db', cache_class=None, ttl=3600):
+        """A ``cache_class`` (DatabaseCache by default) serving database ``name``"""
+        cache = (cache_class or search.DatabaseCache)(None, self.path(name), ttl)
+        cache.load()
+        self.caches.append(cache)
+        return cache
+
+    def close(self):
+        for cache in self.caches:
+            cache.conn.close()
+        self.caches = []
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+def table_rows(path, table):
+    """Every row of ``table``, without the write timestamps, in a stable order"""
+    conn = sqlite3.connect(path)
+    try:
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')
+                   if row[1] not in ('created_at', 'updated_at')]
+        return conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY 1, 2, 3").fetchall()
+    finally:
+        conn.close()
@@ -0,0 +1,114 @@
+"""AsyncSearchServer: load shedding and per-request deadlines on the snapshot pool"""
+
+import asyncio
+import json
+import threading
+import unittest
+from unittest import mock
+
+from tests import CorpusFixture
+
+import search
+from search_async_server import AsyncSearchServer, Lease, OVERLOADED_MESSAGE
+from search_server import ConnectionPool
+
+
+async def post(port, body):
+    """POST body to the server; return (status, headers, decoded JSON)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    data = json.dumps(body).encode('utf-8')
+    writer.write(b'POST / HTTP/1.1\r\nHost: test\r\nConnection: close\r\n'
+                 b'Content-Length: %d\r\n\r\n%s' % (len(data), data))
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    headers = dict(line.split(': ', 1) for line in lines[1:])
+    return int(lines[0].split()[1]), headers, json.loads(payload)
+
+
+class AsyncServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(3000, seed=9, prefix='async-server-test-')
+        cls.cache = cls.corpus.cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def setUp(self):
+        patcher = mock.patch.object(search, 'database_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sheds_requests_beyond_capacity(self):
+        server = AsyncSearchServer(workers=1, queue=0, deadline=5, keepalive_timeout=5)
+        self.addCleanup(server.pool.close)
+        self.addCleanup(server.executor.shutdown)
+        started = threading.Event()
+        finish = threading.Event()
+        respond = server.respond
+
+        def blocking_respond(*args):
+            started.set()
+            finish.wait(10)
+            return respond(*args)
+
+        async def scenario():
+            server.loop = asyncio.get_running_loop()
+            listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+            port = listener.sockets[0].getsockname()[1]
+            try:
+                # The only worker is busy with the first request...
+                first = asyncio.ensure_future(post(port, {'keyword': 'SE', 'limit': 3}))
+                await server.loop.run_in_executor(None, started.wait, 10)
+                # ...so the second is refused without being queued
+                shed = await post(port, {'keyword': 'SE', 'limit': 3})
+                finish.set()
+                return await first, shed
+            finally:
+                finish.set()
+                listener.close()
+                await listener.wait_closed()
+
+        with mock.patch.object(server, 'respond', blocking_respond):
+            (status, _, response), (shed_status, shed_headers, shed_response) = asyncio.run(scenario())
+        self.assertEqual(status, 200)
+        self.assertTrue(response['success'])
+        self.assertEqual(shed_status, 503)
+        self.assertEqual(shed_headers['Retry-After'], '1')
+        self.assertEqual(shed_response, {'success': False, 'error': OVERLOADED_MESSAGE})
+        self.assertEqual(server.shed, 1)
+        self.assertEqual(server.active, 0)
+
+    def test_snapshot_search_observes_deadline(self):
+        pool = ConnectionPool(self.cache, 1)
+        self.addCleanup(pool.close)
+
+        def respond(budget):
+            body = {'keyword': 'zzzz', 'limit': 10}
+            params = search.parse_search_params(body, search.MAX_LIMIT)
+            lease = Lease(pool, budget)
+            with mock.patch.object(search, 'result_cache', search.ResultCache(0, 0)):
+                try:
+                    return search.search_response(body, params, lease.get_connection, search.RequestTimer())
+                finally:
+                    lease.release()
+
+        response = respond(0)
+        self.assertFalse(response['success'])
+        self.assertEqual(response['error'], search.QUERY_TIMEOUT_MESSAGE)
+        # The pooled reader, not the cache's shared connection, ran the search,
+        # and it comes back usable without the expired handler
+        self.assertEqual((pool.opened, len(pool.idle)), (1, 1))
+        self.assertIsNot(pool.idle[0], self.cache.conn)
+        response = respond(60)
+        self.assertTrue(response['success'])
+        self.assertEqual(response['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
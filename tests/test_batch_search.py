@@ -0,0 +1,68 @@
+"""batch_search: the shared scan and per-keyword queries agree"""
+
+import unittest
+from unittest import mock
+
+from tests import CorpusFixture
+
+import search
+
+KEYWORDS = ['SE', 'うみ', 'ボ', 'CG', 'テロップ', 'gigafile', 'zzzz', 'おにぎり']
+
+# LIKE wildcards and its escape character, which keywords match literally
+WILDCARD_KEYWORDS = ['S_', 'k_', '_2', '%', '100%', '\\', '\\_']
+
+
+class BatchSearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(5000, seed=2, prefix='batch-test-')
+        cls.conn = cls.corpus.cache().conn
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def specs(self):
+        return [
+            search.parse_search_params({'keyword': keyword, 'sort_order': sort_order, 'limit': 7,
+                                        'character_filter': 'サン' if index % 3 == 0 else ''}, search.MAX_LIMIT)
+            for index, keyword in enumerate(KEYWORDS)
+            for sort_order in search.SORT_KEYS
+        ]
+
+    def run_batch(self, scan_min_queries):
+        specs = self.specs()
+        search.result_cache.entries.clear()
+        with mock.patch.object(search, 'BATCH_SCAN_MIN_QUERIES', scan_min_queries):
+            outcomes = search.batch_search(self.conn, specs)
+        return [outcomes[id(spec)] for spec in specs]
+
+    def test_shared_scan_matches_per_keyword_queries(self):
+        self.assertEqual(self.conn.sort_scheme, 'raw')
+        self.assertEqual(self.run_batch(2), self.run_batch(10 ** 6))
+
+    def test_wildcards_match_literally(self):
+        specs = [
+            search.parse_search_params({'keyword': keyword, 'sort_order': sort_order, 'limit': 50}, search.MAX_LIMIT)
+            for keyword in WILDCARD_KEYWORDS
+            for sort_order in search.SORT_KEYS
+        ]
+        self.assertGreaterEqual(len(specs), search.BATCH_SCAN_MIN_QUERIES)
+        search.result_cache.entries.clear()
+        batched = search.batch_search(self.conn, specs)
+        for spec in specs:
+            with self.subTest(keyword=spec['keyword'], sort_order=spec['sort_order']):
+                search.result_cache.entries.clear()
+                alone, _, _ = search.cached_search(self.conn, spec)
+                self.assertEqual(batched[id(spec)][0], alone)
+                for result in alone:
+                    self.assertIn(spec['keyword'], result['dialogue'] + result['character_name'] + result['title'])
+        counts = {spec['keyword']: len(batched[id(spec)][0]) for spec in specs}
+        self.assertEqual((counts['S_'], counts['%']), (0, 0))
+        self.assertGreater(counts['k_'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
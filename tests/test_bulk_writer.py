@@ -0,0 +1,92 @@
+"""BulkWriter batches rows per table, and a bulk-loaded build ends up indexed and compact"""
+
+import os
+import re
+import sqlite3
+import unittest
+from unittest import mock
+
+import database_reorganizer
+from tests import CorpusFixture
+
+
+def dialogue(row_number):
+    return (1, row_number, 'サンサン', f'台詞{row_number}', '', 'dialogue')
+
+
+def note(row_number):
+    return (1, row_number, f'メモ{row_number}', 'general', 'editing_instruction')
+
+
+class BulkWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        corpus = CorpusFixture(10, seed=17, prefix='bulk-writer-test-')
+        self.addCleanup(corpus.close)
+        reorganizer = database_reorganizer.DatabaseReorganizer(corpus.source)
+        self.addCleanup(reorganizer.conn.close)
+        self.conn = sqlite3.connect(':memory:')
+        self.addCleanup(self.conn.close)
+        self.conn.executescript(reorganizer.create_optimized_schema(with_indexes=False))
+
+    def rows(self, table):
+        return [row[1] for row in self.conn.execute(f'SELECT id, row_number FROM {table} ORDER BY id')]
+
+    def test_writes_full_buffers_with_executemany(self):
+        conn = mock.Mock(wraps=self.conn)
+        writer = database_reorganizer.BulkWriter(conn, flush_rows=3)
+
+        writer.add({'character_dialogue': [dialogue(1), dialogue(2)], 'technical_notes': [note(1)]})
+        self.assertEqual(conn.executemany.call_count, 0)
+        self.assertEqual(self.rows('character_dialogue'), [])
+
+        # The third dialogue row fills that buffer; the notes stay buffered
+        writer.add({'character_dialogue': [dialogue(3), dialogue(4)], 'technical_notes': []})
+        self.assertEqual(conn.executemany.call_count, 1)
+        self.assertEqual(self.rows('character_dialogue'), [1, 2, 3, 4])
+        self.assertEqual(self.rows('technical_notes'), [])
+
+        writer.add({'character_dialogue': [dialogue(5)]})
+        writer.flush()
+        writer.flush()
+        self.assertEqual(conn.executemany.call_count, 3)
+        self.assertEqual(self.rows('character_dialogue'), [1, 2, 3, 4, 5])
+        self.assertEqual(self.rows('technical_notes'), [1])
+        self.assertEqual(conn.execute.call_count, 0)
+
+
+class BulkLoadedBuildTest(unittest.TestCase):
+
+    def test_build_is_indexed_and_compact(self):
+        corpus = CorpusFixture(2000, seed=17, prefix='bulk-load-test-')
+        self.addCleanup(corpus.close)
+        stats = corpus.reorganize()
+        output = corpus.path('reorganized.db')
+        reorganizer = database_reorganizer.DatabaseReorganizer(corpus.source)
+        try:
+            expected_indexes = set(re.findall(r'CREATE INDEX IF NOT EXISTS (\w+)', reorganizer.create_indexes_sql()))
+        finally:
+            reorganizer.conn.close()
+
+        self.assertEqual(stats['total_processed'], 2000)
+        # Only the finished database is left: no build file, journal or WAL
+        self.assertEqual(sorted(os.listdir(corpus.workdir)), ['corpus.db', 'reorganized.db'])
+        conn = sqlite3.connect(output)
+        try:
+            self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+            indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+            self.assertLessEqual(expected_indexes, indexes)
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.assertNotIn('reorganize_checkpoint', tables)
+            self.assertIn('sqlite_stat1', tables)
+            self.assertEqual(conn.execute('PRAGMA freelist_count').fetchone()[0], 0)
+            self.assertEqual(conn.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            content_rows = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                               for table in database_reorganizer.INSERT_SQL)
+        finally:
+            conn.close()
+        self.assertEqual(content_rows, stats['total_processed'] - stats['empty_ignored'])
+
+
+if __name__ == '__main__':
+    unittest.main()
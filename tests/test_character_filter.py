@@ -0,0 +1,69 @@
+"""Character filters on normalized snapshots: exact keys bound for an index seek"""
+
+import sqlite3
+import unittest
+
+from database_indexer import SearchIndexBuilder
+from tests import CorpusFixture
+
+import search
+
+
+class CharacterFilterTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(5000, seed=4, prefix='character-test-')
+        # Names that contain another name, so one filter resolves to several keys
+        with sqlite3.connect(cls.corpus.source) as conn:
+            conn.executemany(
+                'INSERT INTO script_lines (management_id, title, character_name, dialogue, row_number) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [('A01', 'テスト', 'くもりんママ', 'ママのうた', 9001), ('B1003', 'テスト', 'ノイズ博士', 'はかせのうた', 9002)]
+            )
+        builder = SearchIndexBuilder(cls.corpus.source)
+        try:
+            builder.build_normalized_columns()
+        finally:
+            builder.close()
+        cls.conn = cls.corpus.cache().conn
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def test_single_key_seeks_character_index(self):
+        keys = search.matching_character_keys(self.conn, 'ツク')
+        self.assertEqual(keys, ['ツクモ'])
+        for sort_order in search.SORT_KEYS:
+            query, params = search.build_search_query(
+                'の', 'ツク', sort_order, 20, scheme='normalized', character_keys=keys
+            )
+            plan = ' '.join(row[3] for row in self.conn.execute('EXPLAIN QUERY PLAN ' + query, params))
+            with self.subTest(sort_order=sort_order):
+                self.assertIn('USING INDEX idx_script_lines_character_', plan)
+                self.assertIn('(character_key=?)', plan)
+
+    def test_key_slots_are_padded_to_a_power_of_two(self):
+        self.assertEqual(search.character_key_slots(['a']), ['a'])
+        self.assertEqual(search.character_key_slots(['a', 'b', 'c']), ['a', 'b', 'c', 'c'])
+        self.assertIsNone(search.character_key_slots([]))
+        self.assertIsNone(search.character_key_slots(['k'] * (search.MAX_CHARACTER_KEY_SLOTS + 1)))
+
+    def test_results_match_like_filter(self):
+        self.assertEqual(len(search.matching_character_keys(self.conn, 'くもりん')), 2)
+        for character_filter in ('くもりん', 'ノイズ', 'ン', 'x'):
+            for sort_order in search.SORT_KEYS:
+                expected = self.conn.execute(*search.build_search_query(
+                    'の', character_filter, sort_order, -1
+                )).fetchall()
+                rows = list(search.iter_search_rows(self.conn, 'の', character_filter, sort_order, -1))
+                with self.subTest(character_filter=character_filter, sort_order=sort_order):
+                    self.assertEqual(
+                        sorted(row[10] for row in rows),
+                        sorted(row[10] for row in expected)
+                    )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""The compact response format carries the same results as the objects format"""
+
+import json
+import unittest
+from unittest import mock
+
+from tests import CorpusFixture
+
+import search
+
+
+def expand(compact):
+    """Rebuild objects format results from a compact ``results`` value"""
+    scripts = [dict(zip(compact['scripts']['columns'], script)) for script in compact['scripts']['rows']]
+    columns = compact['columns']
+    results = []
+    for index, values in enumerate(compact['rows']):
+        fields = dict(zip(columns, values + [''] * (len(columns) - len(values))))
+        result = dict(scripts[fields.pop('script')], **fields)
+        if 'content_types' in compact:
+            result['content_type'] = compact['content_types'][index]
+        results.append(result)
+    return results
+
+
+class CompactFormatTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(3000, seed=16, prefix='compact-test-')
+        cls.corpus.reorganize()
+        cls.cache = cls.corpus.cache()
+        cls.content_cache = cls.corpus.cache('reorganized.db', search.ReorganizedDatabaseCache)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def setUp(self):
+        for patcher in (mock.patch.object(search, 'reorganized_cache', self.content_cache),
+                        mock.patch.object(search, 'result_cache', search.ResultCache(100, 60)),
+                        mock.patch.object(search, 'content_result_cache', search.ResultCache(100, 60))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_connection(self, content=False):
+        return (self.content_cache if content else self.cache).get_connection()
+
+    def respond(self, **body):
+        params = None if 'queries' in body else search.parse_search_params(body, search.MAX_LIMIT)
+        response = search.search_response(body, params, self.get_connection, search.RequestTimer())
+        self.assertTrue(response['success'], response)
+        return response
+
+    def assert_same_results(self, objects, compact):
+        self.assertGreater(objects['count'], 0)
+        self.assertEqual(compact['format'], 'compact')
+        self.assertNotIn('format', objects)
+        self.assertEqual(compact['count'], objects['count'])
+        self.assertEqual(compact['next_cursor'], objects['next_cursor'])
+        self.assertEqual(expand(compact['results']), objects['results'])
+
+        packed = compact['results']
+        self.assertEqual(packed['columns'], list(search.COMPACT_COLUMNS))
+        # Each script is listed once, and rows drop their trailing empty fields
+        scripts = [tuple(script) for script in packed['scripts']['rows']]
+        self.assertEqual(len(scripts), len(set(scripts)))
+        self.assertLess(len(scripts), len(packed['rows']))
+        for values in packed['rows']:
+            self.assertTrue(len(values) == 2 or values[-1] != '', values)
+        self.assertLess(len(json.dumps(compact, ensure_ascii=False)), len(json.dumps(objects, ensure_ascii=False)))
+
+    def test_search_results(self):
+        for body in ({'keyword': 'の', 'limit': 100},
+                     {'keyword': 'サン', 'character_filter': 'サン', 'sort_order': 'broadcast_date_desc', 'limit': 50}):
+            with self.subTest(body=body):
+                self.assert_same_results(self.respond(**body), self.respond(format='compact', **body))
+
+    def test_content_search_results(self):
+        body = {'keyword': 'の', 'limit': 100, 'content_types': ['dialogue', 'scene_description']}
+        objects, compact = self.respond(**body), self.respond(format='compact', **body)
+        self.assert_same_results(objects, compact)
+        self.assertEqual(len(compact['results']['content_types']), compact['count'])
+
+    def test_batch_results(self):
+        queries = [{'keyword': keyword, 'limit': 30} for keyword in ('の', 'テロップ', 'zzzz')]
+        objects = self.respond(queries=queries)
+        compact = self.respond(queries=[dict(query, format='compact') for query in queries])
+        self.assertEqual(compact['count'], 3)
+        for expected, packed in zip(objects['results'][:2], compact['results'][:2]):
+            self.assert_same_results(expected, packed)
+        self.assertEqual(compact['results'][2]['results'],
+                         {'columns': list(search.COMPACT_COLUMNS),
+                          'scripts': {'columns': list(search.COMPACT_SCRIPT_COLUMNS), 'rows': []}, 'rows': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
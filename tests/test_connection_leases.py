@@ -0,0 +1,67 @@
+"""Content searches lease reorganized-database connections like snapshot searches"""
+
+import unittest
+from unittest import mock
+
+from tests import CorpusFixture
+
+import search
+from search_async_server import Lease
+from search_server import ConnectionPool
+
+CONTENT_TYPES = ['dialogue', 'scene_description', 'tech_instruction', 'visual_effect', 'audio_instruction']
+
+
+class ContentLeaseTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(3000, seed=8, prefix='connection-lease-test-')
+        cls.corpus.reorganize()
+        cls.cache = cls.corpus.cache('reorganized.db', search.ReorganizedDatabaseCache)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def setUp(self):
+        self.pool = ConnectionPool(self.cache, 1)
+        patcher = mock.patch.object(search, 'reorganized_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.pool.close)
+
+    def respond(self, lease, **body):
+        params = search.parse_search_params(body, search.MAX_LIMIT)
+        with mock.patch.object(search, 'content_result_cache', search.ResultCache(0, 0)):
+            try:
+                return search.search_response(body, params, lease.get_connection, search.RequestTimer())
+            finally:
+                lease.release()
+
+    def test_content_search_uses_pooled_connection(self):
+        lease = Lease(None, 60, self.pool)
+        conn = lease.get_connection(content=True)
+        self.assertIsNot(conn, self.cache.conn)
+        self.assertEqual(conn.sort_scheme, 'content')
+        lease.release()
+
+        response = self.respond(Lease(None, 60, self.pool), keyword='の', content_types=['dialogue'], limit=5)
+        self.assertTrue(response['success'])
+        self.assertEqual(response['count'], 5)
+        self.assertEqual(self.pool.opened, 1)
+        self.assertEqual(len(self.pool.idle), 1)
+
+    def test_content_search_observes_deadline(self):
+        response = self.respond(Lease(None, 0, self.pool), keyword='zzzz', content_types=CONTENT_TYPES)
+        self.assertFalse(response['success'])
+        self.assertEqual(response['error'], search.QUERY_TIMEOUT_MESSAGE)
+        # The connection comes back usable, without the expired handler
+        self.assertEqual(len(self.pool.idle), 1)
+        response = self.respond(Lease(None, 60, self.pool), keyword='zzzz', content_types=CONTENT_TYPES)
+        self.assertTrue(response['success'])
+        self.assertEqual(response['count'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Content type searches list rows in the same order as normalized snapshot searches"""
+
+import shutil
+import sqlite3
+import unittest
+from unittest import mock
+
+from database_indexer import SearchIndexBuilder
+from tests import CorpusFixture
+
+import search
+
+SORT_ORDERS = ('management_id_asc', 'management_id_desc', 'broadcast_date_asc', 'broadcast_date_desc')
+
+
+class ContentOrderTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(3000, seed=10, prefix='content-order-test-')
+
+        # A script whose raw management_id and broadcast_date sort
+        # differently from their normalized keys
+        conn = sqlite3.connect(cls.corpus.source)
+        conn.execute("UPDATE script_lines SET management_id = 'B999', broadcast_date = '2019/04/03' "
+                     "WHERE management_id = 'B1003'")
+        conn.commit()
+        conn.close()
+
+        shutil.copyfile(cls.corpus.source, cls.corpus.path('normalized.db'))
+        builder = SearchIndexBuilder(cls.corpus.path('normalized.db'))
+        try:
+            builder.build_normalized_columns()
+        finally:
+            builder.close()
+        cls.corpus.reorganize()
+
+        cls.conn = cls.corpus.cache('normalized.db').conn
+        cls.content_conn = cls.corpus.cache('reorganized.db', search.ReorganizedDatabaseCache).conn
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def pages(self, search_function, conn, **body):
+        """(management_id, row_number) of every result, paging with next_cursor"""
+        positions = []
+        cursor = None
+        with mock.patch.object(search, 'reorganized_cache', object()), \
+                mock.patch.object(search, 'result_cache', search.ResultCache(0, 0)), \
+                mock.patch.object(search, 'content_result_cache', search.ResultCache(0, 0)):
+            while True:
+                params = search.parse_search_params(dict(body, cursor=cursor) if cursor else body, search.MAX_LIMIT)
+                self.assertIsNone(params['error'])
+                results, cursor, _ = search_function(conn, params)
+                positions.extend((result['management_id'], result['row_number']) for result in results)
+                if cursor is None:
+                    return positions
+
+    def test_orders_match_normalized_search(self):
+        self.assertEqual(self.conn.sort_scheme, 'normalized')
+        for sort_order in SORT_ORDERS:
+            with self.subTest(sort_order=sort_order):
+                expected = self.pages(search.cached_search, self.conn,
+                                      keyword='の', sort_order=sort_order, limit=100)
+                positions = self.pages(search.content_search, self.content_conn,
+                                       keyword='の', sort_order=sort_order, limit=100,
+                                       content_types=list(search.CONTENT_TYPES))
+                self.assertEqual(positions, expected)
+                self.assertIn('B999', {management_id for management_id, _ in positions})
+
+    def test_rejects_databases_without_sort_keys(self):
+        shutil.copyfile(self.corpus.path('reorganized.db'), self.corpus.path('old.db'))
+        conn = sqlite3.connect(self.corpus.path('old.db'))
+        conn.execute('DROP INDEX idx_scripts_broadcast_date_key')
+        conn.execute('ALTER TABLE scripts DROP COLUMN broadcast_date_key')
+        conn.commit()
+        conn.close()
+        cache = search.ReorganizedDatabaseCache(None, self.corpus.path('old.db'), 0)
+        with self.assertRaises(sqlite3.DatabaseError):
+            cache.load()
+        self.assertIsNone(cache.conn)
+
+
+if __name__ == '__main__':
+    unittest.main()
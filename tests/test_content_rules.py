@@ -0,0 +1,83 @@
+"""Content types: api/search.py classifies rows like database_reorganizer.py"""
+
+import dataclasses
+import json
+import os
+import unittest
+from collections import Counter
+from unittest import mock
+
+import database_reorganizer
+from tests import CorpusFixture
+
+import search
+
+# classify_content's outputs before its rules were compiled and shared with
+# api/search.py, as [character_name, dialogue, content_type, confidence,
+# reasoning, suggested_column]: edge cases of each rule, then every distinct
+# row of CorpusGenerator(3000, seed=5)
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'classify_content.json'),
+          encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+class ContentRulesTest(unittest.TestCase):
+
+    def test_reorganizer_matches_golden_table(self):
+        reorganizer = database_reorganizer.DatabaseReorganizer(':memory:')
+        try:
+            for character_name, dialogue, *expected in GOLDEN:
+                with self.subTest(character_name=character_name, dialogue=dialogue):
+                    classification = reorganizer.classify_content(character_name, dialogue, 'E')
+                    self.assertEqual(list(dataclasses.astuple(classification)), expected)
+        finally:
+            reorganizer.conn.close()
+
+    def test_search_matches_golden_table(self):
+        for character_name, dialogue, content_type, *_ in GOLDEN:
+            with self.subTest(character_name=character_name, dialogue=dialogue):
+                self.assertEqual(search.classify_content_type(character_name, dialogue), content_type)
+
+
+class ContentFacetsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(3000, seed=6, prefix='content-facets-test-')
+        cls.corpus.reorganize()
+        cls.conn = cls.corpus.cache('reorganized.db', search.ReorganizedDatabaseCache).conn
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def params(self, **body):
+        with mock.patch.object(search, 'reorganized_cache', object()):
+            params = search.parse_search_params(body, search.MAX_LIMIT)
+        self.assertIsNone(params['error'])
+        return params
+
+    def test_facets_count_content_matches(self):
+        content_types = ['dialogue', 'scene_description', 'audio_instruction']
+        for keyword, limit in (('の', 20), ('SE', 20)):
+            params = self.params(keyword=keyword, content_types=content_types, facets=True, limit=limit)
+            results, next_cursor, _, facets = search.faceted_search(self.conn, params)
+            with self.subTest(keyword=keyword):
+                expected_results, expected_cursor, _ = search.content_search(self.conn, self.params(
+                    keyword=keyword, content_types=content_types, limit=limit
+                ))
+                self.assertEqual((results, next_cursor), (expected_results, expected_cursor))
+
+                rows = list(search.iter_content_rows(
+                    self.conn, keyword, '', tuple(content_types), 'management_id_asc', search.FACET_SCAN_LIMIT
+                ))
+                counts = Counter(search.CONTENT_TYPES[row[11]] for row in rows)
+                self.assertEqual(
+                    {entry['value']: entry['count'] for entry in facets['content_type']}, dict(counts)
+                )
+                self.assertTrue(set(counts) <= set(content_types))
+                self.assertEqual(facets['scanned'], len(rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""DatabaseCache: one download per cold start, shared by concurrent requests"""
+
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from tests import CorpusFixture
+
+import search
+
+THREADS = 8
+
+
+class FakeResponse(io.BytesIO):
+    """What urlopen returns for the database: its bytes, read after ``delay``"""
+
+    def __init__(self, data, length=None, delay=0.2):
+        super().__init__(data)
+        self.headers = {'Content-Length': str(len(data) if length is None else length), 'ETag': '"v1"'}
+        self.delay = delay
+
+    def read(self, size=-1):
+        time.sleep(self.delay)
+        return super().read(size)
+
+
+class DatabaseCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        corpus = CorpusFixture(1000, seed=4, prefix='cache-test-')
+        try:
+            with open(corpus.source, 'rb') as f:
+                cls.data = f.read()
+        finally:
+            corpus.close()
+
+    def setUp(self):
+        # An empty directory to download into
+        self.workdir = tempfile.mkdtemp(prefix='cache-test-')
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        self.cache = search.DatabaseCache('https://example.invalid/corpus.db',
+                                          os.path.join(self.workdir, 'corpus.db'), 3600)
+
+    def tearDown(self):
+        if self.cache.conn is not None:
+            self.cache.conn.close()
+
+    def get_concurrently(self, urlopen):
+        """Call get_connection from THREADS threads at once; return what each got or raised"""
+        barrier = threading.Barrier(THREADS)
+        outcomes = [None] * THREADS
+
+        def request(index):
+            barrier.wait()
+            try:
+                outcomes[index] = self.cache.get_connection()
+            except Exception as e:
+                outcomes[index] = e
+
+        with mock.patch.object(search.urllib.request, 'urlopen', urlopen):
+            threads = [threading.Thread(target=request, args=(index,)) for index in range(THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        return outcomes
+
+    def test_cold_start_downloads_once(self):
+        urlopen = mock.Mock(side_effect=lambda request: FakeResponse(self.data))
+        outcomes = self.get_concurrently(urlopen)
+        self.assertEqual(urlopen.call_count, 1)
+        self.assertIsNotNone(self.cache.conn)
+        self.assertEqual(outcomes, [self.cache.conn] * THREADS)
+        self.assertEqual(os.listdir(self.workdir), ['corpus.db'])
+        self.assertEqual(self.cache.conn.execute('SELECT COUNT(*) FROM script_lines').fetchone()[0], 1000)
+
+    def test_failed_download_leaves_no_file(self):
+        # The connection drops after half the file
+        truncated = self.data[:len(self.data) // 2]
+        urlopen = mock.Mock(side_effect=lambda request: FakeResponse(truncated, length=len(self.data)))
+        outcomes = self.get_concurrently(urlopen)
+        self.assertEqual(urlopen.call_count, 1)
+        for outcome in outcomes:
+            self.assertIsInstance(outcome, OSError)
+        self.assertIsNone(self.cache.conn)
+        self.assertEqual(os.listdir(self.workdir), [])
+
+        # The next request starts a new download
+        urlopen = mock.Mock(side_effect=lambda request: FakeResponse(self.data, delay=0))
+        self.assertEqual(self.get_concurrently(urlopen), [self.cache.conn] * THREADS)
+        self.assertEqual(urlopen.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
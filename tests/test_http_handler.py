@@ -0,0 +1,242 @@
+"""The api/search.py handler over HTTP: compressed bodies, NDJSON streams, metrics and script views"""
+
+import gzip
+import http.client
+import json
+import socket
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer
+from unittest import mock
+
+from tests import CorpusFixture
+
+import search
+
+
+class HandlerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(3000, seed=14, prefix='handler-test-')
+        cls.corpus.reorganize()
+        cls.cache = cls.corpus.cache()
+        cls.content_cache = cls.corpus.cache('reorganized.db', search.ReorganizedDatabaseCache)
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), search.handler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.corpus.close()
+
+    def setUp(self):
+        for patcher in (mock.patch.object(search, 'database_cache', self.cache),
+                        mock.patch.object(search, 'reorganized_cache', self.content_cache),
+                        mock.patch.object(search, 'content_result_cache', search.ResultCache(0, 0))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, method, path, body=None, headers=None):
+        """Send one request; return (status, headers, body with any chunking removed)"""
+        conn = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1], timeout=30)
+        try:
+            headers = dict(headers or {})
+            data = None
+            if body is not None:
+                data = json.dumps(body).encode('utf-8')
+                headers['Content-Type'] = 'application/json'
+            conn.request(method, path, data, headers)
+            response = conn.getresponse()
+            return response.status, response.headers, response.read()
+        finally:
+            conn.close()
+
+    def test_gzip_bodies_match_uncompressed(self):
+        body = {'keyword': 'の', 'limit': 100}
+        status, headers, plain = self.request('POST', '/', body)
+        self.assertEqual(status, 200)
+        self.assertIsNone(headers['Content-Encoding'])
+        status, headers, compressed = self.request('POST', '/', body, {'Accept-Encoding': 'gzip'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertLess(len(compressed), len(plain))
+
+        expected, decoded = json.loads(plain), json.loads(gzip.decompress(compressed))
+        # Cache hit counters change from one request to the next
+        expected.pop('cache')
+        decoded.pop('cache')
+        self.assertEqual(decoded, expected)
+        self.assertEqual(expected['count'], 100)
+
+    def test_gzip_stream_matches_uncompressed(self):
+        body = {'keyword': 'の', 'limit': 2000, 'stream': True}
+        status, headers, plain = self.request('POST', '/', body)
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+        self.assertIsNone(headers['Content-Encoding'])
+        status, headers, compressed = self.request('POST', '/', body, {'Accept-Encoding': 'gzip'})
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+
+        self.assertEqual(gzip.decompress(compressed), plain)
+        lines = [json.loads(line) for line in plain.splitlines()]
+        self.assertEqual(lines[-1]['count'], len(lines) - 1)
+        self.assertGreater(len(plain), search.STREAM_CHUNK_SIZE)
+
+    def raw_post(self, body, version='HTTP/1.1', headers=b''):
+        """POST over a plain socket; return (head, body) exactly as sent"""
+        data = json.dumps(body).encode('utf-8')
+        with socket.create_connection(('127.0.0.1', self.server.server_address[1]), timeout=30) as sock:
+            sock.sendall(b'POST / %s\r\nHost: test\r\nContent-Length: %d\r\n%s\r\n%s'
+                         % (version.encode('ascii'), len(data), headers, data))
+            response = b''
+            while True:
+                received = sock.recv(65536)
+                if not received:
+                    break
+                response += received
+        head, _, payload = response.partition(b'\r\n\r\n')
+        return head.decode('latin-1'), payload
+
+    def pages(self, page_size, **body):
+        """Results of a buffered search, followed page by page with next_cursor"""
+        results = []
+        cursor = None
+        while True:
+            request = dict(body, limit=page_size)
+            if cursor:
+                request['cursor'] = cursor
+            page = json.loads(self.request('POST', '/', request)[2])
+            results.extend(page['results'])
+            cursor = page['next_cursor']
+            if cursor is None or len(results) >= body['limit']:
+                return results[:body['limit']], cursor
+
+    def test_stream_is_chunked_ndjson(self):
+        body = {'keyword': 'の', 'limit': 1500}
+        head, payload = self.raw_post(body, headers=b'Accept: application/x-ndjson\r\n')
+        self.assertIn('Transfer-Encoding: chunked', head)
+        self.assertIn('Content-Type: application/x-ndjson; charset=utf-8', head)
+
+        chunks = []
+        while True:
+            size, _, payload = payload.partition(b'\r\n')
+            size = int(size, 16)
+            if size == 0:
+                break
+            chunks.append(payload[:size])
+            self.assertEqual(payload[size:size + 2], b'\r\n')
+            payload = payload[size + 2:]
+        self.assertEqual(payload, b'\r\n')
+        # Rows go out in chunks as they are read, each ending on a line boundary
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.endswith(b'\n'))
+
+        lines = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        rows, summary = lines[:-1], lines[-1]
+        # More rows than a buffered response may hold, the same as paging through them
+        self.assertGreater(len(rows), search.MAX_LIMIT)
+        expected, next_cursor = self.pages(500, **body)
+        self.assertEqual(rows, expected)
+        self.assertEqual(summary, {'success': True, 'count': len(rows), 'next_cursor': next_cursor})
+
+        # HTTP/1.0 clients get the same lines, ended by closing the connection
+        head, payload = self.raw_post(dict(body, stream=True), version='HTTP/1.0')
+        self.assertNotIn('Transfer-Encoding', head)
+        self.assertEqual(payload, b''.join(chunks))
+
+    def test_invalid_stream_request_gets_json_error(self):
+        # Parameters are checked before any line is sent, so the error is an ordinary response
+        head, payload = self.raw_post({'keyword': 'の', 'stream': True, 'cursor': 'not-a-cursor'}, version='HTTP/1.0')
+        self.assertIn('Content-Type: application/json; charset=utf-8', head)
+        self.assertEqual(json.loads(payload), {'success': False, 'error': search.INVALID_CURSOR_MESSAGE})
+
+    def test_metrics_endpoint(self):
+        with mock.patch.object(search, 'metrics', search.Metrics()), \
+                mock.patch.object(search, 'result_cache', search.ResultCache(10, 60)):
+            counts = []
+            for keyword in ('SE', 'テロップ', 'SE'):
+                status, headers, body = self.request('POST', '/', {'keyword': keyword, 'limit': 20})
+                counts.append(json.loads(body)['count'])
+                phases = [part.split(';')[0] for part in headers['Server-Timing'].split(', ')]
+                self.assertIn('cache', phases)
+            self.assertEqual(phases, ['connect', 'cache', 'encode'])
+
+            # A request is recorded after its body is written, so wait for the last one
+            deadline = time.monotonic() + 10
+            while search.metrics.counts.get('total_ms', 0) < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            status, headers, body = self.request('GET', '/?metrics')
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Cache-Control'], 'no-store')
+        snapshot = json.loads(body)
+        histograms = snapshot['histograms']
+        self.assertEqual(histograms['total_ms']['count'], 3)
+        self.assertEqual(histograms['rows']['sum'], sum(counts))
+        # The repeated search was a cache hit and never queried
+        self.assertEqual(histograms['query_ms']['count'], 2)
+        self.assertEqual(histograms['cache_ms']['count'], 3)
+        self.assertEqual(snapshot['result_cache'], {'hits': 1, 'misses': 2, 'size': 2})
+
+    def test_metrics_percentiles_use_recent_samples(self):
+        metrics = search.Metrics(max_samples=10)
+        for value in range(1, 101):
+            metrics.observe('rows', value)
+        self.assertEqual(metrics.snapshot()['histograms']['rows'],
+                         {'count': 100, 'sum': 5050, 'p50': 95, 'p95': 100, 'p99': 100, 'max': 100})
+        metrics = search.Metrics(max_samples=100)
+        for value in range(1, 101):
+            metrics.observe('rows', value)
+        self.assertEqual(metrics.snapshot()['histograms']['rows'],
+                         {'count': 100, 'sum': 5050, 'p50': 50, 'p95': 95, 'p99': 99, 'max': 100})
+
+    def script_view(self, query):
+        status, headers, body = self.request('GET', '/?' + query)
+        self.assertEqual(status, 200)
+        return headers, json.loads(body)
+
+    def test_script_view_windows(self):
+        headers, whole = self.script_view('script=B1002')
+        self.assertTrue(whole['success'])
+        self.assertEqual(whole['script']['management_id'], 'B1002')
+        self.assertIn('query;dur=', headers['Server-Timing'])
+        self.assertEqual(headers['Timing-Allow-Origin'], '*')
+        rows = [result['row_number'] for result in whole['results']]
+        self.assertEqual(rows, sorted(rows))
+        first, last = rows[0], rows[-1]
+        self.assertGreater(last - first, 20)
+
+        # Windows include both bounds and are clipped at the ends of the script
+        for row_number, window in ((first + 10, 3), (first, 4), (last, 4), (first + 5, 0)):
+            with self.subTest(row_number=row_number, window=window):
+                headers, view = self.script_view(f'script=B1002&row_number={row_number}&window={window}')
+                self.assertIn('Server-Timing', headers)
+                self.assertEqual((view['row_number'], view['window']), (row_number, window))
+                expected = [result for result in whole['results']
+                            if row_number - window <= result['row_number'] <= row_number + window]
+                self.assertTrue(expected)
+                self.assertEqual(view['results'], expected)
+                self.assertEqual(view['count'], len(expected))
+                self.assertEqual(view['script'], whole['script'])
+
+    def test_script_view_errors(self):
+        headers, view = self.script_view('script=Z999')
+        self.assertEqual(view, {'success': False, 'error': '台本が見つかりません: Z999'})
+        self.assertEqual(headers['Cache-Control'], 'no-store')
+        self.assertIn('Server-Timing', headers)
+        _, view = self.script_view('script=B1002&row_number=x')
+        self.assertFalse(view['success'])
+        self.assertEqual(view['error'], 'row_numberとwindowには整数を指定してください')
+        status, headers, _ = self.request('GET', '/?unknown')
+        self.assertEqual(status, 404)
+        self.assertIsNone(headers['Server-Timing'])
+
+
+if __name__ == '__main__':
+    unittest.main()
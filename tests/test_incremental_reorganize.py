@@ -0,0 +1,116 @@
+"""An incremental reorganization rewrites only the edited scripts and matches a full build"""
+
+import shutil
+import sqlite3
+import unittest
+
+import database_reorganizer
+from tests import REORGANIZED_TABLES, CorpusFixture
+
+# Columns that depend on when or in what order rows were written, not on the source
+WRITE_COLUMNS = ('id', 'script_id', 'content_id', 'created_at', 'updated_at')
+
+
+def rows_by_script(path, table, columns=None):
+    """{management_id: sorted rows of table}, with every column or only ``columns``"""
+    conn = sqlite3.connect(path)
+    try:
+        if columns is None:
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+        selected = ', '.join(f't.{column}' for column in columns)
+        join = '' if table == 'scripts' else 'JOIN scripts s ON s.id = t.script_id'
+        management_id = 't.management_id' if table == 'scripts' else 's.management_id'
+        scripts = {}
+        for row in conn.execute(f"SELECT {management_id}, {selected} FROM {table} t {join}"):
+            scripts.setdefault(row[0], []).append(row[1:])
+    finally:
+        conn.close()
+    return {management_id: sorted(rows, key=repr) for management_id, rows in scripts.items()}
+
+
+def source_columns(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[1] for row in conn.execute(f'PRAGMA table_info({table})') if row[1] not in WRITE_COLUMNS]
+    finally:
+        conn.close()
+
+
+class IncrementalReorganizeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = CorpusFixture(3000, seed=13, prefix='incremental-test-')
+        self.addCleanup(self.corpus.close)
+
+    def reorganize_incremental(self, output, workers):
+        reorganizer = database_reorganizer.DatabaseReorganizer(self.corpus.source)
+        try:
+            return reorganizer.reorganize_incremental(output, workers=workers)
+        finally:
+            reorganizer.conn.close()
+
+    def edit_source(self):
+        """Change one script, delete one and add one; return their management_ids"""
+        conn = sqlite3.connect(self.corpus.source)
+        try:
+            ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT management_id FROM script_lines ORDER BY management_id"
+            )]
+            changed, deleted, copied = ids[1], ids[3], ids[5]
+            added = 'Z01'
+            conn.execute("UPDATE script_lines SET dialogue = dialogue || '！' "
+                         "WHERE management_id = ? AND row_number = 3", (changed,))
+            conn.execute("DELETE FROM script_lines WHERE management_id = ?", (deleted,))
+            columns = ', '.join(column for column in source_columns(self.corpus.source, 'script_lines')
+                                if column != 'management_id')
+            conn.execute(f"INSERT INTO script_lines (management_id, {columns}) "
+                         f"SELECT ?, {columns} FROM script_lines WHERE management_id = ? ORDER BY id",
+                         (added, copied))
+            conn.commit()
+        finally:
+            conn.close()
+        return changed, deleted, added
+
+    def test_rewrites_only_edited_scripts(self):
+        previous = self.corpus.path('previous.db')
+        self.corpus.reorganize('previous.db')
+        before = {table: rows_by_script(previous, table) for table in REORGANIZED_TABLES}
+        edited = self.edit_source()
+        clean = self.corpus.path('clean.db')
+        self.corpus.reorganize('clean.db')
+
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                output = self.corpus.path(f'incremental-{workers}.db')
+                shutil.copyfile(previous, output)
+                stats = self.reorganize_incremental(output, workers)
+                self.assertFalse(stats['full_rebuild'])
+                self.assertEqual((stats['changed_scripts'], stats['deleted_scripts'], stats['new_scripts']),
+                                 (1, 1, 1))
+
+                # The edited scripts are rewritten; every other script keeps
+                # its rows, ids and timestamps
+                changed, deleted, added = edited
+                scripts = rows_by_script(output, 'scripts')
+                self.assertEqual(set(scripts), set(before['scripts']) - {deleted} | {added})
+                self.assertNotEqual(scripts[changed], before['scripts'][changed])
+                for table in REORGANIZED_TABLES:
+                    after = rows_by_script(output, table)
+                    if table in database_reorganizer.INSERT_SQL:
+                        # Content rows of the changed script are written again, with new ids
+                        old_ids = {row[0] for row in before[table].get(changed, [])}
+                        new_ids = {row[0] for row in after.get(changed, [])}
+                        self.assertFalse(old_ids & new_ids, table)
+                    for management_id in set(before[table]) - set(edited):
+                        self.assertEqual(after[management_id], before[table][management_id],
+                                         (table, management_id))
+
+                # ...and the result has the same content as a full build of the edited source
+                for table in REORGANIZED_TABLES:
+                    columns = source_columns(output, table)
+                    self.assertEqual(rows_by_script(output, table, columns), rows_by_script(clean, table, columns),
+                                     table)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""NgramIndex: results identical to the LIKE query, within a memory budget"""
+
+import gc
+import tracemalloc
+import unittest
+
+from tests import CorpusFixture
+
+import search
+
+ROWS = 20000
+# Postings, rowids, ranks and character ids come to about 65 bytes per row
+# on the full corpus (a little more on a small one, where the gram table
+# weighs more); a copy of the rows themselves would be well over 1,000
+MAX_BYTES_PER_ROW = 120
+
+
+class NgramIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(ROWS, seed=1, prefix='ngram-test-')
+        cls.conn = cls.corpus.cache().conn
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            cls.index = search.NgramIndex(cls.conn)
+            gc.collect()
+            cls.index_bytes = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def sql_rows(self, keyword, character_filter, sort_order, limit, after=None):
+        query, params = search.build_search_query(keyword, character_filter, sort_order, limit, after=after)
+        return self.conn.execute(query, params).fetchall()
+
+    def test_memory_budget(self):
+        self.assertLess(self.index_bytes / ROWS, MAX_BYTES_PER_ROW)
+
+    def test_matches_like_query(self):
+        for keyword in ('サンサン', 'se', 'BGM', 'クリスマス', 'の様子', 'gigafile', 'zzzz'):
+            for character_filter in ('', 'くも', 'x'):
+                for sort_order in search.SORT_KEYS:
+                    with self.subTest(keyword=keyword, character_filter=character_filter, sort_order=sort_order):
+                        expected = self.sql_rows(keyword, character_filter, sort_order, 21)
+                        self.assertEqual(
+                            self.index.search(self.conn, keyword, character_filter, sort_order, 21), expected
+                        )
+
+    def test_cursor_resumes_like_query(self):
+        for sort_order in search.SORT_KEYS:
+            first = self.sql_rows('テロップ', '', sort_order, 10)
+            after = search.sort_key(first[-1], sort_order)
+            with self.subTest(sort_order=sort_order):
+                self.assertEqual(
+                    self.index.search(self.conn, 'テロップ', '', sort_order, 10, after=after),
+                    self.sql_rows('テロップ', '', sort_order, 10, after=after)
+                )
+
+    def test_reads_rows_without_json1(self):
+        # Builds without JSON1 have no json_each: candidate rowids are bound as parameters
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        try:
+            rows = self.index.search(self.conn, 'ップ', '', 'management_id_asc', 1000)
+            after = search.sort_key(rows[-1], 'management_id_asc')
+            self.index.search(self.conn, 'ップ', '', 'management_id_asc', 10, after=after)
+        finally:
+            self.conn.set_trace_callback(None)
+        self.assertEqual(len(rows), 1000)
+        self.assertTrue(statements)
+        self.assertFalse([statement for statement in statements if 'json_each' in statement])
+
+    def test_short_keywords_are_not_covered(self):
+        self.assertFalse(search.NgramIndex.covers('S'))
+        self.assertTrue(search.NgramIndex.covers('SE'))
+
+
+if __name__ == '__main__':
+    unittest.main()
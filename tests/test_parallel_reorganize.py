@@ -0,0 +1,81 @@
+"""Parallel reorganization writes the same database as a serial run"""
+
+import io
+import json
+import shutil
+import sqlite3
+import unittest
+from unittest import mock
+
+import database_reorganizer
+from tests import REORGANIZED_TABLES, CorpusFixture, table_rows
+
+
+class ParallelReorganizeTest(unittest.TestCase):
+
+    def setUp(self):
+        # URI syntax characters in the path must not reach the workers' connection URI unescaped
+        self.corpus = CorpusFixture(3000, seed=11, prefix='reorganize?test#50%25-')
+        self.addCleanup(self.corpus.close)
+
+    def test_parallel_matches_serial(self):
+        serial = self.corpus.path('serial.db')
+        parallel = self.corpus.path('parallel.db')
+        with mock.patch.object(database_reorganizer, 'BATCH_ROWS', 500):
+            self.assertEqual(self.corpus.reorganize('parallel.db', workers=2),
+                             self.corpus.reorganize('serial.db', workers=1))
+        for table in REORGANIZED_TABLES:
+            with self.subTest(table=table):
+                self.assertEqual(table_rows(parallel, table), table_rows(serial, table))
+
+    def test_parallel_incremental_matches_serial(self):
+        output = self.corpus.path('corpus_reorganized.db')
+        self.corpus.reorganize('corpus_reorganized.db')
+
+        # Change one script, delete another and add a third
+        conn = sqlite3.connect(self.corpus.source)
+        conn.execute("UPDATE script_lines SET dialogue = dialogue || '！' WHERE management_id = 'B1001'")
+        conn.execute("DELETE FROM script_lines WHERE management_id = 'B1004'")
+        conn.execute("UPDATE script_lines SET management_id = 'A00' WHERE management_id = 'B1006'")
+        conn.commit()
+        conn.close()
+
+        serial = self.corpus.path('serial.db')
+        parallel = self.corpus.path('parallel.db')
+        shutil.copyfile(output, serial)
+        shutil.copyfile(output, parallel)
+        events = io.StringIO()
+        reorganizer = database_reorganizer.DatabaseReorganizer(self.corpus.source)
+        try:
+            serial_stats = reorganizer.reorganize_incremental(serial)
+            with mock.patch.object(database_reorganizer, 'BATCH_ROWS', 100):
+                parallel_stats = reorganizer.reorganize_incremental(
+                    parallel, workers=2, progress=database_reorganizer.ProgressReporter(events)
+                )
+        finally:
+            reorganizer.conn.close()
+
+        self.assertFalse(parallel_stats['full_rebuild'])
+        self.assertEqual(parallel_stats, serial_stats)
+        self.assertEqual((parallel_stats['new_scripts'], parallel_stats['changed_scripts'],
+                          parallel_stats['deleted_scripts']), (1, 1, 2))
+        for table in REORGANIZED_TABLES:
+            with self.subTest(table=table):
+                self.assertEqual(table_rows(parallel, table), table_rows(serial, table))
+
+        records = [json.loads(line) for line in events.getvalue().splitlines()]
+        self.assertEqual(records[-1]['event'], 'done')
+        self.assertEqual(records[-1]['rows'], parallel_stats['total_processed'])
+
+        # Planner statistics count the scripts after the update
+        conn = sqlite3.connect(parallel)
+        try:
+            scripts = conn.execute("SELECT COUNT(*) FROM scripts").fetchone()[0]
+            stat = conn.execute("SELECT stat FROM sqlite_stat1 WHERE idx = 'idx_scripts_management_key'").fetchone()[0]
+        finally:
+            conn.close()
+        self.assertEqual(int(stat.split()[0]), scripts)
+
+
+if __name__ == '__main__':
+    unittest.main()
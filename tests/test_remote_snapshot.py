@@ -0,0 +1,157 @@
+"""RemoteDatabaseCache: searching a snapshot served with HTTP Range requests"""
+
+import gc
+import os
+import threading
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tests import CorpusFixture
+
+import search
+
+
+class RangeRequestHandler(BaseHTTPRequestHandler):
+    """Serves server.file_path, honouring Range and If-Range like a static file host"""
+
+    def do_GET(self):
+        with open(self.server.file_path, 'rb') as f:
+            data = f.read()
+        etag = self.server.etag
+        range_header = self.headers.get('Range', '')
+        if range_header.startswith('bytes=') and self.headers.get('If-Range', etag) == etag:
+            first, _, last = range_header[len('bytes='):].partition('-')
+            first, last = int(first), min(int(last), len(data) - 1)
+            self.server.ranges.append((first, last))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {first}-{last}/{len(data)}')
+            data = data[first:last + 1]
+        else:
+            self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@unittest.skipIf(search.apsw is None, 'remote snapshots need the apsw package')
+class RemoteSnapshotTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(3000, seed=3, prefix='remote-test-')
+        cls.path = cls.corpus.source
+
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), RangeRequestHandler)
+        cls.server.daemon_threads = True
+        cls.server.file_path = cls.path
+        cls.server.etag = '"v1"'
+        cls.server.ranges = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f'http://127.0.0.1:{cls.server.server_address[1]}/corpus.db'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.corpus.close()
+
+    def test_search_matches_local_snapshot(self):
+        cache = search.RemoteDatabaseCache(self.url, 3600, block_size=4096, cache_size=1024 * 1024)
+        remote = cache.get_connection()
+        local = search.open_snapshot(self.path)
+        try:
+            for keyword, character_filter in (('テロップ', ''), ('SE', 'サン'), ('zzzz', '')):
+                for sort_order in search.SORT_KEYS:
+                    with self.subTest(keyword=keyword, character_filter=character_filter, sort_order=sort_order):
+                        self.assertEqual(
+                            search.search_scripts(remote, keyword, character_filter, sort_order, 10),
+                            search.search_scripts(local, keyword, character_filter, sort_order, 10)
+                        )
+        finally:
+            local.close()
+        self.assertTrue(self.server.ranges)
+        self.assertGreater(remote.page_store.requests, 0)
+
+    def test_old_snapshot_vfs_is_released(self):
+        apsw = search.apsw
+        cache = search.RemoteDatabaseCache(self.url, 0, block_size=4096, cache_size=1024 * 1024)
+        old = cache.get_connection()
+        old_vfs = old.vfs_name
+        self.server.etag = '"v2"'
+        self.addCleanup(setattr, self.server, 'etag', '"v1"')
+        new = cache.get_connection()
+        self.assertNotEqual(new.vfs_name, old_vfs)
+
+        # A request still holding the old connection keeps its VFS alive
+        self.assertIn(old_vfs, apsw.vfs_names())
+        self.assertEqual(len(cache.vfs), 2)
+
+        # Once it is dropped, the next request releases the VFS and its page store
+        del old
+        gc.collect()
+        self.assertIs(cache.get_connection(), new)
+        self.assertNotIn(old_vfs, apsw.vfs_names())
+        self.assertEqual(list(cache.vfs), [new.vfs_name])
+
+    def test_pooled_readers_observe_deadline(self):
+        from search_async_server import Lease
+        from search_server import ConnectionPool
+
+        cache = search.RemoteDatabaseCache(self.url, 3600, block_size=4096, cache_size=1024 * 1024)
+        pool = ConnectionPool(cache, 2)
+        self.addCleanup(pool.close)
+        first, second = pool.acquire(), pool.acquire()
+        self.assertIsNot(first, second)
+        self.assertIsNot(first, cache.get_connection())
+        self.assertIs(first.page_store, cache.get_connection().page_store)
+        self.assertEqual(search.search_scripts(first, 'SE', 'サン', 'broadcast_date_desc', 10),
+                         search.search_scripts(second, 'SE', 'サン', 'broadcast_date_desc', 10))
+        pool.release(first)
+        pool.release(second)
+
+        body = {'keyword': 'zzzz'}
+        params = search.parse_search_params(body, search.MAX_LIMIT)
+        for budget, success in ((0, False), (60, True)):
+            lease = Lease(pool, budget)
+            try:
+                with mock.patch.object(search, 'result_cache', search.ResultCache(0, 0)):
+                    response = search.search_response(body, params, lease.get_connection, search.RequestTimer())
+            finally:
+                lease.release()
+            with self.subTest(budget=budget):
+                self.assertEqual(response['success'], success)
+                if not success:
+                    self.assertEqual(response['error'], search.QUERY_TIMEOUT_MESSAGE)
+
+    def test_only_the_main_database_is_remote(self):
+        store = search.RangePageStore(self.url, self.server.etag, os.path.getsize(self.path), 4096, 4096)
+        vfs = search.RangeVFS('search-range-test', store)
+        apsw = search.apsw
+        main = vfs.xOpen('snapshot.db', [apsw.SQLITE_OPEN_MAIN_DB | apsw.SQLITE_OPEN_READONLY, 0])
+        self.assertIsInstance(main, search.RangeFile)
+        self.assertEqual(main.xRead(16, 0), b'SQLite format 3\0')
+
+        for flag in (apsw.SQLITE_OPEN_MAIN_JOURNAL, apsw.SQLITE_OPEN_WAL):
+            with self.assertRaises(apsw.CantOpenError):
+                vfs.xOpen('snapshot.db-journal', [flag | apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_CREATE, 0])
+        self.assertFalse(vfs.xAccess('snapshot.db-wal', 0))
+
+        temp = vfs.xOpen(None, [
+            apsw.SQLITE_OPEN_TEMP_DB | apsw.SQLITE_OPEN_READWRITE | apsw.SQLITE_OPEN_CREATE
+            | apsw.SQLITE_OPEN_DELETEONCLOSE | apsw.SQLITE_OPEN_EXCLUSIVE, 0
+        ])
+        try:
+            temp.xWrite(b'spill', 0)
+            self.assertEqual(temp.xRead(5, 0), b'spill')
+        finally:
+            temp.xClose()
+            vfs.unregister()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""An interrupted reorganization resumes from its checkpoint and writes the same database as a clean run"""
+
+import io
+import json
+import os
+import sqlite3
+import unittest
+from unittest import mock
+
+import database_reorganizer
+from tests import REORGANIZED_TABLES, CorpusFixture, table_rows
+
+ROWS = 3000
+
+
+class Interrupted(Exception):
+    pass
+
+
+class ReorganizeResumeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(ROWS, seed=12, prefix='resume-test-')
+        cls.reorganize('clean.db', 1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    @classmethod
+    def reorganize(cls, name, workers, progress=None):
+        with mock.patch.object(database_reorganizer, 'BATCH_ROWS', 200), \
+                mock.patch.object(database_reorganizer, 'CHECKPOINT_ROWS', 500):
+            return cls.corpus.reorganize(name, workers=workers, progress=progress)
+
+    def interrupt(self, name, workers, after_batches):
+        """Run a build whose writer raises on batch ``after_batches`` + 1"""
+        add = database_reorganizer.BulkWriter.add
+        calls = []
+
+        def failing_add(writer, inserts):
+            calls.append(1)
+            if len(calls) > after_batches:
+                raise Interrupted()
+            add(writer, inserts)
+
+        with mock.patch.object(database_reorganizer.BulkWriter, 'add', failing_add), \
+                self.assertRaises(Interrupted):
+            self.reorganize(name, workers)
+
+    def test_resume_matches_clean_build(self):
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                name = f'resumed-{workers}.db'
+                output = self.corpus.path(name)
+                self.interrupt(name, workers, after_batches=7)
+                self.assertFalse(os.path.exists(output))
+
+                conn = sqlite3.connect(output + '.build')
+                try:
+                    phase, stats = conn.execute("SELECT phase, stats FROM reorganize_checkpoint").fetchone()
+                finally:
+                    conn.close()
+                checkpointed = json.loads(stats)['total_processed']
+                self.assertEqual(phase, 'content')
+                self.assertTrue(0 < checkpointed < ROWS)
+
+                # Resumed in the same process, after the checkpoint
+                events = io.StringIO()
+                stats = self.reorganize(name, workers, database_reorganizer.ProgressReporter(events))
+                records = [json.loads(line) for line in events.getvalue().splitlines()]
+                self.assertEqual(records[0]['rows'], checkpointed)
+                self.assertEqual(records[-1]['run_rows'], ROWS - checkpointed)
+                self.assertEqual(stats['total_processed'], ROWS)
+                self.assertFalse(os.path.exists(output + '.build'))
+
+                for table in REORGANIZED_TABLES:
+                    self.assertEqual(table_rows(output, table), table_rows(self.corpus.path('clean.db'), table), table)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""ResultCache: LRU eviction, TTL, snapshot versions and key normalization"""
+
+import unittest
+from unittest import mock
+
+from tests import CorpusFixture
+
+import search
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = search.ResultCache(2, 60)
+        cache.get('a', 1)
+        cache.put('a', 1, 'A')
+        cache.put('b', 1, 'B')
+        self.assertEqual(cache.get('a', 1), 'A')
+        cache.put('c', 1, 'C')
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual((cache.get('a', 1), cache.get('c', 1)), ('A', 'C'))
+        self.assertEqual(cache.stats(), {'hits': 3, 'misses': 2, 'size': 2})
+
+    def test_entries_expire(self):
+        cache = search.ResultCache(10, 60)
+        with mock.patch.object(search.time, 'monotonic', return_value=1000.0):
+            cache.get('a', 1)
+            cache.put('a', 1, 'A')
+        with mock.patch.object(search.time, 'monotonic', return_value=1059.0):
+            self.assertEqual(cache.get('a', 1), 'A')
+        with mock.patch.object(search.time, 'monotonic', return_value=1060.0):
+            self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_new_snapshot_drops_entries(self):
+        cache = search.ResultCache(10, 60)
+        cache.get('a', 1)
+        cache.put('a', 1, 'A')
+        self.assertIsNone(cache.get('a', 2))
+        # A request still on the old snapshot cannot store into the new one
+        cache.put('b', 1, 'B')
+        self.assertIsNone(cache.get('b', 2))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_disabled_cache_stores_nothing(self):
+        cache = search.ResultCache(0, 60)
+        cache.get('a', 1)
+        cache.put('a', 1, 'A')
+        self.assertIsNone(cache.get('a', 1))
+
+    def test_keys_ignore_ascii_case_and_surrounding_space(self):
+        self.assertEqual(search.ResultCache.make_key(' SE ', 'Sun', 'management_id_asc', 10),
+                         search.ResultCache.make_key('se', 'sun', 'management_id_asc', 10))
+        for other in (search.ResultCache.make_key('ＳＥ', 'sun', 'management_id_asc', 10),
+                      search.ResultCache.make_key('se', 'sun', 'management_id_desc', 10),
+                      search.ResultCache.make_key('se', 'sun', 'management_id_asc', 20),
+                      search.ResultCache.make_key('se', 'sun', 'management_id_asc', 10, 'cursor')):
+            self.assertNotEqual(other, search.ResultCache.make_key('se', 'sun', 'management_id_asc', 10))
+
+
+class CachedSearchTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = CorpusFixture(2000, seed=15, prefix='result-cache-test-')
+        cls.cache = cls.corpus.cache()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.corpus.close()
+
+    def search(self, conn, **body):
+        return search.cached_search(conn, search.parse_search_params(body, search.MAX_LIMIT))
+
+    def test_repeated_searches_are_served_from_cache(self):
+        conn = self.cache.conn
+        with mock.patch.object(search, 'result_cache', search.ResultCache(10, 60)):
+            results, cursor, hit = self.search(conn, keyword='SE', limit=5)
+            self.assertFalse(hit)
+            self.assertEqual(len(results), 5)
+            # The same search, spelled differently
+            self.assertEqual(self.search(conn, keyword=' se', limit=5), (results, cursor, True))
+            self.assertFalse(self.search(conn, keyword='SE', limit=6)[2])
+
+            # A new snapshot is searched again
+            self.cache.load()
+            self.assertGreater(self.cache.conn.version, conn.version)
+            self.assertEqual(self.search(self.cache.conn, keyword='SE', limit=5), (results, cursor, False))
+
+
+if __name__ == '__main__':
+    unittest.main()